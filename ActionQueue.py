@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable
+
+from Logger import MyLogger
+
+
+class ActionQueue:
+    """
+    Runs the tray actions on worker threads, so the tray never waits for 'net use'.
+    An action that is already queued or running is not queued again - repeated clicks are dropped.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.logger = MyLogger("ActionQueue")
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Action")
+        self._lock = threading.Lock()
+        self._in_flight: dict[Hashable, Future] = {}
+
+    def submit(self, key: Hashable, action: Callable[[], str], on_done: Callable[[str], None]) -> bool:
+        """
+        :param key: identifies the action - ('mount', section, share), ('unmount', host)...
+        :param action: returns the notification msg
+        :param on_done: called with the notification msg when the action finishes
+        :return: False if the same action is already queued or running
+        """
+        with self._lock:
+            if key in self._in_flight:
+                self.logger.info("Action %s is already in progress - ignored", key)
+                return False
+            future = self._pool.submit(action)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda f: self._on_future_done(key, f, on_done))
+        return True
+
+    def _on_future_done(self, key: Hashable, future: Future, on_done: Callable[[str], None]) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if future.cancelled():
+            self.logger.info("Action %s cancelled", key)
+            return
+        error = future.exception()
+        if error is not None:
+            msg = f"Error while running {key}: {error}"
+            self.logger.error(msg)
+        else:
+            msg = future.result()
+        on_done(msg)
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._in_flight
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        Only actions that haven't started can be cancelled - a running 'net use' is left to finish.
+        :return: True if the action was cancelled
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+        return future is not None and future.cancel()
+
+    def cancel_all(self) -> int:
+        """
+        :return: number of cancelled actions
+        """
+        with self._lock:
+            futures = list(self._in_flight.values())
+        return sum(1 for future in futures if future.cancel())
+
+    def shutdown(self) -> None:
+        self.cancel_all()
+        self._pool.shutdown(wait=False)
@@ -2,123 +2,282 @@ import functools
 import os
 import subprocess
 import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
 
-from pystray import Icon as icon, Menu as menu, MenuItem as item
-import PIL.Image
-
+from ActionQueue import ActionQueue
+from CommandRunner import NetUseRunner
+from ConfigDiff import diff_sections
+from ConfigWatcher import ConfigWatcher
+from HostProber import HostProber
+from Reconciler import Reconciler
+from ShellRunner import PersistentShellRunner
 from SMB import SMB
+from Stats import STATS
+from StatusCache import StatusCache
 from Windows import Windows
 from Logger import MyLogger
 from Config import Config
+from Notifier import NotificationAggregator
+
+# pystray and PIL are imported when the tray is created - importing this module stays cheap
+if TYPE_CHECKING:
+    from pystray import Icon, Menu, MenuItem
+    from PIL.Image import Image
 
 
 class Tray:
-    def __init__(self):
+    # Run the 'net use' commands in long-lived shells instead of starting cmd.exe for each one
+    USE_PERSISTENT_SHELL = False
+    # Authenticate once per NAS (IPC$ session) - the shares are mounted without the password on the command line
+    USE_SESSIONS = False
+    WRITE_METRICS_FILE = False
+    # Seconds between two checks of the 'autoconnect = yes' shares
+    AUTOCONNECT_INTERVAL = 60
+    # Seconds a 'net use' can take before it's killed
+    COMMAND_TIMEOUT = 60
+    # Seconds between two refreshes of the mounted/not mounted state shown in the menu
+    STATUS_REFRESH_INTERVAL = 15
+    # Seconds the results of the actions are collected for before they are shown in one notification
+    NOTIFICATION_WINDOW = 1.0
+    # Seconds between two notifications of action results
+    NOTIFICATION_MIN_INTERVAL = 5.0
+
+    def __init__(self, config_file_name: str | None = None):
+        """
+        :param config_file_name: App.conf next to this file if not set
+        """
+        from pystray import Icon as icon
+
         self.APP_NAME = "AttachMyNAS"
 
         self.root_folder = os.path.dirname(os.path.abspath(__file__))
 
         self.script_file_path = os.path.abspath(__file__)  # path to App.py
         self.logo_path = os.path.join(self.root_folder, "logo.png")
-        self.logo = PIL.Image.open(self.logo_path)
+        # Decoded by run_app() - nothing needs the picture before the icon is shown
+        self.logo: 'Image | None' = None
         self.activate_script_path = os.path.join(self.root_folder, "venv", "Scripts", "activate.bat")
 
-        self.config_file_name = os.path.join(self.root_folder, "App.conf")
+        self.config_file_name = config_file_name or os.path.join(self.root_folder, "App.conf")
 
         self.logger = MyLogger("Tray")
         self.log_init()
+        # Optional JSON-lines dump of the timings - written by 'Stats > Write to log' and when the app closes
+        STATS.metrics_file = os.path.join(self.root_folder, "metrics.jsonl") if self.WRITE_METRICS_FILE else None
 
+        # The only Config of the app - SMB and the reconciler see its reloads
         self.my_config = Config(self.config_file_name)
-        self.my_smb = SMB(self.config_file_name)
+        self.host_prober = HostProber()
+        runner = (PersistentShellRunner(timeout=self.COMMAND_TIMEOUT) if self.USE_PERSISTENT_SHELL
+                  else NetUseRunner(timeout=self.COMMAND_TIMEOUT))
+        self.my_smb = SMB(self.my_config, runner=runner, host_prober=self.host_prober, use_sessions=self.USE_SESSIONS)
         self.my_win = Windows(self.config_file_name)
 
-        self.icon = icon(self.APP_NAME, self.logo, menu=self.menu, title=self.APP_NAME)
+        # Remounts the dropped shares of the 'autoconnect' sections - it does nothing if there are none
+        self.reconciler = Reconciler(self.my_smb, interval=self.AUTOCONNECT_INTERVAL)
+
+        # Mount/unmount clicks run here - the tray thread never waits for 'net use'
+        self.action_queue = ActionQueue()
+        # What the menu shows as mounted - opening the menu only reads it
+        self.status_cache = StatusCache(self.my_smb, interval=self.STATUS_REFRESH_INTERVAL,
+                                        on_change=lambda: self.icon.update_menu())
+
+        # The results of the actions are shown in batches - one line per section/host, the details go to the log
+        self.notifier = NotificationAggregator(
+            lambda msg: self.icon.notify(msg), window=self.NOTIFICATION_WINDOW,
+            min_interval=self.NOTIFICATION_MIN_INTERVAL,
+            max_characters=self.my_smb.MAX_NUMBER_OF_CHARACTERS_IN_TRAY_NOTIFICATION)
+
+        # Any change of the config file or an included file (from the app or not) reloads it
+        self.config_watcher = ConfigWatcher(self.config_file_name, self.on_config_file_changed,
+                                            get_file_paths=self.my_config.get_watched_paths)
+
+        # Section submenus are built once and rebuilt only when their section changes in the config file
+        self.section_menu_items: dict[str, 'MenuItem'] = {}
+
+        self.icon: 'Icon' = icon(self.APP_NAME, menu=self.menu, title=self.APP_NAME)
 
     @property
-    def menu(self) -> menu:
+    def menu(self) -> 'Menu':
+        from pystray import Menu as menu
+
+        # The items are generated again on every icon.update_menu() - so a reload doesn't need a new icon
+        return menu(self.get_menu_items)
+
+    def get_menu_items(self) -> tuple:
+        from pystray import Menu as menu, MenuItem as item
+
         # TODO: menu won't show if no shares in conf file. Print warning when app starts if none.
         # Create the part of the menu that will have all sections
         sections_menu_items = self.get_sections_menu_items()
 
-        return menu(
-            item("Unmount All [PC]", lambda icon, item: icon.notify(
-                self.my_smb.unmount_every_connection_not_only_the_ones_in_conf()), enabled=True),
+        return (
+            item("Unmount All [PC]", lambda icon, item: self.submit_action(
+                ('unmount_every_connection',), self.my_smb.unmount_every_connection_not_only_the_ones_in_conf),
+                 enabled=True),
             item("Unmount All [config]",
-                 lambda icon, item: icon.notify(self.my_smb.unmount_all_smb()), enabled=True),
+                 lambda icon, item: self.submit_action(('unmount_all',), self.my_smb.unmount_all_smb), enabled=True),
+            item("Mount All [config]",
+                 lambda icon, item: self.submit_action(('mount_all_sections',), self.my_smb.mount_all_sections),
+                 enabled=True),
             menu.SEPARATOR,
             *sections_menu_items,
             menu.SEPARATOR,
             item("Other", menu(
-                item("Edit config file", self.edit_config_file_and_reload)
+                item("Edit config file", self.edit_config_file_and_reload),
+                item("Cancel pending actions", self.cancel_pending_actions),
+                item("Stats", menu(self.get_stats_menu_items))
             )),
             menu.SEPARATOR,
             item("Restart", self.restart_app),
             item("Exit", self.close_app)
         )
 
-    def get_sections_menu_items(self) -> list[item]:
-        all_section_names = self.my_config.get_all_section_names()
+    def get_sections_menu_items(self) -> list['MenuItem']:
         sections_menu_items = []
-        for section_name in all_section_names:
-            num_shares_for_section = len(self.my_config.get_shares_for_section(section_name))
-
-            # Add each share to the list
-            inner_menu_for_each_section = [self.create_menu_item(section_name, i) for i in
-                                           range(num_shares_for_section)]
-
-            inner_menu_for_each_section.insert(
-                0, item(f"Mount All - {section_name}", functools.partial(self.get_mount_all_info, section_name),
-                        enabled=self.my_config.is_data_entered_for_section(section_name)))
-            inner_menu_for_each_section.insert(1, menu.SEPARATOR)
-
-            inner_menu_for_each_section.insert(
-                0, item("Get info", functools.partial(self.get_info_action, section_name), enabled=True))
-            inner_menu_for_each_section.insert(1, menu.SEPARATOR)
-
-            inner_menu_for_each_section.append(menu.SEPARATOR)
-            inner_menu_for_each_section.append(
-                item(f"Unmount All - {self.my_config.get_ip_for_section(section_name)}",
-                     functools.partial(self.get_unmount_all_info, section_name),
-                     enabled=self.my_config.is_ip_entered_for_section(section_name)))
-
-            section_menu = menu(*inner_menu_for_each_section)
-            sections_menu_items.append(item(section_name, section_menu))
+        for section_name in self.my_config.get_all_section_names():
+            if section_name not in self.section_menu_items:
+                self.section_menu_items[section_name] = self.create_section_menu_item(section_name)
+            sections_menu_items.append(self.section_menu_items[section_name])
         return sections_menu_items
 
+    def create_section_menu_item(self, section_name: str) -> 'MenuItem':
+        from pystray import Menu as menu, MenuItem as item
+
+        num_shares_for_section = len(self.my_config.get_shares_for_section(section_name))
+
+        # Add each share to the list
+        inner_menu_for_each_section = [self.create_menu_item(section_name, i) for i in
+                                       range(num_shares_for_section)]
+
+        inner_menu_for_each_section.insert(
+            0, item(f"Mount All - {section_name}", functools.partial(self.get_mount_all_info, section_name),
+                    enabled=self.my_config.is_data_entered_for_section(section_name)))
+        inner_menu_for_each_section.insert(1, menu.SEPARATOR)
+
+        inner_menu_for_each_section.insert(
+            0, item("Get info", functools.partial(self.get_info_action, section_name), enabled=True))
+        inner_menu_for_each_section.insert(1, menu.SEPARATOR)
+
+        inner_menu_for_each_section.append(menu.SEPARATOR)
+        inner_menu_for_each_section.append(
+            item(f"Unmount All - {self.my_config.get_ip_for_section(section_name)}",
+                 functools.partial(self.get_unmount_all_info, section_name),
+                 enabled=self.my_config.is_ip_entered_for_section(section_name)))
+
+        section_menu = menu(*inner_menu_for_each_section)
+        return item(section_name, section_menu)
+
+    def submit_action(self, key: tuple, action: Callable[..., str], *args) -> None:
+        """
+        Queues the action - the result is shown as a notification when it's done.
+        Clicking again while the same action is queued or running does nothing.
+        """
+        self.action_queue.submit(key, functools.partial(action, *args),
+                                 functools.partial(self.on_action_done, self.get_notification_group(key)))
+
+    @staticmethod
+    def get_notification_group(key: tuple) -> str:
+        """ ('mount', section, share) -> section, ('unmount_host', ip) -> ip, ('unmount_all',) -> 'unmount_all' """
+        return str(key[1]) if len(key) > 1 and key[0] != 'remount' else key[0]
+
+    def on_action_done(self, group: str, msg: str) -> None:
+        self.notifier.add(group, msg)
+        self.status_cache.request_refresh()
+
+    def get_stats_menu_items(self) -> tuple:
+        """
+        p50/p95 per host and per operation (a submenu each) and the counters - one disabled item per value.
+        Generated again with the rest of the menu, so it's as fresh as the mounted state.
+        """
+        from pystray import Menu as menu, MenuItem as item
+
+        items = []
+        for title, by_host in (("Hosts", True), ("Operations", False)):
+            percentiles = STATS.get_percentiles(by_host)
+            if percentiles:
+                items.append(item(title, menu(*(
+                    item(f"{name}: n={count} p50={p50 * 1000:.0f}ms p95={p95 * 1000:.0f}ms", None, enabled=False)
+                    for name, (count, p50, p95) in sorted(percentiles.items())))))
+        items += [item(f"{name}: {value}", None, enabled=False)
+                  for name, value in sorted(STATS.get_counters().items())]
+        if not items:
+            items.append(item("No stats yet.", None, enabled=False))
+        return (*items, menu.SEPARATOR, item("Write to log", self.show_stats))
+
+    def show_stats(self) -> None:
+        """ The whole summary goes to the log (and the samples to the metrics file if it's enabled) """
+        summary = STATS.get_summary()
+        self.logger.info("Stats:\n%s", summary)
+        STATS.dump()
+        self.notifier.add('stats', "Stats written to the log.")
+
+    def cancel_pending_actions(self) -> None:
+        cancelled = self.action_queue.cancel_all()
+        self.notifier.add('cancel', f"Cancelled {cancelled} pending actions.")
+
     def get_unmount_all_info(self, section_name: str, icon, item) -> None:
         current_section_ip = self.my_config.get_ip_for_section(section_name)
-        icon.notify(self.my_smb.unmount_all_smb_for_ip(current_section_ip))
+        self.submit_action(('unmount_host', current_section_ip), self.my_smb.unmount_all_smb_for_ip,
+                           current_section_ip)
 
     def get_mount_all_info(self, section_name: str, icon, item) -> None:
-        icon.notify(self.my_smb.mount_all_smb(section_name))
+        self.submit_action(('mount_all', section_name), self.my_smb.mount_all_smb, section_name)
 
     def get_info_action(self, section_name: str, icon, item) -> None:
-        icon.notify(self.my_config.get_all_data_for_section_for_notification(section_name))
+        info = self.my_config.get_all_data_for_section_for_notification(section_name)
+        ip = self.my_config.get_ip_for_section(section_name)
+        if ip:
+            info += f"Circuit: {self.my_smb.circuit_breaker.get_description(ip)}\n"
+        self.notifier.add(section_name, info)
 
     # Helper function to create menu item
-    def create_menu_item(self, section_name: str, position: int) -> item:
+    def create_menu_item(self, section_name: str, position: int) -> 'MenuItem':
+        from pystray import MenuItem as item
+
         share_name = self.my_config.get_shares_for_section(section_name)[position]
+        ip = self.my_config.get_ip_for_section(section_name)
         preferred_letter = self.my_smb.get_preferred_letter_for_section_if_one(section_name, position)
-        return item(f"Mount {share_name} [{preferred_letter}]",
+        # The text and the check mark are read from the status cache every time the menu is shown
+        return item(functools.partial(self.get_share_text, ip, share_name, preferred_letter),
                     functools.partial(self.notify_mount, section_name, position),
+                    checked=lambda item: self.status_cache.is_mounted(ip, share_name),
                     enabled=self.my_config.is_data_entered_for_section(section_name))
 
+    def get_share_text(self, ip: str, share_name: str, preferred_letter: str | None, item) -> str:
+        """ 'Mount Movies [M]' - or 'Mount Movies [M] - at Z:' when it's mounted (at another letter) """
+        text = f"Mount {share_name} [{preferred_letter}]"
+        letter = self.status_cache.get_letter(ip, share_name)
+        if letter is None:
+            return text
+        return f"{text} - at {letter}:" if letter.strip() else f"{text} - connected"
+
     # Helper function to notify about mount
     def notify_mount(self, section_name: str, position: int, icon, item) -> None:
-        icon.notify(self.my_smb.mount_smb_section(section_name, position))
+        share_name = self.my_config.get_shares_for_section(section_name)[position]
+        self.submit_action(('mount', section_name, share_name), self.my_smb.mount_smb_section, section_name, position)
 
     def log_init(self) -> None:
         self.logger.info("*" * 80)
-        self.logger.info(f"App [{self.APP_NAME}] starting:")
-        self.logger.info(f"root_folder: {self.root_folder}")
-        self.logger.info(f"script_file_path: {self.script_file_path}")
-        self.logger.info(f"config_file_name: {self.config_file_name}")
-        self.logger.info(f"activate_script_path: {self.activate_script_path}")
-        self.logger.info(f"logo file: {self.logo_path}")
+        self.logger.info("App [%s] starting:", self.APP_NAME)
+        self.logger.info("root_folder: %s", self.root_folder)
+        self.logger.info("script_file_path: %s", self.script_file_path)
+        self.logger.info("config_file_name: %s", self.config_file_name)
+        self.logger.info("activate_script_path: %s", self.activate_script_path)
+        self.logger.info("logo file: %s", self.logo_path)
         self.logger.info("*" * 80)
 
     def close_app(self) -> None:
         self.logger.info("Closing the app")
+        self.config_watcher.stop()
+        self.status_cache.stop()
+        self.reconciler.stop()
+        self.action_queue.shutdown()
+        self.notifier.close()
+        self.my_smb.runner.close()
+        STATS.dump()
         self.icon.stop()
 
     def edit_config_file_and_reload(self) -> None:
@@ -126,13 +285,54 @@ class Tray:
         Will enable or disable most buttons on the interface depending on the changes made.
         Unmount all for each section will be enabled if there's an IP there.
         Mount options require ip, user, pw and at least 1 share.
+        The editor is not waited for - the config watcher reloads the config when the file is saved.
+        """
+        self.my_win.edit_config_file()
+
+    def on_config_file_changed(self, paths: list[str]) -> None:
+        self.reload_config()
+
+    def reload_config(self) -> None:
+        """
+        Reloads the config file in place - only the submenus of the sections that changed are rebuilt.
+        The connected shares whose host, credentials or letter changed are mounted again - nothing else is touched.
         """
-        if self.my_win.is_edit_config_file():
-            self.restart_app()
+        start = time.perf_counter()
+        old_sections = self.my_config.sections
+        added, removed, changed = self.my_config.reload()
+        changes = diff_sections(old_sections, self.my_config.sections)
+        for change in changes:
+            self.logger.info("Config change: %s", change.describe())
+        to_remount = [change for change in changes if change.may_need_remount]
+        if to_remount:
+            self.submit_action(('remount', *(change.section for change in to_remount)),
+                               self.my_smb.remount_changed_shares, to_remount)
+
+        for section_name in removed + changed:
+            self.section_menu_items.pop(section_name, None)
+        # The missing submenus (added + changed) are created by get_sections_menu_items()
+        self.icon.update_menu()
+        self.logger.info("Reload took %.1f ms. Rebuilt %s and removed %s section menus",
+                         (time.perf_counter() - start) * 1000, len(added) + len(changed), len(removed))
 
     def restart_app(self) -> None:
         self.close_app()
         subprocess.Popen([sys.executable] + sys.argv, creationflags=subprocess.CREATE_NO_WINDOW)
 
+    def load_logo(self) -> 'Image':
+        import PIL.Image
+
+        if self.logo is None:
+            self.logo = PIL.Image.open(self.logo_path)
+            self.logo.load()
+        return self.logo
+
     def run_app(self) -> None:
+        self.config_watcher.start()
+        # Warm up the reachability cache, so the first click on an offline NAS fails fast
+        threading.Thread(target=self.host_prober.probe_all, args=(self.my_config.get_all_sections_ip(),),
+                         daemon=True).start()
+        self.reconciler.start()
+        self.status_cache.start()
+        self.icon.icon = self.load_logo()
         self.icon.run()
@@ -0,0 +1,380 @@
+"""
+Measures the SMB hot paths against FakeNetUseRunner, so the numbers are reproducible on any OS.
+    python Benchmark.py
+    python Benchmark.py scenarios     # only the end-to-end scenarios
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from CommandRunner import CommandRunner, NetUseRunner
+from Config import Config
+from FakeNetUse import FakeNetUseRunner
+from NetUseParser import parse_net_use
+from ShellRunner import PersistentShellRunner
+from SMB import SMB
+from Stats import STATS
+
+
+def write_config(folder: str, sections: int, shares_per_section: int, file_name: str = "App.conf") -> str:
+    lines = []
+    for section in range(sections):
+        shares = ', '.join(f"Share{share}" for share in range(shares_per_section))
+        lines += [f"[NAS-{section}]",
+                  f"ip = 10.0.{section // 250}.{section % 250 + 1}",
+                  f"username = user{section}",
+                  f"password = pw{section}",
+                  f"shares = {shares}",
+                  ""]
+    config_file_name = os.path.join(folder, file_name)
+    with open(config_file_name, 'w') as file:
+        file.write('\n'.join(lines))
+    return config_file_name
+
+
+def print_result(name: str, seconds: float, spawns: int, result: str) -> None:
+    print(f"{name:<40} {seconds * 1000:>10.1f} ms {spawns:>6} spawns   {result[:60]!r}")
+
+
+def bench_mount_unmount(shares: int, latency: float, max_workers: int) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        config_file_name = write_config(folder, 1, shares)
+        runner = FakeNetUseRunner(latency=latency)
+        smb = SMB(Config(config_file_name), max_workers=max_workers, runner=runner)
+
+        start = time.perf_counter()
+        result = smb.mount_all_smb("NAS-0")
+        print_result(f"mount_all {shares} shares, {max_workers} workers", time.perf_counter() - start,
+                     runner.spawn_count, result)
+
+        spawns = runner.spawn_count
+        start = time.perf_counter()
+        result = smb.unmount_all_smb()
+        print_result(f"unmount_all {shares} shares, {max_workers} workers", time.perf_counter() - start,
+                     runner.spawn_count - spawns, result)
+
+
+def bench_shell_spawn_cost(runner: CommandRunner, name: str, commands: int) -> None:
+    start = time.perf_counter()
+    for i in range(commands):
+        runner.run(f"echo {i}")
+    print_result(f"{name}: {commands} commands", time.perf_counter() - start, runner.spawn_count, '')
+    runner.close()
+
+
+def bench_config(sections: int, shares_per_section: int) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        config_file_name = write_config(folder, sections, shares_per_section)
+        start = time.perf_counter()
+        config = Config(config_file_name, use_cache=False)
+        print_result(f"Config() {sections} sections", time.perf_counter() - start, 0, '')
+
+        # The same calls the tray makes while building the menu
+        start = time.perf_counter()
+        for section_name in config.get_all_section_names():
+            config.is_data_entered_for_section(section_name)
+            config.get_ip_for_section(section_name)
+            for position in range(len(config.get_shares_for_section(section_name))):
+                config.get_shares_for_section(section_name)[position]
+                config.get_preferred_letters_for_section(section_name)
+        print_result(f"menu getters {sections}x{shares_per_section} shares", time.perf_counter() - start, 0, '')
+
+
+def bench_includes(files: int, sections_per_file: int) -> None:
+    """ A config that only includes conf.d/*.conf - parsed cold, from the cache, and with one changed file """
+    with tempfile.TemporaryDirectory() as folder:
+        os.mkdir(os.path.join(folder, "conf.d"))
+        for i in range(files):
+            write_config(os.path.join(folder, "conf.d"), sections_per_file, 5, f"site{i}.conf")
+            # Unique section names across the files
+            with open(os.path.join(folder, "conf.d", f"site{i}.conf")) as file:
+                content = file.read().replace("[NAS-", f"[Site{i}-NAS-")
+            with open(os.path.join(folder, "conf.d", f"site{i}.conf"), 'w') as file:
+                file.write(content)
+        config_file_name = os.path.join(folder, "App.conf")
+        with open(config_file_name, 'w') as file:
+            file.write("[DEFAULT]\ninclude = conf.d/*.conf\n")
+
+        name = f"{files} files x {sections_per_file} sections"
+        start = time.perf_counter()
+        config = Config(config_file_name)
+        print_result(f"include {name}", time.perf_counter() - start, 0, f"{len(config.sections)} sections")
+        start = time.perf_counter()
+        Config(config_file_name)
+        print_result(f"include {name} (cached)", time.perf_counter() - start, 0, '')
+        with open(os.path.join(folder, "conf.d", "site0.conf"), 'a') as file:
+            file.write("\n[Site0-new]\nip = 10.9.9.9\n")
+        start = time.perf_counter()
+        config.reload()
+        print_result(f"reload {name}, 1 changed", time.perf_counter() - start, 0, '')
+
+
+def bench_reload_vs_restart(sections: int) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        config_file_name = write_config(folder, sections, 5)
+        config = Config(config_file_name)
+        with open(config_file_name, 'a') as file:
+            file.write("\n[NAS-new]\nip = 10.9.9.9\n")
+
+        start = time.perf_counter()
+        added, removed, changed = config.reload()
+        print_result(f"reload {sections} sections", time.perf_counter() - start, 0,
+                     f"added {added}, removed {removed}, changed {changed}")
+
+        # Lower bound of Tray.restart_app() - a new interpreter that only loads the config (no pystray/PIL)
+        root_folder = os.path.dirname(os.path.abspath(__file__))
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f"from Config import Config; from SMB import SMB; "
+                                              f"SMB(Config({config_file_name!r}))"],
+                       cwd=folder, env={**os.environ, 'PYTHONPATH': root_folder}, check=True)
+        print_result(f"restart {sections} sections (lower bound)", time.perf_counter() - start, 1, '')
+
+
+IMPORT_TIME_SCRIPT = """
+import importlib, json, sys, time
+result = {}
+for module in sys.argv[1:]:
+    start = time.perf_counter()
+    try:
+        importlib.import_module(module)
+        result[module] = time.perf_counter() - start
+    except ImportError:
+        result[module] = None
+print(json.dumps(result))
+"""
+
+
+def bench_startup(sections: int) -> None:
+    """
+    Cold start of the tray in 3 parts: importing the modules (in a new interpreter), parsing the config
+    (without and with the compiled cache) and building the menu - the last one only if pystray is installed.
+    """
+    root_folder = os.path.dirname(os.path.abspath(__file__))
+    # Each module is timed after the previous ones - App includes everything the tray needs except pystray/PIL
+    modules = ['Config', 'SMB', 'App', 'PIL.Image', 'pystray']
+    output = subprocess.run([sys.executable, '-c', IMPORT_TIME_SCRIPT, *modules], cwd=root_folder,
+                            capture_output=True, text=True, check=True).stdout
+    for module, seconds in json.loads(output).items():
+        if seconds is None:
+            print(f"{'import ' + module:<40} {'not installed':>13}")
+        else:
+            print_result(f"import {module}", seconds, 0, '')
+
+    with tempfile.TemporaryDirectory() as folder:
+        config_file_name = write_config(folder, sections, 5)
+        start = time.perf_counter()
+        Config(config_file_name)
+        print_result(f"parse {sections} sections (no cache)", time.perf_counter() - start, 0, '')
+        start = time.perf_counter()
+        Config(config_file_name)
+        print_result(f"parse {sections} sections (cached)", time.perf_counter() - start, 0, '')
+
+        try:
+            from App import Tray
+            tray = Tray(config_file_name)
+        except Exception as e:
+            print(f"{'menu build':<40} {'skipped':>13}   {f'no tray here: {e}'[:60]!r}")
+            return
+        start = time.perf_counter()
+        tray.get_menu_items()
+        print_result(f"menu build {sections} sections", time.perf_counter() - start, 0, '')
+        tray.my_smb.runner.close()
+
+
+SAMPLES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "net_use_samples")
+
+
+def get_sample_encoding(file_name: str) -> str:
+    """ The samples are stored as net.exe writes them - fr_basic.cp850.txt is in cp850, the others in UTF-8 """
+    parts = file_name.split('.')
+    return parts[-2] if len(parts) > 2 else 'utf-8'
+
+
+def check_parser_samples() -> None:
+    """ Every recorded 'net use' output must parse to what's in expected.json """
+    with open(os.path.join(SAMPLES_FOLDER, "expected.json"), encoding='utf-8') as file:
+        expected = json.load(file)
+    for file_name, expected_rows in expected.items():
+        with open(os.path.join(SAMPLES_FOLDER, file_name), 'rb') as file:
+            rows = [list(connection.as_tuple()) for connection in parse_net_use(file, get_sample_encoding(file_name))]
+        if rows != expected_rows:
+            raise AssertionError(f"{file_name}: expected {expected_rows}, got {rows}")
+    print(f"Parser: all {len(expected)} samples OK")
+
+
+def fuzz_parser(iterations: int, seed: int = 0) -> None:
+    """ Mangled samples (cut, duplicated and shuffled lines, random bytes) must never break the parser """
+    randomizer = random.Random(seed)
+    samples = []
+    for file_name in sorted(os.listdir(SAMPLES_FOLDER)):
+        if file_name.endswith('.txt'):
+            with open(os.path.join(SAMPLES_FOLDER, file_name), 'rb') as file:
+                samples.append(file.read())
+    for _ in range(iterations):
+        lines = randomizer.choice(samples).splitlines(keepends=True)
+        for _ in range(randomizer.randint(1, 5)):
+            position = randomizer.randrange(len(lines))
+            mutation = randomizer.randrange(4)
+            if mutation == 0:
+                lines[position] = lines[position][:randomizer.randrange(len(lines[position]) + 1)]
+            elif mutation == 1:
+                lines.insert(position, lines[position])
+            elif mutation == 2:
+                lines.insert(position, bytes(randomizer.randrange(256) for _ in range(randomizer.randrange(40))))
+            else:
+                randomizer.shuffle(lines)
+        list(parse_net_use(lines))
+    print(f"Parser: {iterations} fuzzed inputs OK")
+
+
+def bench_parser(connections: int) -> None:
+    runner = FakeNetUseRunner()
+    runner.connections = [{'status': 'OK', 'letter': '', 'host': f"nas-{i % 50}.example.local", 'share': f"Share{i}",
+                           'username': 'user'} for i in range(connections)]
+    output = runner.run('net use')[0]
+    lines = output.splitlines(keepends=True)
+    start = time.perf_counter()
+    rows = sum(1 for _ in parse_net_use(lines))
+    seconds = time.perf_counter() - start
+    print_result(f"parse {rows} rows ({len(output) / 1024:.0f} KB)", seconds, 0,
+                 f"{rows / seconds:.0f} rows/s, {len(output) / seconds / 1024 / 1024:.1f} MB/s")
+
+
+# sections, shares per section, latency, latency jitter, failure rate, recorded 'net use' the system starts from
+SCENARIOS = (
+    (1, 26, 0.02, 0.01, 0.0, None),
+    (50, 5, 0.02, 0.01, 0.05, "en_statuses.txt"),
+    (1000, 26, 0.005, 0.005, 0.1, "en_basic.txt"),
+)
+
+
+def print_distributions() -> None:
+    """ The latency of every operation recorded in STATS since the last reset """
+    for name, (count, mean, (p50, p90, p99)) in sorted(STATS.get_distributions((50, 90, 99)).items()):
+        print(f"    {name:<36} n={count:<6} mean={mean * 1000:>8.2f} ms  p50={p50 * 1000:>8.2f}  "
+              f"p90={p90 * 1000:>8.2f}  p99={p99 * 1000:>8.2f} ms")
+
+
+def bench_menu(config_file_name: str, smb: SMB) -> list[tuple[str, Callable[[], object]]]:
+    """
+    The menu steps of a scenario - none if the tray can't be created here (no pystray or no display).
+    The tray shows the state of the scenario's SMB.
+    """
+    try:
+        from App import Tray
+        tray = Tray(config_file_name)
+    except Exception as e:
+        print(f"    menu skipped - no tray here: {e}")
+        return []
+    tray.my_smb.runner.close()
+    tray.my_smb = tray.status_cache.smb = smb
+
+    def render() -> int:
+        # What pystray evaluates when the menu is opened - the text and the check mark of every share
+        texts = 0
+        for section_item in tray.get_sections_menu_items():
+            for share_item in section_item.submenu.items:
+                texts += len(share_item.text)
+                share_item.checked
+        return texts
+
+    return [("menu build (cold)", tray.get_sections_menu_items),
+            ("menu build (cached)", tray.get_sections_menu_items),
+            ("menu status refresh", tray.status_cache.refresh),
+            ("menu render", render)]
+
+
+def bench_scenario(sections: int, shares_per_section: int, latency: float, latency_jitter: float,
+                   failure_rate: float, recording: str | None, seed: int = 0) -> None:
+    """
+    Mount, list and unmount at scale against the simulated 'net use' - every step with its wall time and
+    spawns, then the peak memory (tracemalloc - it slows everything down by the same factor) and the latency
+    distribution of every operation.
+    """
+    print(f"{sections} sections x {shares_per_section} shares, latency {latency * 1000:.0f}"
+          f"+{latency_jitter * 1000:.0f} ms, failure rate {failure_rate:.0%}, recording {recording or '-'}")
+    STATS.reset()
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory() as folder:
+        config_file_name = write_config(folder, sections, shares_per_section)
+        runner = FakeNetUseRunner(latency=latency, latency_jitter=latency_jitter, failure_rate=failure_rate,
+                                  seed=seed)
+        if recording:
+            with open(os.path.join(SAMPLES_FOLDER, recording), 'rb') as file:
+                runner.load_recording(file.read(), get_sample_encoding(recording))
+        config = Config(config_file_name, use_cache=False)
+        smb = SMB(config, runner=runner)
+        first_section = config.get_all_section_names()[0]
+
+        def list_connections() -> str:
+            smb.mount_state.invalidate()
+            smb.mount_state.refresh()
+            return f"{len(smb.mount_state.get_connections())} connections"
+
+        steps = [("mount one share", lambda: smb.mount_smb_section(first_section, 0)),
+                 ("mount all sections", smb.mount_all_sections),
+                 ("list connections", list_connections),
+                 *bench_menu(config_file_name, smb),
+                 ("unmount one section", lambda: smb.unmount_all_smb_for_ip(config.get_ip_for_section(first_section))),
+                 ("unmount all", smb.unmount_all_smb)]
+        for name, step in steps:
+            spawns = runner.spawn_count
+            start = time.perf_counter()
+            result = step()
+            print_result(f"  {name}", time.perf_counter() - start, runner.spawn_count - spawns,
+                         result if isinstance(result, str) else '')
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    counters = STATS.get_counters()
+    print(f"  peak memory {peak / 1024 / 1024:.1f} MB, "
+          f"{', '.join(f'{name}: {value}' for name, value in sorted(counters.items()))}")
+    print_distributions()
+
+
+def run_scenarios() -> None:
+    for scenario in SCENARIOS:
+        bench_scenario(*scenario)
+
+
+def main() -> None:
+    if sys.argv[1:] == ['scenarios']:
+        run_scenarios()
+        return
+
+    latency = 0.02
+    print(f"Simulated 'net use' latency: {latency * 1000:.0f} ms")
+    for shares in (1, 10, 20):
+        for max_workers in (1, 8):
+            bench_mount_unmount(shares, latency, max_workers)
+
+    for sections in (100, 1000, 5000):
+        bench_config(sections, 26)
+
+    for sections in (10, 1000):
+        bench_reload_vs_restart(sections)
+
+    bench_includes(100, 10)
+
+    run_scenarios()
+
+    for sections in (10, 1000):
+        bench_startup(sections)
+
+    check_parser_samples()
+    fuzz_parser(2000)
+    for connections in (100, 10000):
+        bench_parser(connections)
+
+    print("Real shell - one process per command vs persistent shell workers")
+    bench_shell_spawn_cost(NetUseRunner(), "new shell per command", 200)
+    bench_shell_spawn_cost(PersistentShellRunner(pool_size=1), "persistent shell", 200)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from Logger import MyLogger
+
+T = TypeVar('T')
+
+
+def get_error_result(host: str, error: Exception) -> str:
+    """ The result of a job that raised - the jobs of SMB return notification msgs """
+    return f"Error on {host}: {error}"
+
+
+class BulkExecutor:
+    """
+    Runs the jobs of a bulk operation (Mount All, Unmount All...) concurrently.
+    Every job belongs to a host and no more than max_workers_per_host jobs run against the same host at once,
+    so a single NAS is not flooded with 'net use' calls.
+    A job that raises doesn't stop the others - its exception is turned into its result.
+    """
+
+    def __init__(self, max_workers: int = 8, max_workers_per_host: int = 4):
+        self.logger = MyLogger("BulkExecutor")
+        self.max_workers = max(1, max_workers)
+        self.max_workers_per_host = max(1, max_workers_per_host)
+
+        self._host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._host_semaphores_lock = threading.Lock()
+
+    def _get_host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._host_semaphores_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_workers_per_host)
+            return self._host_semaphores[host]
+
+    def _run_job(self, host: str, job: Callable[[], T], on_error: Callable[[str, Exception], T]) -> T:
+        with self._get_host_semaphore(host):
+            try:
+                return job()
+            except Exception as e:
+                self.logger.error("Job for %s failed: %s", host, e)
+                return on_error(host, e)
+
+    def run(self, jobs: list[tuple[str, Callable[[], T]]],
+            on_error: Callable[[str, Exception], T] = get_error_result) -> list[T]:
+        """
+        :param jobs: [(host, job), ...] - job is called without arguments
+        :param on_error: (host, exception) -> the result of a job that raised
+        :return: the results of the jobs - in the same order as the jobs
+        """
+        if not jobs:
+            return []
+        if len(jobs) == 1:
+            host, job = jobs[0]
+            return [self._run_job(host, job, on_error)]
+
+        workers = min(self.max_workers, len(jobs))
+        self.logger.debug("Running %s jobs on %s workers", len(jobs), workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self._run_job, host, job, on_error) for host, job in jobs]
+            return [future.result() for future in futures]
@@ -0,0 +1,115 @@
+import re
+import threading
+import time
+from typing import Callable
+
+from Logger import MyLogger
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# 'net use' errors that say the host (or the way to it) is the problem - not the share, the user or the letter:
+# 53 network path not found, 64 network name no longer available, 121 semaphore timeout,
+# 1231 network location cannot be reached, 1232 host unreachable
+HOST_ERRORS = frozenset((53, 64, 121, 1231, 1232))
+# The first number of the message - 'System error 53 has occurred.' / 'Systemfehler 53 aufgetreten.'
+ERROR_NUMBER_PATTERN = re.compile(rb'\b(\d+)\b')
+
+
+def is_host_error(stderr: bytes) -> bool:
+    match = ERROR_NUMBER_PATTERN.search(stderr)
+    return match is not None and int(match.group(1)) in HOST_ERRORS
+
+
+class HostCircuit:
+    __slots__ = ('state', 'failures', 'opened_at', 'is_trial_running')
+
+    def __init__(self):
+        self.state = CLOSED
+        # Failures in a row
+        self.failures = 0
+        self.opened_at = 0.0
+        self.is_trial_running = False
+
+
+class CircuitBreaker:
+    """
+    Stops sending commands to a host that keeps failing.
+    closed: commands go through. After failure_threshold failures in a row the circuit opens.
+    open: commands are refused until the cooldown ends - then one trial command is let through (half-open).
+    half-open: if the trial succeeds the circuit closes, if it fails it opens again for another cooldown.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.logger = MyLogger("CircuitBreaker")
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._circuits: dict[str, HostCircuit] = {}
+
+    def _get_circuit(self, host: str) -> HostCircuit:
+        return self._circuits.setdefault(host.lower(), HostCircuit())
+
+    def allow(self, host: str) -> bool:
+        """
+        :return: False if no command should be sent to the host now
+        """
+        with self._lock:
+            circuit = self._get_circuit(host)
+            if circuit.state == CLOSED:
+                return True
+            if circuit.state == OPEN and self.clock() - circuit.opened_at >= self.cooldown:
+                circuit.state = HALF_OPEN
+            if circuit.state == HALF_OPEN and not circuit.is_trial_running:
+                circuit.is_trial_running = True
+                self.logger.info("%s: cooldown over - trying one command", host)
+                return True
+            return False
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            circuit = self._get_circuit(host)
+            if circuit.state != CLOSED:
+                self.logger.info("%s: circuit closed", host)
+            circuit.state = CLOSED
+            circuit.failures = 0
+            circuit.is_trial_running = False
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            circuit = self._get_circuit(host)
+            circuit.failures += 1
+            circuit.is_trial_running = False
+            if circuit.state == HALF_OPEN or (circuit.state == CLOSED and circuit.failures >= self.failure_threshold):
+                circuit.state = OPEN
+                circuit.opened_at = self.clock()
+                self.logger.warning("%s: circuit open after %s failures - no commands for %s seconds", host,
+                                    circuit.failures, self.cooldown)
+
+    def is_open(self, host: str) -> bool:
+        """ True while the cooldown runs - doesn't start a trial like allow() does """
+        with self._lock:
+            circuit = self._circuits.get(host.lower())
+            return (circuit is not None and circuit.state == OPEN
+                    and self.clock() - circuit.opened_at < self.cooldown)
+
+    def get_state(self, host: str) -> str:
+        with self._lock:
+            circuit = self._circuits.get(host.lower())
+            return circuit.state if circuit is not None else CLOSED
+
+    def get_description(self, host: str) -> str:
+        """ For the notifications - 'closed', 'open (12 s left)'... """
+        with self._lock:
+            circuit = self._circuits.get(host.lower())
+            if circuit is None or circuit.state == CLOSED:
+                failures = f" ({circuit.failures} failures)" if circuit is not None and circuit.failures else ''
+                return f"{CLOSED}{failures}"
+            if circuit.state == OPEN:
+                left = max(0.0, self.cooldown - (self.clock() - circuit.opened_at))
+                return f"{OPEN} ({left:.0f} s left)"
+            return HALF_OPEN
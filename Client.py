@@ -0,0 +1,100 @@
+"""
+Talks to the daemon (main.py --daemon). Only the standard library is imported, so a call takes milliseconds:
+    python Client.py mount Home-NAS-RW/Movies
+    python Client.py mount Home-NAS-RW Work-NAS
+    python Client.py unmount Work-NAS
+    python Client.py unmount-letter M
+    python Client.py status
+    python Client.py reload
+From Python - the requests of one call are sent (and handled by the daemon) as one batch:
+    send([{'op': 'mount', 'section': 'Work-NAS'}, {'op': 'unmount', 'letter': 'M'}])
+"""
+import json
+import os
+import socket
+import sys
+
+DAEMON_HOST = '127.0.0.1'
+DAEMON_PORT = 47445
+# Written by the daemon when it starts - a request without it is refused
+TOKEN_FILE_NAME = 'daemon.token'
+
+
+def get_token_file_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), TOKEN_FILE_NAME)
+
+
+def send(requests: list[dict], port: int = DAEMON_PORT, timeout: float = 300.0) -> list[dict]:
+    """
+    :param requests: [{'op': 'mount' | 'unmount' | 'status' | 'reload', ...}, ...]
+    :return: one {'ok': bool, 'msg': str, ...} per request - in the same order
+    :raises ValueError: the reply is empty or isn't valid
+    """
+    with open(get_token_file_path()) as file:
+        token = file.read().strip()
+    with socket.create_connection((DAEMON_HOST, port), timeout=timeout) as connection:
+        connection.sendall(json.dumps({'token': token, 'requests': requests}).encode() + b'\n')
+        with connection.makefile('rb') as reader:
+            line = reader.readline()
+    if not line:
+        raise ValueError("The daemon closed the connection without a reply")
+    response = json.loads(line)
+    if not isinstance(response, dict):
+        raise ValueError(f"Invalid reply: {line[:100]!r}")
+    if 'error' in response:
+        raise ConnectionError(response['error'])
+    results = response.get('results')
+    if not isinstance(results, list) or len(results) != len(requests):
+        raise ValueError(f"Invalid reply: {line[:100]!r}")
+    return results
+
+
+def parse_args(args: list[str]) -> list[dict]:
+    """
+    mount SECTION[/SHARE]... | unmount [SECTION...] | unmount-letter LETTER... | status | reload
+    """
+    if not args:
+        raise ValueError(__doc__)
+    command, names = args[0], args[1:]
+    if command == 'mount' and names:
+        requests = []
+        for name in names:
+            section, _, share = name.partition('/')
+            requests.append({'op': 'mount', 'section': section, 'share': share} if share else
+                            {'op': 'mount', 'section': section})
+        return requests
+    if command == 'unmount':
+        return [{'op': 'unmount', 'section': name} for name in names] or [{'op': 'unmount'}]
+    if command == 'unmount-letter' and names:
+        return [{'op': 'unmount', 'letter': name.rstrip(':')} for name in names]
+    if command in ('status', 'reload') and not names:
+        return [{'op': command}]
+    raise ValueError(f"Unknown command: {' '.join(args)}")
+
+
+def main(args: list[str]) -> int:
+    try:
+        requests = parse_args(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    try:
+        results = send(requests)
+    except (OSError, ConnectionError) as e:
+        print(f"The daemon is not running or refused the request: {e}", file=sys.stderr)
+        return 3
+    except ValueError as e:
+        print(f"The request failed: {e}", file=sys.stderr)
+        return 1
+
+    for result in results:
+        if 'connections' in result:
+            for connection in result['connections']:
+                print(f"{connection['status'] or '-':<13}{connection['letter'] or '-':<3}"
+                      f"\\\\{connection['host']}\\{connection['share']}")
+        print(result['msg'])
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,156 @@
+import abc
+import ctypes
+import os
+import signal
+import subprocess
+import threading
+from typing import Iterator
+
+from Logger import MyLogger
+from Stats import STATS
+
+IS_WINDOWS = os.name == 'nt'
+# What run() returns on stderr when a command is killed - SMB tells timeouts apart by it
+TIMEOUT_MESSAGE_PREFIX = "The command timed out"
+
+
+def get_timeout_message(timeout: float) -> bytes:
+    return f"{TIMEOUT_MESSAGE_PREFIX} after {timeout:g} seconds and was killed.".encode()
+
+
+def is_timeout_message(stderr: bytes) -> bool:
+    return stderr.startswith(TIMEOUT_MESSAGE_PREFIX.encode())
+
+
+def get_console_encoding() -> str:
+    """ The code page console programs like net.exe write to a pipe in - the OEM one (cp850, cp437...) on Windows """
+    if IS_WINDOWS:
+        return f"cp{ctypes.windll.kernel32.GetOEMCP()}"
+    return 'utf-8'
+
+
+def get_new_process_group_kwargs() -> dict:
+    """ Popen arguments that put the process in its own group - so its whole tree can be killed """
+    if IS_WINDOWS:
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.CREATE_NO_WINDOW}
+    return {'start_new_session': True}
+
+
+def kill_process_tree(process: subprocess.Popen) -> None:
+    """ Kills the process and everything it started - the shell and the 'net.exe' under it """
+    try:
+        if IS_WINDOWS:
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, creationflags=subprocess.CREATE_NO_WINDOW, timeout=10)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (OSError, subprocess.SubprocessError):
+        pass
+    try:
+        process.kill()
+    except OSError:
+        pass
+
+
+class CommandRunner(abc.ABC):
+    """
+    Runs the 'net use' commands for SMB and tells which drive letters are used.
+    SMB only talks to the system through a runner, so the real one can be swapped with FakeNetUseRunner.
+    """
+    # What the output of the commands is decoded with
+    encoding = 'utf-8'
+
+    def __init__(self, timeout: float = 60.0):
+        """
+        :param timeout: deadline of every command in seconds - the command is killed when it's reached
+        """
+        self.logger = MyLogger("Runner")
+        self.timeout = timeout
+        self._spawn_count = 0
+        self._spawn_count_lock = threading.Lock()
+
+    @property
+    def spawn_count(self) -> int:
+        """ Number of commands (processes) started by this runner """
+        return self._spawn_count
+
+    def _count_spawn(self) -> None:
+        with self._spawn_count_lock:
+            self._spawn_count += 1
+        STATS.count('spawns')
+
+    def _count_timeout(self, command: str) -> None:
+        self.logger.error("'%s' didn't finish in %s seconds - killed", command.split(' /user:')[0], self.timeout)
+        STATS.count('timeouts')
+
+    @abc.abstractmethod
+    def run(self, command: str) -> tuple[bytes, bytes]:
+        """
+        :return: stdout, stderr - exactly as the process wrote them.
+                 If the deadline is reached: what was written so far, get_timeout_message()
+        """
+
+    def run_lines(self, command: str) -> Iterator[bytes]:
+        """
+        :return: the stdout lines of the command, as soon as they are available. stderr is ignored.
+        :raises TimeoutError: the deadline was reached - the lines so far might be incomplete
+        """
+        stdout, stderr = self.run(command)
+        if is_timeout_message(stderr):
+            raise TimeoutError(stderr.decode())
+        yield from stdout.splitlines(keepends=True)
+
+    @abc.abstractmethod
+    def get_used_drive_letters_bitmask(self) -> int:
+        """
+        :return: bitmask of all used drive letters - local + network drives. Bit 0 = A:
+        """
+
+    def close(self) -> None:
+        """ Releases whatever the runner keeps open """
+        pass
+
+
+class NetUseRunner(CommandRunner):
+    """ The real thing - every command is a new shell process. Windows only. """
+    encoding = get_console_encoding()
+
+    def run(self, command: str) -> tuple[bytes, bytes]:
+        self._count_spawn()
+        # No stdin - a 'net use' that asks for a password fails at once instead of waiting for the deadline
+        process = subprocess.Popen(command, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, **get_new_process_group_kwargs())
+        try:
+            return process.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_tree(process)
+            stdout, _ = process.communicate()
+            self._count_timeout(command)
+            return stdout, get_timeout_message(self.timeout)
+
+    def run_lines(self, command: str) -> Iterator[bytes]:
+        self._count_spawn()
+        process = subprocess.Popen(command, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, **get_new_process_group_kwargs())
+        killed = threading.Event()
+
+        def kill() -> None:
+            killed.set()
+            # Killing the tree closes stdout - the loop below ends
+            kill_process_tree(process)
+
+        timer = threading.Timer(self.timeout, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            yield from process.stdout
+        finally:
+            timer.cancel()
+            process.stdout.close()
+            process.wait()
+        if killed.is_set():
+            self._count_timeout(command)
+            raise TimeoutError(get_timeout_message(self.timeout).decode())
+
+    def get_used_drive_letters_bitmask(self) -> int:
+        return ctypes.windll.kernel32.GetLogicalDrives()
@@ -1,47 +1,296 @@
 import os
 import configparser
+import glob
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 from Logger import MyLogger
 
+# Bump when the content of the cache file changes
+CACHE_VERSION = 3
+# Never written to the cache file - read from the config file again when the cache is used
+SECRET_KEYS = ('password',)
+# 'key = value' or 'key: value' - split at the first delimiter, like configparser does
+OPTION_PATTERN = re.compile(r'(.*?)\s*[=:]\s*(.*)$')
+
+
+class SectionRecord:
+    """
+    One compiled section of the config file. Values are stripped from their comments and the lists are split once.
+    """
+    __slots__ = ('name', 'values', 'ip', 'username', 'password', 'shares', 'letters', 'autoconnect',
+                 'missing_fields', 'is_data_entered')
+
+    def __init__(self, name: str, raw_values: dict[str, str]):
+        self.name = name
+        self.values: dict[str, str] = {key: value.split('#')[0].strip() for key, value in raw_values.items()}
+        self.ip = self.values.get('ip', '')
+        self.username = self.values.get('username', '')
+        self.password = self.values.get('password', '')
+        self.shares = self._split(self.values.get('shares', ''))
+        self.letters = self._split(self.values.get('letters', ''))
+        # The reconciler keeps the shares of these sections mounted
+        self.autoconnect = self.values.get('autoconnect', '').lower() in ('yes', 'true', 'on', '1')
+
+        self.missing_fields = tuple(field for field, value in (('ip', self.ip), ('username', self.username),
+                                                               ('password', self.password), ('shares', self.shares))
+                                    if not value)
+        self.is_data_entered = not self.missing_fields
+
+    @staticmethod
+    def _split(value: str) -> tuple[str, ...]:
+        return tuple(i.strip() for i in value.split(',')) if value else ()
+
 
 class Config:
-    def __init__(self, config_file_name):
+    def __init__(self, config_file_name, use_cache: bool = True):
+        """
+        Other files can be merged into the config file with an 'include' in its [DEFAULT] section:
+            [DEFAULT]
+            include = conf.d/*.conf, sites/*.conf
+        The paths are relative to the config file. The [DEFAULT] values of a file apply only to its own sections.
+        :param use_cache: keep the parsed sections in '<config file>.cache' - a file is parsed again only
+                          when its modification time/size and its hash change. The passwords are left out of it.
+        """
         self.logger = MyLogger("Config")
 
         self.config_file = config_file_name
+        self.cache_file = f"{config_file_name}.cache" if use_cache else None
         if not os.path.isfile(self.config_file):
             msg = f"The file '{self.config_file}' does not exist."
             self.logger.critical(msg)
 
-        # Read values from the configuration file and assign them to instance variables
-        self.config = configparser.ConfigParser()
-        self.config.read(self.config_file)
+        # Everything below is computed once - the getters are plain lookups.
+        self.files: tuple[str, ...] = ()
+        self._include = ''
+        self.sections: dict[str, SectionRecord] = {}
+        self.sections_for_host: dict[str, tuple[str, ...]] = {}
+        self.shares_for_letter: dict[str, tuple[tuple[str, str], ...]] = {}
+        self._section_names: tuple[str, ...] = ()
+        self._all_sections_ip: tuple[str, ...] = ()
+        self._autoconnect_section_names: tuple[str, ...] = ()
+        # The parsed files of the last read - passwords included. A reload starts from them, not from the cache file
+        self._parsed_files: dict[str, dict] = {}
+        self._compile(self._read_sections())
+
+    def _read_sections(self) -> dict[str, dict[str, str]]:
+        """
+        Reads the config file and the included files - the ones that changed are parsed in parallel.
+        :return: {section name: {key: raw value}}
+        """
+        if self._parsed_files:
+            cached_files = self._parsed_files
+        else:
+            cache = self._load_cache()
+            cached_files: dict[str, dict] = cache['files'] if cache is not None else {}
+
+        main_file = self._read_file(self.config_file, cached_files.get(self.config_file))
+        if main_file is None:
+            self.files = ()
+            self._include = ''
+            self._parsed_files = {}
+            return {}
+        self._include = main_file['include']
+        included_paths = self._get_included_paths(self._include)
+        if len(included_paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(8, len(included_paths))) as pool:
+                included_files = list(pool.map(lambda path: self._read_file(path, cached_files.get(path)),
+                                               included_paths))
+        else:
+            included_files = [self._read_file(path, cached_files.get(path)) for path in included_paths]
+
+        files = {self.config_file: main_file}
+        files.update((path, file) for path, file in zip(included_paths, included_files) if file is not None)
+        self.files = tuple(files)
+        self._parsed_files = files
+        if self._get_versions(files) != self._get_versions(cached_files):
+            self._save_cache({'version': CACHE_VERSION, 'files': files})
+
+        sections: dict[str, dict[str, str]] = {}
+        for path, file in files.items():
+            for name, raw_values in file['sections'].items():
+                if name in sections:
+                    self.logger.warning("Section [%s] of %s is already defined - ignored", name, path)
+                else:
+                    sections[name] = raw_values
+        return sections
+
+    def _get_included_paths(self, include: str) -> list[str]:
+        folder = os.path.dirname(os.path.abspath(self.config_file))
+        # Compared by name - the config file might be gone for a moment (replaced by an editor), samefile() would raise
+        config_file = os.path.normcase(os.path.abspath(self.config_file))
+        paths = []
+        for pattern in SectionRecord._split(include.split('#')[0].strip()):
+            for path in sorted(glob.glob(os.path.join(folder, pattern))):
+                if path not in paths and os.path.normcase(os.path.abspath(path)) != config_file:
+                    paths.append(path)
+        return paths
+
+    def _read_file(self, path: str, cached: dict | None) -> dict | None:
+        """
+        :return: {'mtime_ns', 'size', 'sha256', 'include', 'sections'} - the cached one if the file hasn't changed,
+                 None if the file can't be read
+        """
+        try:
+            stat = os.stat(path)
+            if cached is not None and (cached['mtime_ns'], cached['size']) == (stat.st_mtime_ns, stat.st_size):
+                return self._add_secrets(path, cached)
+            with open(path, 'rb') as file:
+                digest = hashlib.sha256(file.read()).hexdigest()
+            if cached is not None and cached['sha256'] == digest:
+                # Touched but not changed
+                return self._add_secrets(path, {**cached, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size})
+        except OSError as e:
+            self.logger.error("Could not read %s: %s", path, e)
+            return None
+
+        config = configparser.ConfigParser()
+        config.read(path)
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest,
+                'include': config.defaults().get('include', ''),
+                'sections': {name: {key: value for key, value in config.items(name) if key != 'include'}
+                             for name in config.sections()}}
+
+    @staticmethod
+    def _get_versions(files: dict[str, dict]) -> dict[str, tuple[int, int, str]]:
+        return {path: (file['mtime_ns'], file['size'], file['sha256']) for path, file in files.items()}
+
+    @staticmethod
+    def _add_secrets(path: str, cached: dict) -> dict:
+        """
+        A file from the cache file has no passwords - they are read from the file itself, line by line.
+        That's far cheaper than parsing it again: the file hasn't changed, only these keys are needed.
+        :raises OSError: the file can't be read
+        """
+        if not cached.get('is_without_secrets'):
+            return cached
+        default_secrets: dict[str, str] = {}
+        secrets: dict[str, dict[str, str]] = {}
+        current = None
+        # The encoding configparser reads with
+        with open(path) as file:
+            for line in file:
+                stripped = line.strip()
+                if not stripped or stripped[0] in '#;' or line[0].isspace():
+                    continue
+                if stripped.startswith('[') and stripped.endswith(']'):
+                    name = stripped[1:-1]
+                    current = default_secrets if name == configparser.DEFAULTSECT else secrets.setdefault(name, {})
+                    continue
+                match = OPTION_PATTERN.match(stripped)
+                if match is not None and current is not None and match.group(1).lower() in SECRET_KEYS:
+                    current[match.group(1).lower()] = match.group(2)
+        sections = {name: {**values, **default_secrets, **secrets.get(name, {})}
+                    for name, values in cached['sections'].items()}
+        return {key: value for key, value in cached.items() if key != 'is_without_secrets'} | {'sections': sections}
+
+    def _load_cache(self) -> dict | None:
+        if self.cache_file is None:
+            return None
+        try:
+            with open(self.cache_file, encoding='utf-8') as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return cache if isinstance(cache, dict) and cache.get('version') == CACHE_VERSION else None
+
+    def _save_cache(self, cache: dict) -> None:
+        if self.cache_file is None:
+            return
+        # The passwords stay in the config files only
+        files = {path: {**file, 'is_without_secrets': True,
+                        'sections': {name: {key: value for key, value in values.items() if key not in SECRET_KEYS}
+                                     for name, values in file['sections'].items()}}
+                 for path, file in cache['files'].items()}
+        # The cache is only an optimization - a read-only folder just means no cache
+        try:
+            temp_file = f"{self.cache_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as file:
+                json.dump({**cache, 'files': files}, file)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            self.logger.warning("Could not write the config cache %s: %s", self.cache_file, e)
+
+    def _compile(self, raw_sections: dict[str, dict[str, str]]) -> None:
+        self.sections = {name: SectionRecord(name, raw_values) for name, raw_values in raw_sections.items()}
+        self._section_names = tuple(self.sections)
+        self._all_sections_ip = tuple(record.ip for record in self.sections.values() if record.ip)
+        self._autoconnect_section_names = tuple(record.name for record in self.sections.values()
+                                                if record.autoconnect and record.is_data_entered)
+
+        sections_for_host: dict[str, list[str]] = {}
+        shares_for_letter: dict[str, list[tuple[str, str]]] = {}
+        for record in self.sections.values():
+            if record.ip:
+                sections_for_host.setdefault(record.ip, []).append(record.name)
+            for share, letter in zip(record.shares, record.letters):
+                if letter:
+                    shares_for_letter.setdefault(letter.upper(), []).append((record.name, share))
+        self.sections_for_host = {ip: tuple(names) for ip, names in sections_for_host.items()}
+        self.shares_for_letter = {letter: tuple(shares) for letter, shares in shares_for_letter.items()}
+        self._log_letter_conflicts()
+
+    def _log_letter_conflicts(self) -> None:
+        """ One line for all the letters that more than one section prefers - only one of them can get it """
+        conflicts = [f"{letter}: {', '.join(self.get_sections_for_letter(letter))}"
+                     for letter in sorted(self.shares_for_letter) if len(self.get_sections_for_letter(letter)) > 1]
+        if conflicts:
+            self.logger.info("Preferred letters shared by sections - %s", '; '.join(conflicts))
+
+    def reload(self) -> tuple[list[str], list[str], list[str]]:
+        """
+        Re-reads the config file and compares the new sections with the old ones.
+        :return: added, removed, changed section names
+        """
+        old_sections = self.sections
+        self._compile(self._read_sections())
+
+        added = [name for name in self.sections if name not in old_sections]
+        removed = [name for name in old_sections if name not in self.sections]
+        changed = [name for name, record in self.sections.items()
+                   if name in old_sections and old_sections[name].values != record.values]
+        self.logger.info("Config reloaded. Added: %s, removed: %s, changed: %s", added, removed, changed)
+        return added, removed, changed
+
+    def get_section(self, section: str) -> SectionRecord:
+        try:
+            return self.sections[section]
+        except KeyError:
+            raise configparser.NoSectionError(section)
+
+    def get_all_section_names(self) -> tuple[str, ...]:
+        return self._section_names
+
+    def get_all_sections_ip(self) -> tuple[str, ...]:
+        return self._all_sections_ip
+
+    def get_autoconnect_section_names(self) -> tuple[str, ...]:
+        """ Sections with 'autoconnect = yes' and all the mount fields entered """
+        return self._autoconnect_section_names
+
+    def get_shares_for_letter(self, letter: str) -> tuple[tuple[str, str], ...]:
+        """
+        :return: ((section, share), ...) that have this preferred letter
+        """
+        return self.shares_for_letter.get(letter.upper(), ())
 
-    def get_all_section_names(self) -> list[str]:
-        return [i for i in self.config.sections()]
+    def get_sections_for_letter(self, letter: str) -> tuple[str, ...]:
+        """ The sections that have this preferred letter - more than one is a conflict """
+        return tuple(dict.fromkeys(section for section, _ in self.get_shares_for_letter(letter)))
 
-    def get_all_sections_ip(self) -> list[str]:
-        all_ips = [self.get_ip_for_section(i) for i in self.get_all_section_names()]
-        return [i for i in all_ips if i != '']
+    def get_watched_paths(self) -> tuple[str, ...]:
+        """
+        The config file and the files its include matches now - a file added to conf.d is matched without a reload
+        """
+        return self.config_file, *self._get_included_paths(self._include)
 
     def _get_is_data_entered_for_section_and_missing_fields(self, section_name: str) -> tuple[bool, list[str]]:
-        all_data_entered = True
-        error_msgs = []
-        if not (self.get_ip_for_section(section_name)):
-            all_data_entered = False
-            error_msgs.append("ip")
-        if not (self.get_username_for_section(section_name)):
-            all_data_entered = False
-            error_msgs.append("username")
-        if not (self.get_password_for_section(section_name)):
-            all_data_entered = False
-            error_msgs.append("password")
-        if len(self.get_shares_for_section(section_name)) == 0:
-            all_data_entered = False
-            error_msgs.append("shares")
-        return all_data_entered, error_msgs
+        record = self.get_section(section_name)
+        return record.is_data_entered, list(record.missing_fields)
 
     def is_data_entered_for_section(self, section_name: str) -> bool:
-        return self._get_is_data_entered_for_section_and_missing_fields(section_name)[0]
+        return self.get_section(section_name).is_data_entered
 
     def get_all_data_for_section(self, section: str) -> dict:
         ip = self.get_ip_for_section(section)
@@ -62,22 +311,20 @@ class Config:
         return result
 
     def get_username_for_section(self, section: str) -> str:
-        return self.get_value_for_section('username', section)
+        return self.get_section(section).username
 
     def get_password_for_section(self, section: str) -> str:
-        return self.get_value_for_section('password', section)
+        return self.get_section(section).password
 
-    def get_shares_for_section(self, section: str) -> list[str]:
-        shares_str = self.get_value_for_section('shares', section)
-        return [i.strip() for i in shares_str.split(",")] if shares_str else []
+    def get_shares_for_section(self, section: str) -> tuple[str, ...]:
+        return self.get_section(section).shares
 
-    def get_preferred_letters_for_section(self, section: str) -> list[str]:
-        """ If 'letters' row doesn't exist in the section - it will return [] """
-        letters_str = self.get_value_for_section('letters', section)
-        return [i.strip() for i in letters_str.split(',')] if letters_str else []
+    def get_preferred_letters_for_section(self, section: str) -> tuple[str, ...]:
+        """ If 'letters' row doesn't exist in the section - it will return () """
+        return self.get_section(section).letters
 
     def get_ip_for_section(self, section: str) -> str:
-        return self.get_value_for_section('ip', section)
+        return self.get_section(section).ip
 
     def is_ip_entered_for_section(self, section: str) -> bool:
         if self.get_ip_for_section(section):
@@ -85,15 +332,14 @@ class Config:
         return False
 
     def get_value_for_section(self, key_to_find: str, section: str) -> str:
-        section_items: dict = (dict(self.config.items(section)))
-        return section_items[key_to_find].split('#')[0].strip() if key_to_find in section_items else ''
+        return self.get_section(section).values.get(key_to_find, '')
 
     @staticmethod
-    def convert_list_to_str(list_to_convert: list) -> str:
+    def convert_list_to_str(list_to_convert: list | tuple) -> str:
         return f"[{', '.join(list_to_convert)}]"
 
     @staticmethod
-    def get_formatted_letter_share_for_notification(shares: list[str], letters: list[str]):
+    def get_formatted_letter_share_for_notification(shares: tuple[str, ...], letters: tuple[str, ...]):
         result = []
         for i, share in enumerate(shares):
             letter = letters[i] if i < len(letters) else 'None'
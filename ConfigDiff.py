@@ -0,0 +1,169 @@
+from Config import SectionRecord
+from NetUseParser import NetUseConnection
+
+ADDED = 'added'
+REMOVED = 'removed'
+HOST = 'host'
+CREDENTIALS = 'credentials'
+LETTERS = 'letters'
+SHARES = 'shares'
+# Any other key (comments are already stripped) - autoconnect...
+OTHER = 'other'
+# The changes that make a connected share wrong
+REMOUNT_KINDS = frozenset((HOST, CREDENTIALS, LETTERS))
+
+
+class SectionChange:
+    """ What changed in one section between two loads of the config """
+    __slots__ = ('section', 'kinds', 'old', 'new')
+
+    def __init__(self, section: str, kinds: tuple[str, ...], old: SectionRecord | None, new: SectionRecord | None):
+        self.section = section
+        self.kinds = kinds
+        self.old = old
+        self.new = new
+
+    @property
+    def may_need_remount(self) -> bool:
+        """ Only the connected shares of such a change are mounted again - see plan_remounts() """
+        return self.old is not None and self.new is not None and bool(REMOUNT_KINDS & set(self.kinds))
+
+    def describe(self) -> str:
+        if self.old is None or self.new is None:
+            return f"[{self.section}] {self.kinds[0]}"
+        details = []
+        for kind in self.kinds:
+            if kind == HOST:
+                details.append(f"host {self.old.ip} -> {self.new.ip}")
+            elif kind == CREDENTIALS:
+                details.append(f"credentials of {self.new.username or self.old.username}")
+            elif kind == LETTERS:
+                details.append(f"letters {_join(self.old.letters)} -> {_join(self.new.letters)}")
+            elif kind == SHARES:
+                old_shares, new_shares = _lower_set(self.old.shares), _lower_set(self.new.shares)
+                details.append(f"shares +{_join([s for s in self.new.shares if s.lower() not in old_shares])} "
+                               f"-{_join([s for s in self.old.shares if s.lower() not in new_shares])}")
+            else:
+                details.append(kind)
+        return f"[{self.section}] {', '.join(details)}"
+
+
+class Remount:
+    """ A connected share that has to be mounted again because of a config change """
+    __slots__ = ('section', 'share', 'old_host', 'letter', 'new_letter', 'reason')
+
+    def __init__(self, section: str, share: str, old_host: str, letter: str, new_letter: str | None, reason: str):
+        self.section = section
+        self.share = share
+        self.old_host = old_host
+        # Where it's mounted now
+        self.letter = letter
+        # The new preferred letter - None if the letter doesn't change
+        self.new_letter = new_letter
+        self.reason = reason
+
+
+def _join(values) -> str:
+    return f"[{', '.join(values)}]"
+
+
+def _lower_set(values: tuple[str, ...]) -> set[str]:
+    return {value.lower() for value in values}
+
+
+def _get_letter_for_share(record: SectionRecord, share: str) -> str | None:
+    for position, name in enumerate(record.shares):
+        if name.lower() == share.lower():
+            letter = record.letters[position] if position < len(record.letters) else ''
+            return letter.upper() or None
+    return None
+
+
+def diff_sections(old_sections: dict[str, SectionRecord],
+                  new_sections: dict[str, SectionRecord]) -> list[SectionChange]:
+    """
+    Compares two loads of the config section by section, key by key.
+    :return: one SectionChange per section that isn't exactly the same - in the order of the new config
+    """
+    changes = []
+    for name, new in new_sections.items():
+        old = old_sections.get(name)
+        if old is None:
+            changes.append(SectionChange(name, (ADDED,), None, new))
+            continue
+        if old.values == new.values:
+            continue
+        kinds = []
+        if old.ip.lower() != new.ip.lower():
+            kinds.append(HOST)
+        if (old.username, old.password) != (new.username, new.password):
+            kinds.append(CREDENTIALS)
+        if _lower_set(old.shares) != _lower_set(new.shares):
+            kinds.append(SHARES)
+        if any(_get_letter_for_share(old, share) != _get_letter_for_share(new, share) for share in new.shares):
+            kinds.append(LETTERS)
+        known_keys = ('ip', 'username', 'password', 'shares', 'letters')
+        if {k: v for k, v in old.values.items() if k not in known_keys} != \
+                {k: v for k, v in new.values.items() if k not in known_keys}:
+            kinds.append(OTHER)
+        changes.append(SectionChange(name, tuple(kinds), old, new))
+    changes += [SectionChange(name, (REMOVED,), old, None) for name, old in old_sections.items()
+                if name not in new_sections]
+    return changes
+
+
+def plan_remounts(changes: list[SectionChange], connections: list[NetUseConnection], owners: dict[str, str],
+                  sections: dict[str, SectionRecord]) -> tuple[list[Remount], list[Remount]]:
+    """
+    The minimal set of shares to mount again: the connected shares of a section whose host or credentials
+    changed, and the connected shares whose preferred letter changed. Everything else stays connected -
+    new shares and sections are not mounted, the shares of removed sections are not unmounted.
+    A connection belongs to the section that mounted it (owners). When that isn't known ('net use' doesn't show
+    the user), it belongs to the section that lists its host and share - if only one does.
+    :param owners: {letter: section} - the letters mounted by the app
+    :param sections: the config now - the sections that didn't change list the same shares as before
+    :return: the remounts, and the connections left alone because more than one section lists them
+    """
+    # The sections as they were when the shares were mounted
+    old_sections = {**sections, **{change.section: change.old for change in changes if change.old is not None}}
+    listed_by: dict[tuple[str, str], list[str]] = {}
+    for record in old_sections.values():
+        for share in record.shares:
+            listed_by.setdefault((record.ip.lower(), share.lower()), []).append(record.name)
+
+    connected: dict[tuple[str, str], list[str]] = {}
+    for connection in connections:
+        if connection.letter:
+            connected.setdefault((connection.host.lower(), connection.share.lower()), []).append(connection.letter)
+    remounts = []
+    unclaimed = []
+    for change in changes:
+        old, new = change.old, change.new
+        if not change.may_need_remount:
+            continue
+        old_shares = _lower_set(old.shares)
+        for share in new.shares:
+            if share.lower() not in old_shares:
+                continue
+            key = (old.ip.lower(), share.lower())
+            for letter in connected.get(key, ()):
+                owner = owners.get(letter.upper())
+                if owner is not None and owner != change.section:
+                    continue
+                if owner is None and len(listed_by.get(key, ())) > 1:
+                    unclaimed.append(Remount(new.name, share, old.ip, letter, None,
+                                             f"owner unknown - listed by {', '.join(listed_by[key])}"))
+                    continue
+                new_letter = _get_letter_for_share(new, share)
+                if HOST in change.kinds:
+                    reason = f"host {old.ip} -> {new.ip}"
+                elif CREDENTIALS in change.kinds:
+                    reason = "credentials changed"
+                elif new_letter is not None and new_letter != letter.upper():
+                    reason = f"letter {letter} -> {new_letter}"
+                else:
+                    # The letter was removed or is the same - the share can stay where it is
+                    continue
+                remounts.append(Remount(new.name, share, old.ip, letter,
+                                        new_letter if new_letter != letter.upper() else None, reason))
+    return remounts, unclaimed
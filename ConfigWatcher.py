@@ -0,0 +1,246 @@
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import sys
+import threading
+from typing import Callable, Iterable
+
+from Logger import MyLogger
+
+# inotify (Linux)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# FindFirstChangeNotification (Windows)
+FILE_NOTIFY_CHANGE_FILE_NAME = 0x001
+FILE_NOTIFY_CHANGE_SIZE = 0x008
+FILE_NOTIFY_CHANGE_LAST_WRITE = 0x010
+INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+WAIT_OBJECT_0 = 0
+
+
+class WatchedFile:
+    __slots__ = ('metadata', 'digest')
+
+    def __init__(self, metadata: tuple[int, int] | None, digest: str):
+        self.metadata = metadata
+        self.digest = digest
+
+
+class ConfigWatcher:
+    """
+    Watches the config file - and the files it includes - from a background thread and calls on_change(paths)
+    with the files whose content really changed, no matter who changed them.
+    The folders are watched with inotify (Linux) or FindFirstChangeNotification (Windows) and the files are
+    only checked after an event. If neither is available the size and modification time are polled.
+    A file is read and hashed only when its metadata changes and only once a burst of writes has settled (debounce).
+    """
+
+    def __init__(self, file_path: str, on_change: Callable[[list[str]], None], poll_interval: float = 1.0,
+                 debounce: float = 0.3, get_file_paths: Callable[[], Iterable[str]] | None = None):
+        """
+        :param poll_interval: seconds between two checks when polling - with events only how fast stop() returns
+        :param get_file_paths: all the files to watch - asked again on every check, so a file that starts or stops
+                               being included is noticed too (Config.get_watched_paths). Only file_path if not set
+        """
+        self.logger = MyLogger("ConfigWatcher")
+        self.file_path = os.path.abspath(file_path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.get_file_paths = get_file_paths
+
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        # {absolute path: WatchedFile}
+        self._files: dict[str, WatchedFile] = {path: self._load(path) for path in self._get_paths()}
+
+    @property
+    def folders(self) -> tuple[str, ...]:
+        # A folder that doesn't exist yet can't be watched - it's picked up once it's created
+        return tuple(dict.fromkeys(folder for folder in map(os.path.dirname, self._files) if os.path.isdir(folder)))
+
+    def _get_paths(self) -> list[str]:
+        paths = self.get_file_paths() if self.get_file_paths is not None else ()
+        return list(dict.fromkeys([self.file_path, *(os.path.abspath(path) for path in paths)]))
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ConfigWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    @staticmethod
+    def _get_metadata(path: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _hash_content(path: str) -> str:
+        try:
+            with open(path, 'rb') as file:
+                return hashlib.sha256(file.read()).hexdigest()
+        except OSError:
+            return ''
+
+    def _load(self, path: str) -> WatchedFile:
+        return WatchedFile(self._get_metadata(path), self._hash_content(path))
+
+    def _get_waiter(self) -> tuple[Callable[[float], bool], Callable[[], None]]:
+        """
+        :return: wait(timeout) -> True if something in the folders changed (always True when polling), close()
+        """
+        if sys.platform.startswith('linux'):
+            waiter = self._get_inotify_waiter()
+        elif os.name == 'nt':
+            waiter = self._get_windows_waiter()
+        else:
+            waiter = None
+        if waiter is None:
+            self.logger.info("Polling %s every %s seconds", ', '.join(self._files), self.poll_interval)
+            waiter = (lambda timeout: not self._stop_event.wait(timeout)), (lambda: None)
+        return waiter
+
+    def _run(self) -> None:
+        folders = self.folders
+        wait, close = self._get_waiter()
+        # A change made before the folders were watched has no event - check once right away
+        is_changed = True
+        try:
+            while not self._stop_event.is_set():
+                if is_changed:
+                    try:
+                        self._check()
+                    except Exception as e:
+                        self.logger.error("Error while checking the config file: %s", e)
+                    if self.folders != folders:
+                        # An include added or removed a folder
+                        close()
+                        folders = self.folders
+                        wait, close = self._get_waiter()
+                        continue
+                is_changed = wait(self.poll_interval)
+        finally:
+            close()
+
+    def _check(self) -> None:
+        paths = self._get_paths()
+        changed = []
+        for path in paths:
+            watched = self._files.get(path)
+            if watched is None:
+                # Included since the last check
+                self._files[path] = self._load(path)
+                changed.append(path)
+            elif self._check_file(path, watched):
+                changed.append(path)
+        for path in [path for path in self._files if path not in paths]:
+            # Not included anymore
+            del self._files[path]
+            changed.append(path)
+
+        if not changed:
+            return
+        self.logger.info("The config file has been changed: %s", ', '.join(changed))
+        self.on_change(changed)
+
+    def _check_file(self, path: str, watched: WatchedFile) -> bool:
+        """
+        :return: True if the content of the file changed
+        """
+        metadata = self._get_metadata(path)
+        if metadata == watched.metadata or metadata is None:
+            # Nothing changed - or the editor is in the middle of replacing the file
+            return False
+
+        # Wait until the writes stop
+        while not self._stop_event.wait(self.debounce):
+            settled_metadata = self._get_metadata(path)
+            if settled_metadata == metadata:
+                break
+            metadata = settled_metadata
+        watched.metadata = metadata
+
+        digest = self._hash_content(path)
+        if digest == watched.digest:
+            return False
+        watched.digest = digest
+        return True
+
+    def _get_inotify_waiter(self) -> tuple[Callable[[float], bool], Callable[[], None]] | None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            folders = self.folders
+            if any(libc.inotify_add_watch(fd, folder.encode(), mask) < 0 for folder in folders):
+                os.close(fd)
+                return None
+        except (OSError, AttributeError):
+            return None
+        self.logger.info("Watching %s with inotify", ', '.join(folders))
+
+        def wait(timeout: float) -> bool:
+            readable, _, _ = select.select([fd], [], [], timeout)
+            if not readable:
+                return False
+            # The events aren't needed - the metadata check tells if it was a config file
+            try:
+                while os.read(fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+            return True
+
+        return wait, lambda: os.close(fd)
+
+    def _get_windows_waiter(self) -> tuple[Callable[[float], bool], Callable[[], None]] | None:
+        try:
+            kernel32 = ctypes.windll.kernel32
+            kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+            mask = FILE_NOTIFY_CHANGE_FILE_NAME | FILE_NOTIFY_CHANGE_SIZE | FILE_NOTIFY_CHANGE_LAST_WRITE
+            folders = self.folders
+            handles = []
+            for folder in folders:
+                handle = kernel32.FindFirstChangeNotificationW(folder, False, mask)
+                if handle is None or handle == INVALID_HANDLE_VALUE:
+                    for handle in handles:
+                        kernel32.FindCloseChangeNotification(handle)
+                    return None
+                handles.append(ctypes.c_void_p(handle))
+        except (OSError, AttributeError):
+            return None
+        handle_array = (ctypes.c_void_p * len(handles))(*handles)
+        self.logger.info("Watching %s with FindFirstChangeNotification", ', '.join(folders))
+
+        def wait(timeout: float) -> bool:
+            index = kernel32.WaitForMultipleObjects(len(handles), handle_array, False, int(timeout * 1000))
+            if not WAIT_OBJECT_0 <= index < WAIT_OBJECT_0 + len(handles):
+                return False
+            kernel32.FindNextChangeNotification(handles[index - WAIT_OBJECT_0])
+            return True
+
+        def close() -> None:
+            for handle in handles:
+                kernel32.FindCloseChangeNotification(handle)
+
+        return wait, close
@@ -0,0 +1,216 @@
+import configparser
+import json
+import os
+import secrets
+import socketserver
+import threading
+
+from Client import DAEMON_HOST, DAEMON_PORT, get_token_file_path
+from CommandRunner import CommandRunner
+from Config import Config
+from ConfigDiff import diff_sections
+from ConfigWatcher import ConfigWatcher
+from HostProber import HostProber
+from Logger import MyLogger
+from Reconciler import Reconciler
+from SMB import SMB, is_success_message
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """ One JSON line in: {'token': ..., 'requests': [...]} - one JSON line out: {'results': [...]} """
+
+    def handle(self) -> None:
+        daemon: Daemon = self.server.daemon
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                if not secrets.compare_digest(str(message.get('token', '')), daemon.token):
+                    response = {'error': "Wrong token"}
+                else:
+                    response = {'results': daemon.handle_batch(message['requests'])}
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'error': f"Bad request: {e}"}
+            except Exception as e:
+                # Never leave the client without a reply
+                daemon.logger.error("Request failed: %s", e)
+                response = {'error': f"Request failed: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Daemon:
+    """
+    The app without the tray - for scripts. Config and SMB stay loaded, so a request costs only its 'net use' calls.
+    Listens on localhost only. Every request carries the token the daemon writes to daemon.token when it starts,
+    so only users who can read that file can use it.
+    The mount requests that come together in one batch are planned together - one 'net use' listing for all.
+    """
+
+    def __init__(self, config_file_name: str, port: int = DAEMON_PORT, runner: CommandRunner | None = None,
+                 host_prober: HostProber | None = None, autoconnect_interval: float = 60, use_sessions: bool = False):
+        self.logger = MyLogger("Daemon")
+        self.config_file_name = config_file_name
+        self.port = port
+        self.my_config = Config(config_file_name)
+        self.my_smb = SMB(self.my_config, runner=runner,
+                          host_prober=host_prober if host_prober is not None else HostProber(),
+                          use_sessions=use_sessions)
+        self.reconciler = Reconciler(self.my_smb, interval=autoconnect_interval)
+        self.config_watcher = ConfigWatcher(config_file_name, self.on_config_file_changed,
+                                            get_file_paths=self.my_config.get_watched_paths)
+
+        self.token = secrets.token_hex(16)
+        self.token_file_path = get_token_file_path()
+        self._server: _Server | None = None
+        self._reload_lock = threading.Lock()
+
+    def on_config_file_changed(self, paths: list[str]) -> None:
+        self.reload_config()
+
+    def reload_config(self) -> str:
+        """
+        :return: msg - what changed and what was mounted again
+        """
+        with self._reload_lock:
+            old_sections = self.my_config.sections
+            self.my_config.reload()
+            changes = diff_sections(old_sections, self.my_config.sections)
+        for change in changes:
+            self.logger.info("Config change: %s", change.describe())
+        msg = f"Config reloaded. Changes: {'; '.join(change.describe() for change in changes) or 'none'}"
+        to_remount = [change for change in changes if change.may_need_remount]
+        if to_remount:
+            msg += f"\n{self.my_smb.remount_changed_shares(to_remount)}"
+        return msg
+
+    def handle_batch(self, requests: list[dict]) -> list[dict]:
+        """
+        Runs the requests in order - except that consecutive mount requests are run as one plan.
+        :return: one {'ok': bool, 'msg': str} per request
+        """
+        results: list[dict] = []
+        mounts: list[dict] = []
+        for request in requests:
+            if request.get('op') == 'mount':
+                mounts.append(request)
+                continue
+            if mounts:
+                results.extend(self._mount_or_fail(mounts))
+                mounts = []
+            results.append(self._handle(request))
+        if mounts:
+            results.extend(self._mount_or_fail(mounts))
+        return results
+
+    def _mount_or_fail(self, requests: list[dict]) -> list[dict]:
+        try:
+            return self._mount(requests)
+        except Exception as e:
+            # A hung 'net use' listing (TimeoutError), the runner (OSError)...
+            self.logger.error("Mount requests failed: %s", e)
+            return [{'ok': False, 'msg': f"Failed: {e}"} for _ in requests]
+
+    def _handle(self, request: dict) -> dict:
+        op = request.get('op')
+        try:
+            if op == 'unmount':
+                return self._unmount(request)
+            if op == 'status':
+                self.my_smb.mount_state.refresh()
+                connections = self.my_smb.mount_state.get_connections()
+                return {'ok': True, 'msg': f"{len(connections)} connections",
+                        'connections': [{'status': c.status, 'letter': c.letter, 'host': c.host, 'share': c.share}
+                                        for c in connections]}
+            if op == 'reload':
+                return {'ok': True, 'msg': self.reload_config()}
+            return {'ok': False, 'msg': f"Unknown op: {op}"}
+        except configparser.NoSectionError as e:
+            return {'ok': False, 'msg': str(e)}
+        except Exception as e:
+            self.logger.error("Request %s failed: %s", request, e)
+            return {'ok': False, 'msg': f"Failed: {e}"}
+
+    def _unmount(self, request: dict) -> dict:
+        if request.get('letter'):
+            msg = self.my_smb.unmount_smb_letter(request['letter'])
+        elif request.get('section'):
+            msg = self.my_smb.unmount_all_smb_for_ip(self.my_config.get_ip_for_section(request['section']))
+        else:
+            msg = self.my_smb.unmount_all_smb()
+        return {'ok': is_success_message(msg), 'msg': msg}
+
+    def _mount(self, requests: list[dict]) -> list[dict]:
+        """ All the shares of the requests are mounted from one letter plan """
+        my_conf = self.my_config
+        wanted: list[list[tuple[str, str]]] = []
+        for request in requests:
+            section_name = request.get('section', '')
+            if section_name not in my_conf.sections:
+                wanted.append([])
+            elif request.get('share'):
+                shares = my_conf.get_shares_for_section(section_name)
+                wanted.append([(section_name, share) for share in shares if share.lower() == request['share'].lower()])
+            else:
+                wanted.append([(section_name, share) for share in my_conf.get_shares_for_section(section_name)])
+
+        only = {pair for pairs in wanted for pair in pairs}
+        plan = self.my_smb.plan_mounts(list(dict.fromkeys(section for section, _ in only)), only=only)
+        messages = {(mount.section, mount.share): f"{mount.share}: {mount.skip_reason}" for mount in plan.skipped}
+        for mount, msg in zip(plan.to_mount, self.my_smb.run_plan(plan)):
+            messages[(mount.section, mount.share)] = f"{mount.share}: {msg.splitlines()[0]}"
+
+        results = []
+        for request, pairs in zip(requests, wanted):
+            if not pairs:
+                results.append({'ok': False, 'msg': f"No such section or share: {request.get('section')} "
+                                                    f"{request.get('share', '')}".strip()})
+                continue
+            is_ok = all(self.my_smb.is_already_mounted(my_conf.get_ip_for_section(section), share)[0]
+                        for section, share in pairs)
+            results.append({'ok': is_ok, 'msg': '\n'.join(messages[pair] for pair in pairs if pair in messages)})
+        return results
+
+    def _write_token(self) -> None:
+        # Readable by the current user only
+        fd = os.open(self.token_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as file:
+            file.write(self.token)
+
+    def start(self) -> None:
+        self._server = _Server((DAEMON_HOST, self.port), _RequestHandler)
+        self._server.daemon = self
+        self._write_token()
+        self.config_watcher.start()
+        self.reconciler.start()
+        threading.Thread(target=self._server.serve_forever, name="Daemon", daemon=True).start()
+        self.logger.info("Listening on %s:%s", DAEMON_HOST, self._server.server_address[1])
+
+    def stop(self) -> None:
+        self.logger.info("Stopping the daemon")
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.config_watcher.stop()
+        self.reconciler.stop()
+        self.my_smb.runner.close()
+        try:
+            os.remove(self.token_file_path)
+        except OSError:
+            pass
+
+
+def run_daemon() -> None:
+    root_folder = os.path.dirname(os.path.abspath(__file__))
+    daemon = Daemon(os.path.join(root_folder, "App.conf"))
+    daemon.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
@@ -0,0 +1,231 @@
+import random
+import re
+import threading
+import time
+
+from CommandRunner import CommandRunner, get_timeout_message
+from MountState import letter_to_bit
+from NetUseParser import parse_net_use
+
+NETWORK_PROVIDER = "Microsoft Windows Network"
+NEWLINE = "\r\n"
+
+LISTING_HEADER = (
+    f"New connections will be remembered.{NEWLINE}{NEWLINE}{NEWLINE}"
+    f"Status       Local     Remote                    Network{NEWLINE}{NEWLINE}"
+    f"{'-' * 79}{NEWLINE}"
+)
+NO_ENTRIES = f"New connections will be remembered.{NEWLINE}{NEWLINE}There are no entries in the list.{NEWLINE}{NEWLINE}"
+COMMAND_COMPLETED = f"The command completed successfully.{NEWLINE}{NEWLINE}"
+
+# System error number -> message, as printed by 'net use' on stderr
+SYSTEM_ERRORS = {
+    53: "The network path was not found.",
+    67: "The network name cannot be found.",
+    85: "The local device name is already in use.",
+    86: "The specified network password is not correct.",
+    1219: "Multiple connections to a server or shared resource by the same user, using more than one user name, "
+          "are not allowed. Disconnect all previous connections to the server or shared resource and try again.",
+    1326: "The user name or password is incorrect.",
+}
+CONNECTION_NOT_FOUND = (f"The network connection could not be found.{NEWLINE}{NEWLINE}"
+                        f"More help is available by typing NET HELPMSG 2250.{NEWLINE}{NEWLINE}")
+SYNTAX_ERROR = (f"The syntax of this command is:{NEWLINE}{NEWLINE}NET USE{NEWLINE}"
+                f"[devicename | *] [\\\\computername\\sharename[\\volume] [password | *]]{NEWLINE}{NEWLINE}")
+
+LIST_PATTERN = re.compile(r'^net use$', re.IGNORECASE)
+DELETE_ALL_PATTERN = re.compile(r'^net use \* /del(?:ete)?(?: /y(?:es)?)?$', re.IGNORECASE)
+DELETE_PATTERN = re.compile(r'^net use (?:(?P<letter>[a-z]):|\\\\(?P<host>[^\\\s]+)\\(?P<share>\S+)) /del(?:ete)?$',
+                            re.IGNORECASE)
+CONNECT_PATTERN = re.compile(r'^net use (?:(?P<letter>[a-z]): )?\\\\(?P<host>[^\\\s]+)\\(?P<share>\S+)'
+                             r'(?: /user:(?P<username>\S+)(?: (?P<password>\S+))?)?$', re.IGNORECASE)
+
+
+def system_error(number: int) -> bytes:
+    return f"System error {number} has occurred.{NEWLINE}{NEWLINE}{SYSTEM_ERRORS[number]}{NEWLINE}{NEWLINE}".encode()
+
+
+class FakeHost:
+    def __init__(self, shares: list[str] | None, credentials: dict[str, str] | None, latency: float | None,
+                 online: bool):
+        # None means anything is accepted
+        self.shares = {share.lower() for share in shares} if shares is not None else None
+        self.credentials = credentials
+        self.latency = latency
+        self.online = online
+
+
+class FakeNetUseRunner(CommandRunner):
+    """
+    In-process 'net use' that keeps its own connections and drive letters, so SMB can be run and measured
+    anywhere. The output is byte for byte what Windows (English locale) prints.
+    Hosts that weren't added with add_host() accept any share and any credentials.
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: int | None = None,
+                 local_drives: str = 'C', timeout: float = 60.0, latency_jitter: float = 0.0):
+        """
+        :param latency: seconds every command takes (hosts can override it for the commands that reach them).
+                        A command slower than the timeout is "killed" when the timeout is reached
+        :param latency_jitter: up to that many seconds are added to the latency of every command (uniformly)
+        :param failure_rate: 0..1 - probability that a connect fails with 'network path was not found'
+        :param local_drives: letters of the local disks
+        """
+        super().__init__(timeout)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        # Its own generator - the failures injected for a seed don't depend on the jitter
+        self._latency_random = random.Random(seed)
+        self._local_drives_bitmask = 0
+        for letter in local_drives:
+            self._local_drives_bitmask |= letter_to_bit(letter)
+
+        self._lock = threading.Lock()
+        self._hosts: dict[str, FakeHost] = {}
+        # [{'status': 'OK', 'letter': 'Z', 'host': ..., 'share': ..., 'username': ...}]
+        self.connections: list[dict] = []
+        self.commands: list[str] = []
+
+    def add_host(self, host: str, shares: list[str] | None = None, credentials: dict[str, str] | None = None,
+                 latency: float | None = None, online: bool = True) -> None:
+        """
+        :param credentials: {username: password} - None accepts any user
+        """
+        with self._lock:
+            self._hosts[host.lower()] = FakeHost(shares, credentials, latency, online)
+
+    def load_recording(self, output: bytes, encoding: str = 'utf-8') -> int:
+        """
+        Starts from the connections of a recorded 'net use' listing (see net_use_samples).
+        :param encoding: of the recording - 'cp850' for fr_basic.cp850.txt
+        The user of a recorded connection isn't known - a connect with credentials to its host gets error 1219.
+        :return: number of connections loaded
+        """
+        connections = [{'status': c.status, 'letter': c.letter, 'host': c.host, 'share': c.share, 'username': None}
+                       for c in parse_net_use(output.splitlines(keepends=True), encoding)]
+        with self._lock:
+            self.connections = connections
+        return len(connections)
+
+    def set_host_online(self, host: str, online: bool) -> None:
+        with self._lock:
+            self._hosts.setdefault(host.lower(), FakeHost(None, None, None, True)).online = online
+
+    def set_connection_status(self, letter: str, status: str) -> None:
+        """ Simulates a dropped connection - status is 'Disconnected' or 'Unavailable' """
+        with self._lock:
+            for connection in self.connections:
+                if connection['letter'] == letter.upper():
+                    connection['status'] = status
+
+    def get_used_drive_letters_bitmask(self) -> int:
+        with self._lock:
+            return self._get_used_drive_letters_bitmask()
+
+    def _get_used_drive_letters_bitmask(self) -> int:
+        bitmask = self._local_drives_bitmask
+        for connection in self.connections:
+            if connection['letter']:
+                bitmask |= letter_to_bit(connection['letter'])
+        return bitmask
+
+    def run(self, command: str) -> tuple[bytes, bytes]:
+        self._count_spawn()
+        command = ' '.join(command.split())
+        with self._lock:
+            self.commands.append(command)
+
+        connect = CONNECT_PATTERN.match(command)
+        host = self._hosts.get(connect.group('host').lower()) if connect else None
+        latency = host.latency if host and host.latency is not None else self.latency
+        if self.latency_jitter:
+            with self._lock:
+                latency += self._latency_random.uniform(0, self.latency_jitter)
+        if latency and latency >= self.timeout:
+            time.sleep(self.timeout)
+            self._count_timeout(command)
+            return b'', get_timeout_message(self.timeout)
+        if latency:
+            time.sleep(latency)
+
+        with self._lock:
+            if LIST_PATTERN.match(command):
+                return self._list(), b''
+            if DELETE_ALL_PATTERN.match(command):
+                return self._delete_all()
+            delete = DELETE_PATTERN.match(command)
+            if delete:
+                return self._delete(delete.group('letter'), delete.group('host'), delete.group('share'))
+            if connect:
+                return self._connect(connect.group('letter'), connect.group('host'), connect.group('share'),
+                                     connect.group('username'), connect.group('password'))
+            return b'', SYNTAX_ERROR.encode()
+
+    def _list(self) -> bytes:
+        if not self.connections:
+            return NO_ENTRIES.encode()
+        rows = []
+        for connection in self.connections:
+            local = f"{connection['letter']}:" if connection['letter'] else ''
+            remote = f"\\\\{connection['host']}\\{connection['share']}"
+            if len(remote) > 25:
+                # Long paths push the provider to its own (indented) line
+                rows.append(f"{connection['status']:<13}{local:<10}{remote}{NEWLINE}{' ' * 48}{NETWORK_PROVIDER}")
+            else:
+                rows.append(f"{connection['status']:<13}{local:<10}{remote:<26}{NETWORK_PROVIDER}")
+        return (LISTING_HEADER + NEWLINE.join(rows) + NEWLINE + COMMAND_COMPLETED).encode()
+
+    def _connect(self, letter: str | None, host_name: str, share: str, username: str | None,
+                 password: str | None) -> tuple[bytes, bytes]:
+        host = self._hosts.get(host_name.lower())
+        if host and not host.online:
+            return b'', system_error(53)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            return b'', system_error(53)
+        if host and host.shares is not None and share.lower() not in host.shares and share.upper() != 'IPC$':
+            return b'', system_error(67)
+        if host and host.credentials is not None and username is not None \
+                and host.credentials.get(username) != password:
+            return b'', system_error(86)
+
+        letter = letter.upper() if letter else ''
+        if letter and self._get_used_drive_letters_bitmask() & letter_to_bit(letter):
+            return b'', system_error(85)
+
+        same_host = [c for c in self.connections if c['host'].lower() == host_name.lower()]
+        if username is not None and any(c['username'] != username for c in same_host):
+            return b'', system_error(1219)
+        if username is None and same_host:
+            # Connections without credentials reuse the session that is already established
+            username = same_host[0]['username']
+        elif username is None and host and host.credentials is not None:
+            # No session - Windows tries the credentials of the logged on user
+            return b'', system_error(1326)
+
+        self.connections.append(
+            {'status': 'OK', 'letter': letter, 'host': host_name, 'share': share, 'username': username})
+        return COMMAND_COMPLETED.encode(), b''
+
+    def _delete(self, letter: str | None, host: str | None, share: str | None) -> tuple[bytes, bytes]:
+        if letter:
+            matching = [c for c in self.connections if c['letter'] == letter.upper()]
+            name = f"{letter.upper()}:"
+        else:
+            matching = [c for c in self.connections if c['host'].lower() == host.lower()
+                        and c['share'].lower() == share.lower() and not c['letter']]
+            name = f"\\\\{host}\\{share}"
+        if not matching:
+            return b'', CONNECTION_NOT_FOUND.encode()
+        self.connections.remove(matching[0])
+        return f"{name} was deleted successfully.{NEWLINE}{NEWLINE}".encode(), b''
+
+    def _delete_all(self) -> tuple[bytes, bytes]:
+        if not self.connections:
+            return f"There are no entries in the list.{NEWLINE}{NEWLINE}".encode(), b''
+        rows = [f"    {c['letter'] + ':' if c['letter'] else '':<6}\\\\{c['host']}\\{c['share']}" for c in
+                self.connections]
+        self.connections = []
+        return (f"You have these remote connections:{NEWLINE}{NEWLINE}" + NEWLINE.join(rows) + NEWLINE +
+                f"Continuing will cancel the connections.{NEWLINE}{NEWLINE}" + COMMAND_COMPLETED).encode(), b''
@@ -0,0 +1,94 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from Logger import MyLogger
+
+SMB_PORT = 445
+
+
+class HostStatus:
+    __slots__ = ('is_up', 'checked_at', 'failures')
+
+    def __init__(self, is_up: bool, checked_at: float, failures: int):
+        self.is_up = is_up
+        self.checked_at = checked_at
+        # Probes that failed in a row
+        self.failures = failures
+
+
+class HostProber:
+    """
+    Checks if the SMB port of a host accepts connections - in a second, instead of waiting for the
+    'net use' timeout of an offline NAS.
+    Results are cached: a host that is up is checked again after ttl seconds, a host that is down after
+    down_ttl seconds - doubled with every failed probe, up to max_down_ttl.
+    """
+
+    def __init__(self, port: int = SMB_PORT, timeout: float = 1.0, ttl: float = 30.0, down_ttl: float = 5.0,
+                 max_down_ttl: float = 60.0, max_workers: int = 16, clock: Callable[[], float] = time.monotonic):
+        self.logger = MyLogger("HostProber")
+        self.port = port
+        self.timeout = timeout
+        self.ttl = ttl
+        self.down_ttl = down_ttl
+        self.max_down_ttl = max_down_ttl
+        self.max_workers = max_workers
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._statuses: dict[str, HostStatus] = {}
+
+    def _get_ttl(self, status: HostStatus) -> float:
+        if status.is_up:
+            return self.ttl
+        return min(self.down_ttl * 2 ** (status.failures - 1), self.max_down_ttl)
+
+    def _get_cached(self, host: str) -> HostStatus | None:
+        with self._lock:
+            status = self._statuses.get(host)
+        if status is None or self.clock() - status.checked_at > self._get_ttl(status):
+            return None
+        return status
+
+    def probe(self, host: str) -> bool:
+        """ Connects to the host now - the cache is only updated """
+        try:
+            with socket.create_connection((host, self.port), timeout=self.timeout):
+                is_up = True
+        except OSError as e:
+            self.logger.warning("%s:%s is not reachable: %s", host, self.port, e)
+            is_up = False
+
+        with self._lock:
+            previous = self._statuses.get(host)
+            failures = 0 if is_up else (previous.failures + 1 if previous and not previous.is_up else 1)
+            self._statuses[host] = HostStatus(is_up, self.clock(), failures)
+        return is_up
+
+    def is_reachable(self, host: str) -> bool:
+        status = self._get_cached(host)
+        if status is not None:
+            return status.is_up
+        return self.probe(host)
+
+    def probe_all(self, hosts: list[str] | tuple[str, ...]) -> dict[str, bool]:
+        """
+        Checks all hosts at the same time - the ones with a valid cached status are not probed.
+        :return: {host: is_reachable}
+        """
+        hosts = list(dict.fromkeys(hosts))
+        if not hosts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(hosts))) as pool:
+            return dict(zip(hosts, pool.map(self.is_reachable, hosts)))
+
+    def invalidate(self, host: str | None = None) -> None:
+        """ Forgets the status of the host - or of all hosts """
+        with self._lock:
+            if host is None:
+                self._statuses.clear()
+            else:
+                self._statuses.pop(host, None)
@@ -0,0 +1,100 @@
+from MountState import ALL_LETTERS, RESERVED_LETTERS_BITMASK, letter_to_bit
+from NetUseParser import NetUseConnection
+
+ALL_LETTERS_BITMASK = (1 << len(ALL_LETTERS)) - 1
+# Start of the skip reason of a share that is already connected - not a problem, just nothing to do
+ALREADY_MOUNTED = "already mounted"
+# Start of the skip reason of a share whose preferred letter is used
+PREFERRED_LETTER_TAKEN = "preferred letter"
+
+
+def get_highest_free_letter(taken_bitmask: int) -> str | None:
+    """
+    :return: the last free letter (Z, Y, X...) or None if all 26 are taken
+    """
+    free_bitmask = ~(taken_bitmask | RESERVED_LETTERS_BITMASK) & ALL_LETTERS_BITMASK
+    if not free_bitmask:
+        return None
+    return ALL_LETTERS[free_bitmask.bit_length() - 1]
+
+
+class PlannedMount:
+    """ One share of the batch. After planning it has either a letter or a skip_reason. """
+    __slots__ = ('section', 'position', 'host', 'share', 'username', 'preferred_letter', 'letter', 'skip_reason')
+
+    def __init__(self, section: str, position: int, host: str, share: str, username: str,
+                 preferred_letter: str | None):
+        self.section = section
+        self.position = position
+        self.host = host
+        self.share = share
+        self.username = username
+        self.preferred_letter = preferred_letter.upper() if preferred_letter else None
+        self.letter: str | None = None
+        self.skip_reason: str | None = None
+
+
+class LetterPlan:
+    def __init__(self, mounts: list[PlannedMount]):
+        self.mounts = mounts
+
+    @property
+    def to_mount(self) -> list[PlannedMount]:
+        return [mount for mount in self.mounts if mount.skip_reason is None]
+
+    @property
+    def skipped(self) -> list[PlannedMount]:
+        return [mount for mount in self.mounts if mount.skip_reason is not None]
+
+    @property
+    def letters_bitmask(self) -> int:
+        bitmask = 0
+        for mount in self.to_mount:
+            bitmask |= letter_to_bit(mount.letter)
+        return bitmask
+
+
+def plan_letters(mounts: list[PlannedMount], taken_bitmask: int, connections: list[NetUseConnection]) -> LetterPlan:
+    """
+    Assigns the drive letters of a whole batch of mounts in one pass - without touching the system.
+    1. Shares that are already connected, repeated in the batch, or on a host that the batch uses with another
+       user (Windows allows one user per server) are skipped.
+    2. Preferred letters are given in order - a preferred letter that is taken is a conflict. The share is not
+       mounted elsewhere, because the letter might be important.
+    3. Shares without a preferred letter get the last free letters - Z, Y, X...
+    :param taken_bitmask: letters used on the machine (and reserved by other mounts). Bit 0 = A:
+    """
+    mounted = {(c.host.lower(), c.share.lower()): c.letter for c in connections}
+    planned_shares = set()
+    host_users: dict[str, str] = {}
+
+    for mount in mounts:
+        key = (mount.host.lower(), mount.share.lower())
+        if key in mounted:
+            mount.skip_reason = f"{ALREADY_MOUNTED} at {mounted[key] or 'no letter'}"
+        elif key in planned_shares:
+            mount.skip_reason = "repeated in the batch"
+        elif host_users.setdefault(key[0], mount.username) != mount.username:
+            mount.skip_reason = f"{mount.host} is already used with user {host_users[key[0]]}"
+        else:
+            planned_shares.add(key)
+
+    for mount in mounts:
+        if mount.skip_reason is None and mount.preferred_letter:
+            bit = letter_to_bit(mount.preferred_letter)
+            if taken_bitmask & bit:
+                mount.skip_reason = f"{PREFERRED_LETTER_TAKEN} {mount.preferred_letter} is taken"
+            else:
+                mount.letter = mount.preferred_letter
+                taken_bitmask |= bit
+
+    for mount in mounts:
+        if mount.skip_reason is None and not mount.preferred_letter:
+            letter = get_highest_free_letter(taken_bitmask)
+            if letter is None:
+                mount.skip_reason = "no free drive letter"
+            else:
+                mount.letter = letter
+                taken_bitmask |= letter_to_bit(letter)
+
+    return LetterPlan(mounts)
@@ -1,31 +1,106 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import threading
+
+ROOT_LOGGER_NAME = "AttachMyNAS"
+LOG_FORMAT = '%(asctime)s [%(levelname)s]: [%(prefix)s]: %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_setup_lock = threading.Lock()
+_listener: logging.handlers.QueueListener | None = None
+
+
+class _PrefixFilter(logging.Filter):
+    """ Adds the MyLogger prefix (SMB, Config, Tray...) to the record - it's the last part of the logger name """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.prefix = record.name.rsplit('.', 1)[-1]
+        return True
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """ Puts the record in the queue as it is - the message is formatted by the writer thread """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(log_file: str = 'app.log', max_bytes: int = 1024 * 1024, backup_count: int = 3,
+                  when: str | None = None) -> None:
+    """
+    Configures the logging of the app - only the first call does something.
+    The loggers only put the records in a queue. A background thread formats them and writes them to the file,
+    so logging never waits for the disk.
+    :param max_bytes: the file is rotated when it gets bigger than that (app.log.1, app.log.2...)
+    :param when: rotate by time instead - 'midnight', 'H', 'D'... (see TimedRotatingFileHandler)
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        if when:
+            file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when=when, backupCount=backup_count,
+                                                                     delay=True)
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                                                backupCount=backup_count, delay=True)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+        file_handler.addFilter(_PrefixFilter())
+
+        log_queue = queue.SimpleQueue()
+        root_logger = logging.getLogger(ROOT_LOGGER_NAME)
+        root_logger.addHandler(_LazyQueueHandler(log_queue))
+        root_logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """ Writes everything that is still in the queue """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def set_level(prefix: str, level: int) -> None:
+    """ Changes the level of one prefix only - set_level('SMB', logging.DEBUG) """
+    logging.getLogger(f"{ROOT_LOGGER_NAME}.{prefix}").setLevel(level)
 
 
 class MyLogger:
+    """
+    Use %-style arguments - the message is only formatted if the level is enabled, and on the writer thread:
+        logger.info("Mounted %s at %s:", share, letter)
+    """
+
     def __init__(self, prefix: str, log_file='app.log', log_level=logging.INFO):
         self.log_file = log_file
         self.log_level = log_level
         self.prefix = prefix
 
-        logging.basicConfig(
-            level=self.log_level,
-            filename=self.log_file,
-            filemode='a',
-            format=f'%(asctime)s [%(levelname)s]: %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
+        setup_logging(self.log_file)
+        self.logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{self.prefix}")
+        if self.logger.level == logging.NOTSET:
+            self.logger.setLevel(self.log_level)
 
-    def debug(self, message):
-        logging.debug(f"[{self.prefix}]: {message}")
+    def debug(self, message, *args):
+        self.logger.debug(message, *args)
 
-    def info(self, message):
-        logging.info(f"[{self.prefix}]: {message}")
+    def info(self, message, *args):
+        self.logger.info(message, *args)
 
-    def warning(self, message):
-        logging.warning(f"[{self.prefix}]: {message}")
+    def warning(self, message, *args):
+        self.logger.warning(message, *args)
 
-    def error(self, message):
-        logging.error(f"[{self.prefix}]: {message}")
+    def error(self, message, *args):
+        self.logger.error(message, *args)
 
-    def critical(self, message):
-        logging.critical(f"[{self.prefix}]: {message}")
+    def critical(self, message, *args):
+        self.logger.critical(message, *args)
@@ -0,0 +1,253 @@
+import string
+import threading
+import time
+from typing import Callable
+
+from Logger import MyLogger
+from NetUseParser import NetUseConnection
+
+ALL_LETTERS = string.ascii_uppercase
+# A: and B: are reserved for floppy drives and are never offered as free letters.
+RESERVED_LETTERS_BITMASK = 0b11
+
+
+def letter_to_bit(letter: str) -> int:
+    return 1 << (ord(letter.upper()) - ord('A'))
+
+
+class MountState:
+    """
+    In-memory snapshot of the 'net use' connections and of the used drive letters on the machine.
+    The snapshot is loaded once and reused until it expires (ttl) or is invalidated, so a bulk operation
+    needs a single 'net use' listing. Successful mounts/unmounts update the snapshot in place.
+    """
+
+    def __init__(self, list_connections: Callable[[], list[NetUseConnection]],
+                 get_used_letters_bitmask: Callable[[], int], ttl: float = 5.0):
+        """
+        :param list_connections: returns the parsed 'net use' rows
+        :param get_used_letters_bitmask: returns the used drive letters (local + network) - bit 0 = A:
+        :param ttl: seconds after which the snapshot is considered stale and is reloaded on the next read
+        """
+        self.logger = MyLogger("MountState")
+        self._list_connections = list_connections
+        self._get_used_letters_bitmask = get_used_letters_bitmask
+        self.ttl = ttl
+
+        self._lock = threading.RLock()
+        self._connections: list[NetUseConnection] = []
+        # The same connections grouped by lower case host
+        self._connections_by_host: dict[str, list[NetUseConnection]] = {}
+        self._used_letters_bitmask = 0
+        # Letters handed out to in-flight mounts. They survive a refresh until the mount finishes.
+        self._reserved_letters_bitmask = 0
+        self._loaded_at: float | None = None
+        # {letter: (section, lower case host, lower case share)} - the section that mounted the letter.
+        # Only the mounts made by this app are known - 'net use' doesn't show the user.
+        self._owners: dict[str, tuple[str, str, str]] = {}
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._connections = self._list_connections()
+            self._index_connections()
+            self._used_letters_bitmask = self._get_used_letters_bitmask()
+            # Network drives are always in the bitmask, but don't rely on the OS call for it.
+            for connection in self._connections:
+                if connection.letter:
+                    self._used_letters_bitmask |= letter_to_bit(connection.letter)
+            self._loaded_at = time.monotonic()
+            self.logger.debug("Snapshot refreshed: %s connections", len(self._connections))
+
+    def _index_connections(self) -> None:
+        connections_by_host: dict[str, list[NetUseConnection]] = {}
+        for connection in self._connections:
+            connections_by_host.setdefault(connection.host.lower(), []).append(connection)
+        self._connections_by_host = connections_by_host
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _ensure_fresh(self) -> None:
+        if self.is_stale():
+            self.refresh()
+
+    def get_connections(self) -> list[NetUseConnection]:
+        with self._lock:
+            self._ensure_fresh()
+            return list(self._connections)
+
+    def get_used_letters_bitmask(self) -> int:
+        with self._lock:
+            self._ensure_fresh()
+            return self._used_letters_bitmask
+
+    def get_taken_letters_bitmask(self) -> int:
+        """
+        :return: used + reserved letters, A: and B: included
+        """
+        with self._lock:
+            return self.get_used_letters_bitmask() | self._reserved_letters_bitmask | RESERVED_LETTERS_BITMASK
+
+    def is_letter_used(self, letter: str) -> bool:
+        with self._lock:
+            return bool((self.get_used_letters_bitmask() | self._reserved_letters_bitmask) & letter_to_bit(letter))
+
+    def get_free_letters(self) -> list[str]:
+        taken = self.get_taken_letters_bitmask()
+        return [letter for i, letter in enumerate(ALL_LETTERS) if not taken & (1 << i)]
+
+    def reserve_letter(self, letter: str) -> bool:
+        """
+        Atomically claims a letter for a mount that is about to start.
+        :return: False if the letter is already used or claimed by another mount
+        """
+        with self._lock:
+            if self.is_letter_used(letter):
+                return False
+            self._reserved_letters_bitmask |= letter_to_bit(letter)
+            return True
+
+    def reserve_letters(self, bitmask: int, taken_bitmask: int) -> bool:
+        """
+        Atomically claims all letters of the bitmask - or none of them.
+        :param taken_bitmask: what get_taken_letters_bitmask() returned when the letters were chosen
+        :return: False if the taken letters have changed since then
+        """
+        with self._lock:
+            if self.get_taken_letters_bitmask() != taken_bitmask:
+                return False
+            self._reserved_letters_bitmask |= bitmask
+            return True
+
+    def reserve_last_free_letter(self) -> str | None:
+        """
+        Atomically claims the last free letter (Z, Y, X...) so two concurrent mounts never get the same one.
+        :return: the letter or None if every letter is taken
+        """
+        with self._lock:
+            free_letters = self.get_free_letters()
+            if not free_letters:
+                return None
+            letter = free_letters[-1]
+            self._reserved_letters_bitmask |= letter_to_bit(letter)
+            return letter
+
+    def release_letter(self, letter: str) -> None:
+        with self._lock:
+            self._reserved_letters_bitmask &= ~letter_to_bit(letter)
+
+    def find_mount(self, ip: str, share: str) -> str | None:
+        """
+        :return: The letter that share is mounted at, ' ' if connected without a letter, None if not connected
+        """
+        with self._lock:
+            self._ensure_fresh()
+            # Windows host and share names are case-insensitive
+            share = share.lower()
+            for connection in self._connections_by_host.get(ip.lower(), ()):
+                if connection.share.lower() == share:
+                    return connection.letter or ' '
+        return None
+
+    def get_host_for_letter(self, letter: str) -> str:
+        """
+        :return: the host of the connection at that letter - '' if there isn't one
+        """
+        with self._lock:
+            self._ensure_fresh()
+            letter = letter.upper()
+            for connection in self._connections:
+                if connection.letter == letter:
+                    return connection.host
+        return ''
+
+    def get_letters_for_ip(self, ip: str) -> list[str]:
+        with self._lock:
+            self._ensure_fresh()
+            return [c.letter for c in self._connections_by_host.get(ip.lower(), ()) if c.letter]
+
+    def get_letters_by_host(self) -> dict[str, list[str]]:
+        """
+        :return: {lower case host: [letters]} - for all hosts from one snapshot
+        """
+        with self._lock:
+            self._ensure_fresh()
+            return {host: [c.letter for c in connections if c.letter]
+                    for host, connections in self._connections_by_host.items()}
+
+    def get_section_for_letter(self, letter: str) -> str | None:
+        """
+        :return: the section that mounted the letter - None if it wasn't mounted by this app or the letter
+                 is now connected to something else
+        """
+        with self._lock:
+            owner = self._owners.get(letter.upper())
+            if owner is None:
+                return None
+            self._ensure_fresh()
+            section, host, share = owner
+            for connection in self._connections_by_host.get(host, ()):
+                if connection.letter.upper() == letter.upper() and connection.share.lower() == share:
+                    return section
+            return None
+
+    def get_sections_by_letter(self) -> dict[str, str]:
+        """ {letter: section} for all the letters get_section_for_letter() knows """
+        with self._lock:
+            sections = {}
+            for letter in list(self._owners):
+                section = self.get_section_for_letter(letter)
+                if section is not None:
+                    sections[letter] = section
+            return sections
+
+    def add_mount(self, letter: str, ip: str, share: str, section: str | None = None) -> None:
+        """
+        :param section: the section the share was mounted for
+        """
+        with self._lock:
+            self.release_letter(letter)
+            if section is not None:
+                self._owners[letter.upper()] = (section, ip.lower(), share.lower())
+            else:
+                self._owners.pop(letter.upper(), None)
+            if self._loaded_at is None:
+                # Nothing to update - the next read will load the real state anyway.
+                return
+            letter = letter.upper()
+            connection = NetUseConnection('OK', letter, ip, share, '')
+            self._connections.append(connection)
+            self._connections_by_host.setdefault(ip.lower(), []).append(connection)
+            self._used_letters_bitmask |= letter_to_bit(letter)
+
+    def add_connection(self, ip: str, share: str) -> None:
+        """ A connection without a letter (\\\\host\\IPC$) was made """
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            connection = NetUseConnection('OK', '', ip, share, '')
+            self._connections.append(connection)
+            self._connections_by_host.setdefault(ip.lower(), []).append(connection)
+
+    def remove_connection(self, ip: str, share: str) -> None:
+        """ A connection without a letter was deleted """
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._connections = [c for c in self._connections if c.letter or c.host.lower() != ip.lower()
+                                 or c.share.lower() != share.lower()]
+            self._index_connections()
+
+    def remove_letter(self, letter: str) -> None:
+        with self._lock:
+            self._owners.pop(letter.upper(), None)
+            if self._loaded_at is None:
+                return
+            letter = letter.upper()
+            self._connections = [c for c in self._connections if c.letter != letter]
+            self._index_connections()
+            self._used_letters_bitmask &= ~letter_to_bit(letter)
@@ -0,0 +1,131 @@
+import re
+from typing import Iterable, Iterator
+
+# \\host\share - the share may contain spaces, it ends at the column of the provider
+UNC_PATTERN = re.compile(r'\\\\[^\\\s]+\\')
+# A long status can run into the letter column: 'Non disponibleX:'
+LETTER_PATTERN = re.compile(r'([A-Za-z]):(?=\s|$)')
+SEPARATOR_PATTERN = re.compile(r'^-{10,}\s*$')
+WORD_PATTERN = re.compile(r'\S+')
+# Width of the 'Remote' column when it can't be read from the header
+DEFAULT_REMOTE_COLUMN_WIDTH = 26
+# Statuses of a connection that is remembered but doesn't work - English, German, French
+DEAD_STATUSES = ('disconnected', 'unavailable', 'reconnecting', 'getrennt', 'nicht verfügbar', 'déconnecté',
+                 'non disponible')
+
+
+class NetUseConnection:
+    """ One row of the 'net use' listing """
+    __slots__ = ('status', 'letter', 'host', 'share', 'provider')
+
+    def __init__(self, status: str, letter: str, host: str, share: str, provider: str):
+        self.status = status
+        # '' when the connection has no drive letter (\\host\IPC$...)
+        self.letter = letter
+        self.host = host
+        self.share = share
+        self.provider = provider
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, NetUseConnection) and self.as_tuple() == other.as_tuple()
+
+    def __repr__(self) -> str:
+        return f"NetUseConnection{self.as_tuple()}"
+
+    @property
+    def is_dead(self) -> bool:
+        return self.status.lower() in DEAD_STATUSES
+
+    def as_tuple(self) -> tuple[str, str, str, str, str]:
+        return self.status, self.letter, self.host, self.share, self.provider
+
+    def as_dict(self) -> dict:
+        """ The format SMB used before the parser - letter is ' ' when there isn't one """
+        return {'letter': self.letter or ' ', 'ip': self.host, 'share': self.share}
+
+
+def parse_net_use(lines: Iterable[bytes | str], encoding: str = 'utf-8') -> Iterator[NetUseConnection]:
+    """
+    Parses the output of 'net use' line by line, as it comes from the process.
+    Doesn't depend on the language of the headers and messages: a row is any line with a \\\\host\\share path.
+    - the text before the path is the status (can be blank) and the drive letter (optional)
+    - the text after the 'Remote' column is the provider. When the path is too long Windows moves the
+      provider to the next (indented) line.
+    Lines that can't be parsed are skipped.
+    """
+    remote_column_width = DEFAULT_REMOTE_COLUMN_WIDTH
+    previous_line = ''
+    pending: NetUseConnection | None = None
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode(encoding, errors='replace')
+        line = line.rstrip('\r\n')
+
+        unc = UNC_PATTERN.search(line)
+        if unc is None:
+            if pending is not None:
+                if line[:1].isspace() and line.strip():
+                    # Continuation line of a wrapped row
+                    pending.provider = line.strip()
+                    yield pending
+                    pending = None
+                    continue
+                yield pending
+                pending = None
+            if SEPARATOR_PATTERN.match(line):
+                remote_column_width = _get_remote_column_width(previous_line) or remote_column_width
+            if line.strip():
+                previous_line = line
+            continue
+
+        if pending is not None:
+            yield pending
+            pending = None
+
+        prefix = line[:unc.start()]
+        letter_match = None
+        for letter_match in LETTER_PATTERN.finditer(prefix):
+            pass
+        if letter_match is not None:
+            letter = letter_match.group(1).upper()
+            status = prefix[:letter_match.start()].strip()
+        else:
+            letter = ''
+            status = prefix.strip()
+
+        remote, provider = _split_remote_and_provider(line[unc.start():], remote_column_width)
+        host, _, share = remote[2:].partition('\\')
+        if not host or not share:
+            continue
+        connection = NetUseConnection(status, letter, host, share, provider)
+        if provider:
+            yield connection
+        else:
+            pending = connection
+
+    if pending is not None:
+        yield pending
+
+
+def _split_remote_and_provider(text: str, remote_column_width: int) -> tuple[str, str]:
+    """
+    :param text: the row from the start of the \\\\host\\share path
+    """
+    if len(text) > remote_column_width and text[remote_column_width - 1] == ' ' \
+            and not text[remote_column_width].isspace():
+        return text[:remote_column_width].rstrip(), text[remote_column_width:].strip()
+    # The path filled the column - the provider is on the next line (or is separated by 2+ spaces)
+    parts = re.split(r'\s{2,}', text.strip(), maxsplit=1)
+    return parts[0], parts[1] if len(parts) > 1 else ''
+
+
+def _get_remote_column_width(header: str) -> int | None:
+    """
+    The header is 'Status  Local  Remote  Network' in the language of Windows - if it's 4 words the width of the
+    'Remote' column is the distance between the 3rd and the 4th word.
+    """
+    words = list(WORD_PATTERN.finditer(header))
+    if len(words) != 4:
+        return None
+    return words[3].start() - words[2].start()
@@ -0,0 +1,119 @@
+import threading
+import time
+from typing import Callable
+
+from Logger import MyLogger
+from SMB import is_success_message
+from Stats import STATS
+
+
+class NotificationAggregator:
+    """
+    Batches the results of the actions into as few toasts as possible. A bulk mount or a reconcile pass would
+    otherwise queue a toast per share, and Windows shows them one after the other for minutes.
+    The results that arrive within `window` seconds of the first one are shown in one toast - a line per group
+    (section or host). Two toasts are at least `min_interval` seconds apart - what arrives meanwhile waits for
+    the next one. Every result is logged in full, the toast only has the start of it.
+    """
+
+    def __init__(self, notify: Callable[[str], None], window: float = 1.0, min_interval: float = 5.0,
+                 max_characters: int = 256, clock: Callable[[], float] = time.monotonic):
+        """
+        :param notify: shows one toast - icon.notify in the tray, list.append in a test
+        :param clock: the window and min_interval are measured with it
+        """
+        self.logger = MyLogger("Notifier")
+        self.notify = notify
+        self.window = window
+        self.min_interval = min_interval
+        self.max_characters = max_characters
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        # {group: [msg, ...]} - in the order the groups first showed up
+        self._pending: dict[str, list[str]] = {}
+        self._timer: threading.Timer | None = None
+        self._last_sent = float('-inf')
+        self._is_closed = False
+
+    def add(self, group: str, msg: str) -> None:
+        """ Queues the result of an action - it's shown by the next toast """
+        self.logger.info("[%s] %s", group, msg)
+        STATS.count('notification results')
+        with self._lock:
+            if self._is_closed:
+                return
+            self._pending.setdefault(group, []).append(msg)
+            if self._timer is None:
+                self._schedule(self.window)
+
+    def _schedule(self, delay: float) -> None:
+        """ The lock must be held """
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def flush(self, force: bool = False) -> bool:
+        """
+        Shows the pending results as one toast - unless the last toast is too recent, then it's scheduled.
+        :param force: show it even if the last toast is too recent
+        :return: True if a toast was shown
+        """
+        with self._lock:
+            if not self._pending:
+                return False
+            wait = self._last_sent + self.min_interval - self.clock()
+            if wait > 0 and not force:
+                if self._timer is None and not self._is_closed:
+                    self._schedule(wait)
+                return False
+            pending = self._pending
+            self._pending = {}
+            self._last_sent = self.clock()
+        summary = self.summarize(pending)
+        STATS.count('notifications')
+        try:
+            self.notify(summary)
+        except Exception as e:
+            self.logger.error("Could not show the notification: %s", e)
+        return True
+
+    def summarize(self, pending: dict[str, list[str]]) -> str:
+        """
+        A single result is shown as it is. Otherwise a line per group - how many succeeded and the start of
+        each failure, so a long run of successes can't push a failure out of the toast:
+            [NAS] 11/12 OK. Error while mounting letter N: System error 53 has occurred.
+        """
+        results = [msg for messages in pending.values() for msg in messages]
+        if len(results) == 1:
+            summary = results[0]
+        else:
+            lines = []
+            for group, messages in pending.items():
+                failures = [self._get_headline(msg) for msg in messages if not is_success_message(msg)]
+                line = f"[{group}] {len(messages) - len(failures)}/{len(messages)} OK."
+                lines.append(f"{line} {'; '.join(failures)}" if failures else line)
+            summary = '\n'.join(lines)
+        if len(summary) > self.max_characters:
+            suffix = "... (see the log)"
+            summary = summary[:self.max_characters - len(suffix)] + suffix
+        return summary
+
+    @staticmethod
+    def _get_headline(msg: str) -> str:
+        """ The first two lines - 'Error while mounting letter N:' says what, the 'net use' error says why """
+        return ' '.join([line.strip() for line in msg.splitlines() if line.strip()][:2])
+
+    def close(self) -> None:
+        """ Drops what is still pending - it's in the log already """
+        with self._lock:
+            self._is_closed = True
+            self._pending = {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
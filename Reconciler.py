@@ -0,0 +1,150 @@
+import functools
+import random
+import threading
+import time
+from typing import Callable
+
+from Logger import MyLogger
+from NetUseParser import NetUseConnection
+from SMB import SMB
+from Stats import STATS
+
+
+class HostBackoff:
+    __slots__ = ('failures', 'retry_at')
+
+    def __init__(self, failures: int, retry_at: float):
+        # Passes that failed in a row
+        self.failures = failures
+        self.retry_at = retry_at
+
+
+class Reconciler:
+    """
+    Keeps the shares of the 'autoconnect = yes' sections mounted - after a NAS reboot or a dropped network.
+    Every `interval` seconds the shares in the config are compared with one 'net use' listing: the dead connections
+    of these shares are removed and the missing shares are mounted. Nothing else is touched.
+    A host that fails is left alone for `backoff` seconds - doubled with every failure up to max_backoff,
+    +-jitter so hosts that failed together are not retried together.
+    """
+
+    def __init__(self, smb: SMB, interval: float = 60.0, backoff: float = 30.0, max_backoff: float = 900.0,
+                 jitter: float = 0.2, clock: Callable[[], float] = time.monotonic):
+        self.logger = MyLogger("Reconciler")
+        self.smb = smb
+        self.interval = interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.clock = clock
+
+        self._backoffs: dict[str, HostBackoff] = {}
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="Reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        # The first pass runs right away - it's the autoconnect at startup
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            try:
+                self.reconcile()
+            except Exception as e:
+                self.logger.error("Reconcile failed: %s", e)
+            # A pass is started at most once per interval, no matter how long the last one took
+            self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def is_backing_off(self, host: str, now: float | None = None) -> bool:
+        backoff = self._backoffs.get(host.lower())
+        return backoff is not None and (now if now is not None else self.clock()) < backoff.retry_at
+
+    def _get_delay(self, failures: int) -> float:
+        delay = min(self.backoff * 2 ** (failures - 1), self.max_backoff)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _on_host_done(self, host: str, is_ok: bool) -> None:
+        if is_ok:
+            if self._backoffs.pop(host, None) is not None:
+                self.logger.info("%s is back", host)
+            return
+        failures = self._backoffs[host].failures + 1 if host in self._backoffs else 1
+        delay = self._get_delay(failures)
+        self._backoffs[host] = HostBackoff(failures, self.clock() + delay)
+        self.logger.warning("%s failed %s time(s) in a row - next try in %.0f s", host, failures, delay)
+
+    @staticmethod
+    def _get_alive_shares(connections: list[NetUseConnection]) -> set[tuple[str, str]]:
+        return {(connection.host.lower(), connection.share.lower()) for connection in connections
+                if not connection.is_dead}
+
+    def reconcile(self) -> tuple[int, int]:
+        """
+        One pass - a single 'net use' listing, then only the difference is fixed.
+        Hosts are compared in lower case, like 'net use' does.
+        :return: number of dead connections removed, number of shares mounted
+        """
+        section_names = self.smb.my_conf.get_autoconnect_section_names()
+        if not section_names:
+            return 0, 0
+
+        now = self.clock()
+        # {(lower case host, lower case share): (section, share)}
+        desired: dict[tuple[str, str], tuple[str, str]] = {}
+        for section_name in section_names:
+            record = self.smb.my_conf.get_section(section_name)
+            for share in record.shares:
+                desired.setdefault((record.ip.lower(), share.lower()), (section_name, share))
+
+        with STATS.span('reconcile'):
+            self.smb.mount_state.refresh()
+            connections = self.smb.mount_state.get_connections()
+
+            dead = [connection for connection in connections
+                    if connection.is_dead and connection.letter
+                    and (connection.host.lower(), connection.share.lower()) in desired
+                    and not self.is_backing_off(connection.host, now)]
+            # A dead connection is only removed when its host answers - the letter stays until it can be remounted
+            reachable = {connection.host for connection in dead if self.smb.is_host_reachable(connection.host)}
+            dead = [connection for connection in dead if connection.host in reachable]
+            self.smb.bulk_executor.run(
+                [(connection.host, functools.partial(self.smb.unmount_smb_letter, connection.letter))
+                 for connection in dead])
+
+            mounted = self._get_alive_shares(connections)
+            missing = [key for key in desired if key not in mounted]
+            hosts = {host for host, _ in missing}
+            skip_hosts = {host for host in hosts if self.is_backing_off(host, now)}
+            missing = [key for key in missing if key[0] not in skip_hosts]
+            if not missing:
+                return len(dead), 0
+
+            self.logger.info("%s share(s) to mount: %s", len(missing),
+                             ', '.join(f"\\\\{host}\\{share}" for host, share in missing))
+            # Only the missing shares are planned - not the healthy ones of the same sections
+            only = {desired[key] for key in missing}
+            plan = self.smb.plan_mounts(list(dict.fromkeys(desired[key][0] for key in missing)),
+                                        skip_hosts=skip_hosts, refresh=False, only=only)
+            self.smb.run_plan(plan)
+
+            mounted = self._get_alive_shares(self.smb.mount_state.get_connections())
+            is_mounted = {key: key in mounted for key in missing}
+            is_host_ok: dict[str, bool] = {}
+            for (host, _), is_ok in is_mounted.items():
+                is_host_ok[host] = is_host_ok.get(host, True) and is_ok
+            for host, is_ok in is_host_ok.items():
+                self._on_host_done(host, is_ok)
+            mounted_count = sum(is_mounted.values())
+            STATS.count('reconnects', mounted_count)
+        return len(dead), mounted_count
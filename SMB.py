@@ -1,78 +1,179 @@
+import collections
 import configparser
-import string
-import subprocess
-import ctypes
+import functools
+import time
+from typing import Container, Iterable, Iterator
+from BulkExecutor import BulkExecutor
+from CircuitBreaker import CircuitBreaker, is_host_error
+from CommandRunner import CommandRunner, NetUseRunner, is_timeout_message
 from Config import Config
+from ConfigDiff import SectionChange, plan_remounts
+from HostProber import HostProber
+from LetterPlanner import ALREADY_MOUNTED, PREFERRED_LETTER_TAKEN, LetterPlan, PlannedMount, plan_letters
 from Logger import MyLogger
+from MountState import MountState
+from NetUseParser import NetUseConnection, parse_net_use
+from Sessions import SessionManager
+from Stats import STATS, timed
+
+# Every notification msg of an action that worked starts with one of these - 'Success: Drive letter M...',
+# 'All [3] drives mounted successfully.'
+SUCCESS_PREFIXES = ('Success', 'All [')
+
+
+def is_success_message(msg: str) -> bool:
+    """ A share that is already mounted at another letter is a success too - there's nothing left to do """
+    return msg.startswith(SUCCESS_PREFIXES) or ' - already mounted at ' in msg
 
 
 class SMB:
-    def __init__(self, config_file_name):
+    def __init__(self, config: Config, max_workers: int = 8, max_workers_per_host: int = 4,
+                 runner: CommandRunner | None = None, host_prober: HostProber | None = None,
+                 circuit_breaker: CircuitBreaker | None = None, use_sessions: bool = False):
+        """
+        :param config: shared with the caller - a reload of it is seen here too
+        :param use_sessions: authenticate once per host (IPC$) and mount the shares without credentials
+        """
         self.logger = MyLogger("SMB")
-        self.config_file = config_file_name
-        self.my_conf = Config(self.config_file)
-        config = configparser.ConfigParser()
-        config.read(self.config_file)
+        # Every 'net use' goes through the runner - pass FakeNetUseRunner() to run without Windows.
+        self.runner = runner if runner is not None else NetUseRunner()
+        # Optional - when set, shares on hosts that don't answer on the SMB port are not mounted at all.
+        self.host_prober = host_prober
+        # No commands are sent to a host that timed out or was unreachable too many times in a row
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.my_conf = config
+        self.config_file = config.config_file
 
         self.MAX_NUMBER_OF_CHARACTERS_IN_TRAY_NOTIFICATION = 256
 
-    def mount_smb(self, host_ip: str, username: str, password: str, share_name: str, letter: str) -> str:
+        # One 'net use' listing is shared by all the methods below until it expires or a mount/unmount changes it.
+        self.mount_state = MountState(self.list_connections, self._get_used_drive_letters_bitmask)
+        # Used by Mount All / Unmount All to run the 'net use' calls concurrently.
+        self.bulk_executor = BulkExecutor(max_workers, max_workers_per_host)
+        self.sessions = SessionManager(self._run_command, self.mount_state,
+                                       self.runner.encoding) if use_sessions else None
+
+    @timed('mount_smb')
+    def mount_smb(self, host_ip: str, username: str, password: str, share_name: str, letter: str,
+                  is_letter_reserved: bool = False, section: str | None = None) -> str:
         """
         # This method will unmount a letter if is already mounted and will re-mount it by execute something like:
         # net use p: \\192.168.1.100\downloads /user: my_username my_password
+        :param is_letter_reserved: True if the letter has already been claimed with get_last_free_letter()
+        :param section: the section the share is mounted for - a config reload remounts only its own letters
         """
 
-        self.logger.info(
-            f"Attempting to mount {host_ip}\{share_name} using user: {username} to {letter.upper()}: drive")
+        self.logger.info("Attempting to mount %s\\%s using user: %s to %s: drive", host_ip, share_name, username,
+                         letter.upper())
+
+        if not self.is_host_reachable(host_ip):
+            if is_letter_reserved:
+                self.mount_state.release_letter(letter)
+            msg = f"{host_ip} is not reachable - {share_name} not mounted."
+            self.logger.warning(msg)
+            return msg
 
         is_mounted = self.is_already_mounted(host_ip, share_name)
         if is_mounted[0]:
+            if is_letter_reserved:
+                self.mount_state.release_letter(letter)
             return f"\\{host_ip}\\{share_name} - already mounted at {is_mounted[1]}"
 
-        if not self.is_drive_letter_free(letter):
+        # Claim the letter atomically - another worker of a bulk operation might be after the same one.
+        if not is_letter_reserved and not self.mount_state.reserve_letter(letter):
             # It's possible that the preferred letter is already mounted
             # Will not mount at another letter - because it might be important to be the correct one.
             msg = f"Drive letter {letter.upper()} - already mounted."
             self.logger.info(msg)
             return msg
 
-        mount_smb_cmd = f'net use {letter}: \\\\{host_ip}\\{share_name} /user:{username} {password}'
-        process = subprocess.Popen(mount_smb_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
+        return self._run_mount(host_ip, username, password, share_name, letter, section)
 
-        stdout = stdout.decode('utf-8')
-        stderr = stderr.decode('utf-8')
+    def _run_mount(self, host_ip: str, username: str, password: str, share_name: str, letter: str,
+                   section: str | None = None) -> str:
+        """
+        Runs 'net use' without any checks. The letter must be reserved - it's released (or marked as used) here,
+        even if the command can't be run at all.
+        """
+        try:
+            return self._mount(host_ip, username, password, share_name, letter, section)
+        except Exception as e:
+            msg = f"Error while mounting letter {letter.upper()}: \n{e}"
+            self.logger.error(msg)
+            self.mount_state.release_letter(letter)
+            self.mount_state.invalidate()
+            if self.sessions is not None:
+                self.sessions.release(host_ip, letter)
+            return msg[:self.MAX_NUMBER_OF_CHARACTERS_IN_TRAY_NOTIFICATION]
+
+    def _mount(self, host_ip: str, username: str, password: str, share_name: str, letter: str,
+               section: str | None) -> str:
+        """
+        With sessions the credentials go to the session of the host only - the share is mounted without them.
+        """
+        if self.sessions is None:
+            mount_smb_cmd = f'net use {letter}: \\\\{host_ip}\\{share_name} /user:{username} {password}'
+        else:
+            stderr = self.sessions.acquire(host_ip, username, password, letter)
+            if stderr:
+                msg = (f"Error while connecting to {host_ip} as {username}: \n"
+                       f"{stderr.decode(self.runner.encoding, 'replace')}")
+                self.logger.error(msg)
+                self.mount_state.release_letter(letter)
+                return msg[:self.MAX_NUMBER_OF_CHARACTERS_IN_TRAY_NOTIFICATION]
+            mount_smb_cmd = f'net use {letter}: \\\\{host_ip}\\{share_name}'
+        stdout, stderr = self._run_command(mount_smb_cmd, 'net use mount', host_ip)
+
+        stdout = stdout.decode(self.runner.encoding, 'replace')
+        stderr = stderr.decode(self.runner.encoding, 'replace')
 
         if stderr:
             msg = f"Error while mounting letter {letter.upper()}: \n{stderr}"
             self.logger.error(msg)
+            self.mount_state.release_letter(letter)
+            self.mount_state.invalidate()
         elif stdout:
             msg = f"Success: Drive letter {letter.upper()} - mounted: \n{stdout}"
             self.logger.info(msg)
+            self.mount_state.add_mount(letter, host_ip, share_name, section)
         else:
             # Not sure if this will ever happen
             msg = f"stdout: {stdout} \n stderr: {stderr}"
             self.logger.error(msg)
+            self.mount_state.release_letter(letter)
+            self.mount_state.invalidate()
+        if self.sessions is not None and (stderr or not stdout):
+            self.sessions.release(host_ip, letter)
 
         return msg[:self.MAX_NUMBER_OF_CHARACTERS_IN_TRAY_NOTIFICATION]
 
+    @timed('mount_smb_section')
     def mount_smb_section(self, section_name: str, share_name_position: int) -> str:
         ip = self.my_conf.get_ip_for_section(section_name)
         username = self.my_conf.get_username_for_section(section_name)
         password = self.my_conf.get_password_for_section(section_name)
         share_name = self.my_conf.get_shares_for_section(section_name)[share_name_position]
         letter = self.get_chosen_letter_for_section(section_name, share_name_position)
+        if letter is None:
+            msg = f"No free drive letter left to mount {share_name}."
+            self.logger.error(msg)
+            return msg
+        # A letter that isn't the preferred one comes from get_last_free_letter() and is already reserved.
+        is_letter_reserved = self.get_preferred_letter_for_section_if_one(section_name, share_name_position) is None
 
-        return self.mount_smb(ip, username, password, share_name, letter)
+        return self.mount_smb(ip, username, password, share_name, letter, is_letter_reserved, section_name)
 
-    def is_drive_letter_free(self, letter: str) -> bool:
-        if letter in self.get_free_drive_letters():
+    def is_host_reachable(self, host_ip: str) -> bool:
+        if self.host_prober is None:
             return True
-        return False
+        return self.host_prober.is_reachable(host_ip)
+
+    def is_drive_letter_free(self, letter: str) -> bool:
+        return not self.mount_state.is_letter_used(letter)
 
-    def get_chosen_letter_for_section(self, section_name: str, position: int) -> str:
+    def get_chosen_letter_for_section(self, section_name: str, position: int) -> str | None:
         """
-        :return: The preferred letter if that letter is available OR a free letter if not
+        :return: The preferred letter if there is one OR a free (reserved) letter if not
         """
         preferred_letter = self.get_preferred_letter_for_section_if_one(section_name, position)
         if preferred_letter:
@@ -100,10 +201,9 @@ class SMB:
         """
         Checks if that exact share is already mounted.
         """
-        all_mounts = self.get_all_mounted_letters_for_ip_dict()
-        for mount in all_mounts:
-            if mount['ip'] == ip and mount['share'] == share:
-                return True, mount['letter']
+        letter = self.mount_state.find_mount(ip, share)
+        if letter is not None:
+            return True, letter
         return False, ''
 
     def mount_all_smb(self, section_name: str) -> str:
@@ -111,91 +211,260 @@ class SMB:
         Mounts all shares from the selected section
         :return: Notification msg
         """
-        all_shares_names_count = len(self.my_conf.get_shares_for_section(section_name))
-        failed_mounts = []
-        for i in range(all_shares_names_count):
-            result = self.mount_smb_section(section_name, i)
-            if not result.startswith('Success'):
-                failed_mounts.append(self.my_conf.get_shares_for_section(section_name)[i])
+        return self.mount_sections([section_name])
+
+    def mount_all_sections(self) -> str:
+        """
+        Mounts all shares from all sections in the config file
+        :return: Notification msg
+        """
+        return self.mount_sections(self.my_conf.get_all_section_names())
+
+    @timed('plan_mounts')
+    def plan_mounts(self, section_names: list[str] | tuple[str, ...], skip_hosts: Iterable[str] = (),
+                    refresh: bool = True, only: Container[tuple[str, str]] | None = None) -> LetterPlan:
+        """
+        Chooses the letters of all shares of the sections at once, from a single 'net use' listing.
+        The letters of the plan are reserved - _run_mount() releases them.
+        :param skip_hosts: the shares on these hosts are skipped without probing them
+        :param refresh: False to plan from the current snapshot (if it's not stale)
+        :param only: (section, share) pairs - the other shares of the sections are left out of the plan
+        """
+        skip_hosts = {host.lower() for host in skip_hosts}
+        if refresh:
+            self.mount_state.refresh()
+        while True:
+            mounts = [PlannedMount(section_name, position, self.my_conf.get_ip_for_section(section_name), share_name,
+                                   self.my_conf.get_username_for_section(section_name),
+                                   self.get_preferred_letter_for_section_if_one(section_name, position))
+                      for section_name in section_names
+                      for position, share_name in enumerate(self.my_conf.get_shares_for_section(section_name))
+                      if only is None or (section_name, share_name) in only]
+
+            for mount in mounts:
+                missing_fields = self.my_conf.get_section(mount.section).missing_fields
+                if missing_fields:
+                    mount.skip_reason = f"missing {', '.join(missing_fields)}"
+                elif mount.host.lower() in skip_hosts:
+                    mount.skip_reason = f"{mount.host} is skipped"
+                elif self.circuit_breaker.is_open(mount.host):
+                    mount.skip_reason = f"{mount.host} failed too many times - circuit open"
+            if self.host_prober is not None:
+                hosts = [mount.host for mount in mounts if mount.skip_reason is None]
+                reachable = self.host_prober.probe_all(hosts)
+                for mount in mounts:
+                    if mount.skip_reason is None and not reachable[mount.host]:
+                        mount.skip_reason = f"{mount.host} is not reachable"
+
+            taken_bitmask = self.mount_state.get_taken_letters_bitmask()
+            plan = plan_letters(mounts, taken_bitmask, self.mount_state.get_connections())
+            # Another operation might have reserved letters meanwhile - plan again if it did
+            if self.mount_state.reserve_letters(plan.letters_bitmask, taken_bitmask):
+                break
+
+        for mount in plan.skipped:
+            if mount.skip_reason.startswith(PREFERRED_LETTER_TAKEN):
+                # Most likely taken by the other section - say which one
+                others = [section for section in self.my_conf.get_sections_for_letter(mount.preferred_letter)
+                          if section != mount.section]
+                if others:
+                    mount.skip_reason += f" - also preferred by {', '.join(f'[{section}]' for section in others)}"
+        self._log_skipped(plan.skipped)
+        return plan
+
+    # The most frequent skip reasons in the summary of a plan - every share is logged at debug level
+    MAX_SKIP_REASONS_IN_LOG = 5
+
+    def _log_skipped(self, skipped: list[PlannedMount]) -> None:
+        """ One line for the whole plan - the shares that are already mounted are not a problem """
+        if not skipped:
+            return
+        for mount in skipped:
+            self.logger.debug("Not mounting %s\\%s [%s]: %s", mount.host, mount.share, mount.section,
+                              mount.skip_reason)
+        reasons = collections.Counter(mount.skip_reason for mount in skipped
+                                      if not mount.skip_reason.startswith(ALREADY_MOUNTED))
+        if not reasons:
+            self.logger.debug("%s share(s) already mounted", len(skipped))
+            return
+        summary = '; '.join(f"{reason} ({count})" for reason, count in
+                            reasons.most_common(self.MAX_SKIP_REASONS_IN_LOG))
+        if len(reasons) > self.MAX_SKIP_REASONS_IN_LOG:
+            summary += f"; {len(reasons) - self.MAX_SKIP_REASONS_IN_LOG} other reasons"
+        self.logger.warning("Not mounting %s share(s): %s", sum(reasons.values()), summary)
+
+    @timed('mount_sections')
+    def mount_sections(self, section_names: list[str] | tuple[str, ...]) -> str:
+        """
+        Mounts the shares of the sections following one letter plan - the system isn't scanned between the mounts.
+        :return: Notification msg
+        """
+        plan = self.plan_mounts(section_names)
+        to_mount = plan.to_mount
+        results = self.run_plan(plan)
+
+        mounted = {id(mount) for mount, result in zip(to_mount, results) if is_success_message(result)}
+        failed = [mount for mount in plan.mounts if id(mount) not in mounted]
+        if len(section_names) == 1:
+            failed_mounts = [mount.share for mount in failed]
+        else:
+            failed_mounts = [f"{mount.share} [{mount.section}]" for mount in failed]
+
+        all_shares_names_count = len(plan.mounts)
         if len(failed_mounts) == 0:
             return f'All [{all_shares_names_count}] drives mounted successfully.'
         else:
             return f'Not all [{all_shares_names_count}] drives mounted successfully. Failed mounts: {", ".join(failed_mounts)}'
 
+    def run_plan(self, plan: LetterPlan) -> list[str]:
+        """
+        Mounts the shares of the plan that weren't skipped - concurrently.
+        :return: the msg of every mount - in the order of plan.to_mount
+        """
+        return self.bulk_executor.run([(mount.host, functools.partial(self._run_planned_mount, mount))
+                                       for mount in plan.to_mount])
+
+    def _run_planned_mount(self, mount: PlannedMount) -> str:
+        """ The credentials are read now - the section might have been removed since the plan was made """
+        try:
+            username = self.my_conf.get_username_for_section(mount.section)
+            password = self.my_conf.get_password_for_section(mount.section)
+        except configparser.NoSectionError:
+            self.mount_state.release_letter(mount.letter)
+            msg = f"[{mount.section}] is not in the config anymore - {mount.share} not mounted."
+            self.logger.warning(msg)
+            return msg
+        return self._run_mount(mount.host, username, password, mount.share, mount.letter, mount.section)
+
+    @timed('remount_changed_shares')
+    def remount_changed_shares(self, changes: list[SectionChange]) -> str:
+        """
+        After a reload: unmounts only the shares whose host, credentials or letter changed and mounts them again.
+        :return: Notification msg
+        """
+        self.mount_state.refresh()
+        planned, unclaimed = plan_remounts(changes, self.mount_state.get_connections(),
+                                           self.mount_state.get_sections_by_letter(), self.my_conf.sections)
+        for remount in unclaimed:
+            self.logger.warning("Not remounting %s: (%s) for [%s] - %s", remount.letter, remount.share,
+                                remount.section, remount.reason)
+        remounts = []
+        for remount in planned:
+            # Moving to a letter that is taken would only lose the current one
+            if remount.new_letter and self.mount_state.is_letter_used(remount.new_letter):
+                self.logger.warning("Not moving %s [%s] to %s: - the letter is used", remount.share, remount.section,
+                                    remount.new_letter)
+                continue
+            self.logger.info("Remounting %s [%s] at %s: - %s", remount.share, remount.section, remount.letter,
+                             remount.reason)
+            remounts.append(remount)
+        if not remounts:
+            return "Success. Config reloaded - no connected share needs to be mounted again."
+
+        unmounted = self.bulk_executor.run(
+            [(remount.old_host, functools.partial(self.unmount_smb_letter, remount.letter)) for remount in remounts])
+        remounts = [remount for remount, result in zip(remounts, unmounted) if is_success_message(result)]
+        only = {(remount.section, remount.share) for remount in remounts}
+        plan = self.plan_mounts(list(dict.fromkeys(remount.section for remount in remounts)), only=only)
+        results = self.run_plan(plan)
+
+        mounted = {(mount.section, mount.share) for mount, result in zip(plan.to_mount, results)
+                   if is_success_message(result)}
+        failed = [f"{share} [{section}]" for section, share in only if (section, share) not in mounted]
+        if failed or len(unmounted) != len(remounts):
+            return (f"Config reloaded - [{len(mounted)}/{len(unmounted)}] changed shares mounted again. "
+                    f"Failed: {', '.join(failed) or '-'}")
+        return f"Success. Config reloaded - [{len(mounted)}] changed shares mounted again."
+
+    @timed('unmount_smb_letter')
     def unmount_smb_letter(self, letter: str) -> str:
-        self.logger.info(f"Attempting to unmount drive {letter.upper()}:")
+        self.logger.info("Attempting to unmount drive %s:", letter.upper())
 
         if self.is_drive_letter_free(letter):
             msg = f"Drive letter {letter.upper()} - not mounted."
             self.logger.warning(msg)
             return msg
 
-        process = subprocess.Popen(f"net use {letter}: /del", shell=True, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
+        host = self.mount_state.get_host_for_letter(letter)
+        stdout, stderr = self._run_command(f"net use {letter}: /del", 'net use unmount', host)
 
-        stdout = stdout.decode('utf-8')
-        stderr = stderr.decode('utf-8')
+        stdout = stdout.decode(self.runner.encoding, 'replace')
+        stderr = stderr.decode(self.runner.encoding, 'replace')
 
         if stderr:
             msg = f"Error while unmounting letter {letter.upper()}: \n{stderr}"
             self.logger.error(msg)
+            self.mount_state.invalidate()
         elif stdout:
             msg = f"Success: Drive letter {letter.upper()} - unmounted: \n{stdout}"
             self.logger.info(msg)
+            self.mount_state.remove_letter(letter)
+            if self.sessions is not None and host:
+                self.sessions.release(host, letter)
         else:
             # Not sure if this will ever happen
             msg = f"stdout: {stdout} \n stderr: {stderr}"
             self.logger.error(msg)
+            self.mount_state.invalidate()
         return msg[:self.MAX_NUMBER_OF_CHARACTERS_IN_TRAY_NOTIFICATION]
 
     def get_free_drive_letters(self) -> list[str]:
-        used_letters = self._get_used_drive_letters()
-        all_letters = list(string.ascii_uppercase)
-        diff = set(used_letters).symmetric_difference(set(all_letters))
-        diff.remove('A')
-        diff.remove('B')
-        return list(sorted(diff))
+        return self.mount_state.get_free_letters()
 
-    def get_last_free_letter(self) -> str:
-        return self.get_free_drive_letters()[-1]
+    def get_last_free_letter(self) -> str | None:
+        """
+        The letter is reserved for the caller, so concurrent callers never get the same one.
+        It's released when the mount finishes (or with self.mount_state.release_letter()).
+        """
+        return self.mount_state.reserve_last_free_letter()
 
+    @timed('unmount_all_smb_for_ip')
     def unmount_all_smb_for_ip(self, host_ip: str) -> str:
         all_mounted_letters_on_server = self.get_all_mounted_letters_for_ip(host_ip)
-        failed_to_unmount = []
-        for letter in all_mounted_letters_on_server:
-            result = self.unmount_smb_letter(letter)
-            if not result.startswith('Success'):
-                failed_to_unmount.append(letter)
+        results = self.bulk_executor.run(
+            [(host_ip, functools.partial(self.unmount_smb_letter, letter)) for letter in all_mounted_letters_on_server])
+        failed_to_unmount = [letter for letter, result in zip(all_mounted_letters_on_server, results)
+                             if not is_success_message(result)]
         if failed_to_unmount:
             return f"Some drives failed to unmount: {', '.join(failed_to_unmount)}"
         else:
             return f"Success. All {len(all_mounted_letters_on_server)} drives unmounted successfully."
 
+    @timed('unmount_all_smb')
     def unmount_all_smb(self) -> str:
         all_ip = self.get_all_ip_from_all_sections()
+        self.mount_state.refresh()
+        letters_by_host = self.mount_state.get_letters_by_host()
+        # One flat list of (ip, letter) jobs - so the letters of all hosts are unmounted at the same time.
+        ip_letters = [(ip, letter) for ip in all_ip for letter in letters_by_host.get(ip.lower(), ())]
+        results = self.bulk_executor.run(
+            [(ip, functools.partial(self.unmount_smb_letter, letter)) for ip, letter in ip_letters])
         failed_to_unmount = []
-        for ip in all_ip:
-            result = self.unmount_all_smb_for_ip(ip)
-            if not result.startswith('Success'):
+        for (ip, _), result in zip(ip_letters, results):
+            if not is_success_message(result) and ip not in failed_to_unmount:
                 failed_to_unmount.append(ip)
         if failed_to_unmount:
             return f"Some drives failed to unmount for IP: {', '.join(failed_to_unmount)}"
         else:
             return f"Success. All connections unmounted successfully."
 
+    @timed('unmount_every_connection')
     def unmount_every_connection_not_only_the_ones_in_conf(self) -> str:
         """
         Removes all SMB network connections on that machine. Nothing to do with this app. ALL.
         :return: Notification msg
         """
-        self.logger.info(f"Attempting to unmount all connections")
+        self.logger.info("Attempting to unmount all connections")
         cmd = "net use * /delete /yes"
-        process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
+        stdout, stderr = self._run_command(cmd, 'net use delete all')
 
-        stdout = stdout.decode('utf-8')
-        stderr = stderr.decode('utf-8')
+        stdout = stdout.decode(self.runner.encoding, 'replace')
+        stderr = stderr.decode(self.runner.encoding, 'replace')
+
+        # Whatever the outcome - the snapshot doesn't reflect the connections anymore.
+        self.mount_state.invalidate()
+        if self.sessions is not None and not stderr:
+            self.sessions.forget_all()
 
         if stderr:
             msg = f"Error - could not unmount all connections: \n{stderr}"
@@ -210,58 +479,67 @@ class SMB:
         return msg[:self.MAX_NUMBER_OF_CHARACTERS_IN_TRAY_NOTIFICATION]
 
     def get_all_ip_from_all_sections(self) -> list[str]:
-        return list(set(self.my_conf.get_all_sections_ip()))
+        return list(self.my_conf.sections_for_host)
 
-    @staticmethod
-    def _get_used_drive_letters() -> list[str]:
+    def _run_command(self, command: str, operation: str, host: str = '') -> tuple[bytes, bytes]:
         """
-        :return: list of all used drive letters - local + network drives
+        Runs the command under the runner's deadline. The outcome of a command for a host feeds its circuit breaker.
         """
-        drive_bitmask = ctypes.windll.kernel32.GetLogicalDrives()
-        drive_letters = [chr(i + ord('A')) for i in range(26) if drive_bitmask & (1 << i)]
-        return drive_letters
+        if host and not self.circuit_breaker.allow(host):
+            STATS.count('circuit rejections')
+            msg = f"{host} failed too many times - no commands are sent to it for now " \
+                  f"(circuit {self.circuit_breaker.get_description(host)})."
+            self.logger.warning(msg)
+            return b'', msg.encode()
+
+        with STATS.span(operation, host) as span:
+            try:
+                stdout, stderr = self.runner.run(command)
+            except Exception:
+                if host:
+                    self.circuit_breaker.record_failure(host)
+                raise
+            span.is_ok = not stderr
+        if host:
+            if is_timeout_message(stderr) or is_host_error(stderr):
+                self.circuit_breaker.record_failure(host)
+            else:
+                # Any other answer - even a wrong password - means the host is there
+                self.circuit_breaker.record_success(host)
+        return stdout, stderr
+
+    def _get_used_drive_letters_bitmask(self) -> int:
+        """
+        :return: bitmask of all used drive letters - local + network drives. Bit 0 = A:
+        """
+        with STATS.span('drive letters'):
+            return self.runner.get_used_drive_letters_bitmask()
 
-    @staticmethod
-    def get_all_mounted_letters_for_ip(host_ip: str) -> list[str]:
-        mount_smb_cmd = f'net use'
-        process = subprocess.Popen(mount_smb_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, _ = process.communicate()
-
-        rows = stdout.decode('utf-8').split('\r\n')
-        ignored_start_strings = ['New connections', 'Status', '-------', 'The command']
-        mounted_letters = []
-        for row in rows:
-            if row and (not any(row.startswith(prefix) for prefix in ignored_start_strings)):
-
-                # At this point all extra rows have been removed. Should work without removing these too.
-                # OK           Z:        \\192.168.1.6\downloads   Microsoft Windows Network
-                # OK                     \\192.168.1.6\IPC$        Microsoft Windows Network
-                # There might be rows without mounted letter
-
-                letter = row.split(':')[0].split()[1].strip()
-                if len(letter) == 1:
-                    ip = row.split('\\\\')[1].split('\\')[0]
-                    if ip == host_ip:
-                        mounted_letters.append(letter)
-
-        return mounted_letters
+    def get_all_mounted_letters_for_ip(self, host_ip: str) -> list[str]:
+        return self.mount_state.get_letters_for_ip(host_ip)
+
+    @timed('list_connections')
+    def list_connections(self) -> list[NetUseConnection]:
+        """
+        Runs 'net use' and parses its output while it's being printed.
+        """
+        waited = [0.0]
+        start = time.perf_counter()
+        connections = list(parse_net_use(self._time_lines(self.runner.run_lines('net use'), waited),
+                                          self.runner.encoding))
+        # The time not spent waiting for the process is the time of the parser
+        STATS.record('net use list', '', waited[0])
+        STATS.record('parse net use', '', time.perf_counter() - start - waited[0])
+        return connections
 
     @staticmethod
-    def get_all_mounted_letters_for_ip_dict() -> list[dict]:
-        mount_smb_cmd = f'net use'
-        process = subprocess.Popen(mount_smb_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, _ = process.communicate()
-
-        rows = stdout.decode('utf-8').split('\r\n')
-        ignored_start_strings = ['New connections', 'Status', '-------', 'The command', 'There are no']
-        data = []
-        for row in rows:
-            if row and (not any(row.startswith(prefix) for prefix in ignored_start_strings)):
-                letter = ' '
-                path = row.split('\\\\')[1].split()[0].strip()
-                ip = path.split('\\')[0]
-                share = path.split('\\')[1]
-                if ":" in row:
-                    letter = row.split(':')[0].split()[1].strip()
-                data.append({'letter': letter, 'ip': ip, 'share': share})
-        return data
+    def _time_lines(lines: Iterable[bytes], waited: list[float]) -> Iterator[bytes]:
+        """ Adds the time spent waiting for each line to waited[0] """
+        iterator = iter(lines)
+        while True:
+            start = time.perf_counter()
+            line = next(iterator, None)
+            waited[0] += time.perf_counter() - start
+            if line is None:
+                return
+            yield line
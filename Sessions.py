@@ -0,0 +1,115 @@
+import threading
+from typing import Callable
+
+from Logger import MyLogger
+from MountState import MountState
+from Stats import STATS
+
+SESSION_SHARE = 'IPC$'
+
+
+class HostSession:
+    __slots__ = ('host', 'username', 'is_adopted', 'letters')
+
+    def __init__(self, host: str, username: str, is_adopted: bool):
+        self.host = host
+        self.username = username
+        # Connected before - by the user or an earlier run. It's not the app's to disconnect.
+        self.is_adopted = is_adopted
+        # The letters mounted through the session - it's torn down when the last one is unmounted
+        self.letters: set[str] = set()
+
+
+class SessionManager:
+    """
+    One authenticated connection per host (to its IPC$ share) instead of one per share: the NAS checks the
+    credentials once, and the shares are mounted without a user and a password - Windows reuses the session.
+    Windows allows one user per server, so a host has at most one session.
+    Only the letters mounted through a session count - shares that were connected before are left alone.
+    """
+
+    def __init__(self, run_command: Callable[[str, str, str], tuple[bytes, bytes]], mount_state: MountState,
+                 encoding: str = 'utf-8'):
+        """
+        :param run_command: (command, operation, host) -> stdout, stderr - SMB._run_command()
+        :param mount_state: an IPC$ that is already connected is adopted, not connected again.
+                            The sessions connected and disconnected here are updated in it.
+        :param encoding: of the output of the commands - CommandRunner.encoding
+        """
+        self.logger = MyLogger("Sessions")
+        self.run_command = run_command
+        self.mount_state = mount_state
+        self.encoding = encoding
+
+        self._lock = threading.Lock()
+        # {lower case host: HostSession}
+        self._sessions: dict[str, HostSession] = {}
+        # A lock per host - the mounts of a host wait for its session, the other hosts don't
+        self._host_locks: dict[str, threading.Lock] = {}
+
+    def _get_host_lock(self, host: str) -> threading.Lock:
+        with self._lock:
+            return self._host_locks.setdefault(host.lower(), threading.Lock())
+
+    def acquire(self, host: str, username: str, password: str, letter: str) -> bytes:
+        """
+        Connects the session of the host if there isn't one, and counts the letter as mounted through it.
+        Release the letter if the mount fails.
+        :return: stderr of the session command - b'' if the session is there
+        """
+        with self._get_host_lock(host):
+            session = self._sessions.get(host.lower())
+            if session is not None and session.username.lower() != username.lower():
+                return f"{host} is already connected as {session.username} - " \
+                       f"Windows allows one user per server.".encode()
+            if session is None:
+                is_adopted = self.mount_state.find_mount(host, SESSION_SHARE) is not None
+                if is_adopted:
+                    self.logger.info("Adopting the session to %s", host)
+                else:
+                    _, stderr = self.run_command(f'net use \\\\{host}\\{SESSION_SHARE} /user:{username} {password}',
+                                                 'net use session', host)
+                    if stderr:
+                        self.logger.error("Could not connect the session to %s as %s: %s", host, username,
+                                          stderr.decode(self.encoding, 'replace'))
+                        return stderr
+                    STATS.count('sessions')
+                    self.mount_state.add_connection(host, SESSION_SHARE)
+                    self.logger.info("Session to %s as %s connected", host, username)
+                session = self._sessions[host.lower()] = HostSession(host, username, is_adopted)
+            session.letters.add(letter.upper())
+            return b''
+
+    def release(self, host: str, letter: str) -> None:
+        """ Disconnects the session when the last letter mounted through it is released """
+        with self._get_host_lock(host):
+            session = self._sessions.get(host.lower())
+            if session is None or letter.upper() not in session.letters:
+                return
+            session.letters.discard(letter.upper())
+            if session.letters:
+                return
+            del self._sessions[host.lower()]
+            if session.is_adopted:
+                self.logger.info("Leaving the adopted session to %s connected", session.host)
+                return
+            _, stderr = self.run_command(f'net use \\\\{session.host}\\{SESSION_SHARE} /del', 'net use session',
+                                         session.host)
+            if stderr:
+                self.logger.warning("Could not disconnect the session to %s: %s", session.host,
+                                    stderr.decode(self.encoding, 'replace'))
+                self.mount_state.invalidate()
+            else:
+                self.mount_state.remove_connection(session.host, SESSION_SHARE)
+                self.logger.info("Session to %s disconnected", session.host)
+
+    def get_references(self, host: str) -> int:
+        """ Number of letters mounted through the session of the host """
+        with self._lock:
+            session = self._sessions.get(host.lower())
+            return len(session.letters) if session is not None else 0
+
+    def forget_all(self) -> None:
+        """ After 'net use * /delete' - the sessions are gone with everything else """
+        with self._lock:
+            self._sessions.clear()
@@ -0,0 +1,175 @@
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from typing import Iterator
+
+from CommandRunner import (IS_WINDOWS, CommandRunner, NetUseRunner, get_console_encoding,
+                           get_new_process_group_kwargs, get_timeout_message, kill_process_tree)
+from Logger import MyLogger
+
+
+class ShellWorker:
+    """
+    One long-lived shell (cmd.exe or /bin/sh) that executes commands written to its stdin.
+    The output of every command is framed with a unique marker echoed to stdout and stderr after it.
+    """
+
+    def __init__(self):
+        self.logger = MyLogger("ShellWorker")
+        self.marker = f"__ATTACHMYNAS_{uuid.uuid4().hex}__"
+        # cmd.exe reads its stdin in the OEM code page - the same one its output is in
+        self.encoding = get_console_encoding()
+        if IS_WINDOWS:
+            args = ['cmd.exe', '/Q']
+            self._newline = "\r\n"
+        else:
+            args = ['/bin/sh']
+            self._newline = "\n"
+
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        **get_new_process_group_kwargs())
+        self._stdout_lines = queue.Queue()
+        self._stderr_lines = queue.Queue()
+        for stream, lines in ((self.process.stdout, self._stdout_lines), (self.process.stderr, self._stderr_lines)):
+            threading.Thread(target=self._read_lines, args=(stream, lines), daemon=True).start()
+
+    @staticmethod
+    def _read_lines(stream, lines: queue.Queue) -> None:
+        for line in iter(stream.readline, b''):
+            lines.put(line)
+        # EOF - the shell is gone
+        lines.put(None)
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def start(self, timeout: float) -> None:
+        """ Swallows whatever the shell prints when it starts (cmd.exe banner...) """
+        self.execute('', timeout)
+
+    def execute(self, command: str, timeout: float) -> tuple[bytes, bytes, int]:
+        """
+        :param timeout: seconds the whole command can take - stdout and stderr included
+        :return: stdout, stderr, exit code
+        :raises TimeoutError: the command didn't finish in time - the worker must be killed
+        :raises ConnectionError: the shell died
+        :raises UnicodeEncodeError: the command has a character the console code page doesn't have
+        """
+        if IS_WINDOWS:
+            framed = f"{command} < NUL\r\necho {self.marker}%ERRORLEVEL%\r\necho {self.marker} 1>&2\r\n"
+        else:
+            framed = f"{command} < /dev/null\necho {self.marker}$?\necho {self.marker} >&2\n"
+        if not command:
+            framed = framed.split(self._newline, 1)[1]
+
+        try:
+            self.process.stdin.write(framed.encode(self.encoding))
+            self.process.stdin.flush()
+        except OSError as e:
+            raise ConnectionError(f"Shell is not running: {e}")
+
+        deadline = time.monotonic() + timeout
+        stdout, exit_code = self._read_until_marker(self._stdout_lines, deadline, timeout)
+        stderr, _ = self._read_until_marker(self._stderr_lines, deadline, timeout)
+        return stdout, stderr, int(exit_code or 0)
+
+    def _read_until_marker(self, lines: queue.Queue, deadline: float, timeout: float) -> tuple[bytes, str]:
+        """
+        :param deadline: time.monotonic() by which the marker must have come
+        :param timeout: only for the message
+        """
+        marker = self.marker.encode()
+        output = []
+        while True:
+            try:
+                line = lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise TimeoutError(f"The command didn't finish in {timeout} seconds")
+            if line is None:
+                raise ConnectionError("Shell exited")
+            position = line.find(marker)
+            if position == -1:
+                output.append(line)
+                continue
+            # Output that didn't end with a new line is in front of the marker
+            output.append(line[:position])
+            return b''.join(output), line[position + len(marker):].strip().decode()
+
+    def kill(self) -> None:
+        """ Kills the shell and the command it's running """
+        kill_process_tree(self.process)
+        try:
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+
+class PersistentShellRunner(NetUseRunner):
+    """
+    Runs the commands in a pool of long-lived shells instead of starting a new shell for every command.
+    A worker that crashes or hangs (timeout) is killed with its command and replaced by a new one.
+    spawn_count is the number of shells started - not the number of commands.
+    """
+
+    def __init__(self, pool_size: int = 2, timeout: float = 60.0):
+        super().__init__(timeout)
+        self.logger = MyLogger("ShellRunner")
+        self.commands_count = 0
+
+        self._workers = queue.Queue()
+        for _ in range(max(1, pool_size)):
+            self._workers.put(None)  # Started on first use
+
+    def _start_worker(self) -> ShellWorker:
+        self._count_spawn()
+        worker = ShellWorker()
+        try:
+            worker.start(self.timeout)
+        except (TimeoutError, ConnectionError):
+            # The shell is running - it's not in the pool yet, nothing else would kill it
+            worker.kill()
+            raise
+        self.logger.info("Shell worker started - pid %s", worker.process.pid)
+        return worker
+
+    def run(self, command: str) -> tuple[bytes, bytes]:
+        worker = self._workers.get()
+        with self._spawn_count_lock:
+            self.commands_count += 1
+        try:
+            if worker is None or not worker.is_alive():
+                worker = self._start_worker()
+            stdout, stderr, _ = worker.execute(command, self.timeout)
+            return stdout, stderr
+        except TimeoutError:
+            self._count_timeout(command)
+            if worker is not None:
+                worker.kill()
+            # A new shell is started by the next command
+            worker = None
+            return b'', get_timeout_message(self.timeout)
+        except ConnectionError as e:
+            msg = f"Command failed in the shell worker: {e}"
+            self.logger.error(msg)
+            if worker is not None:
+                worker.kill()
+            worker = None
+            return b'', msg.encode()
+        except UnicodeEncodeError as e:
+            msg = f"The command can't be written in the console code page {self.encoding}: {e}"
+            self.logger.error(msg)
+            return b'', msg.encode()
+        finally:
+            self._workers.put(worker)
+
+    def run_lines(self, command: str) -> Iterator[bytes]:
+        # The output is framed by the worker - it can't be streamed
+        return CommandRunner.run_lines(self, command)
+
+    def close(self) -> None:
+        while not self._workers.empty():
+            worker = self._workers.get_nowait()
+            if worker is not None:
+                worker.kill()
@@ -0,0 +1,183 @@
+import collections
+import contextlib
+import functools
+import json
+import math
+import threading
+import time
+from typing import Callable, Iterator
+
+from Logger import MyLogger
+
+# 4 buckets per power of 2 - a percentile is accurate to ~10%
+BUCKETS_PER_OCTAVE = 4
+
+
+class LatencyHistogram:
+    """ Log-scale histogram of durations - constant memory no matter how many values are added """
+    __slots__ = ('buckets', 'count', 'total')
+
+    def __init__(self):
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float) -> None:
+        microseconds = max(seconds * 1_000_000, 1.0)
+        bucket = int(math.log2(microseconds) * BUCKETS_PER_OCTAVE)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, percent: float) -> float:
+        """
+        :return: seconds - the middle of the bucket the percentile falls in
+        """
+        if not self.count:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 2 ** ((bucket + 0.5) / BUCKETS_PER_OCTAVE) / 1_000_000
+        return 0.0
+
+
+class Span:
+    """ Set is_ok to False if the operation failed without raising """
+    __slots__ = ('operation', 'host', 'is_ok')
+
+    def __init__(self, operation: str, host: str):
+        self.operation = operation
+        self.host = host
+        self.is_ok = True
+
+
+class Stats:
+    """
+    Timings and counters of the app - kept in memory.
+    Every timing goes in a histogram per operation and per host, and in a ring of the last `capacity` samples
+    that can be dumped to a JSON-lines file.
+    """
+
+    def __init__(self, capacity: int = 4096, metrics_file: str | None = None):
+        self.logger = MyLogger("Stats")
+        self.metrics_file = metrics_file
+        self._lock = threading.Lock()
+        self._samples = collections.deque(maxlen=capacity)
+        self._operations: dict[str, LatencyHistogram] = {}
+        self._hosts: dict[str, LatencyHistogram] = {}
+        self._counters: collections.Counter = collections.Counter()
+
+    def record(self, operation: str, host: str, seconds: float, is_ok: bool = True) -> None:
+        with self._lock:
+            self._samples.append((time.time(), operation, host, seconds, is_ok))
+            self._operations.setdefault(operation, LatencyHistogram()).add(seconds)
+            if host:
+                self._hosts.setdefault(host, LatencyHistogram()).add(seconds)
+            if not is_ok:
+                self._counters['failures'] += 1
+
+    @contextlib.contextmanager
+    def span(self, operation: str, host: str = '') -> Iterator[Span]:
+        """
+            with STATS.span('net use', host_ip) as span:
+                ...
+                span.is_ok = False
+        """
+        span = Span(operation, host)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span.is_ok = False
+            raise
+        finally:
+            self.record(span.operation, span.host, time.perf_counter() - start, span.is_ok)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """ Counters: spawns, failures, timeouts... """
+        with self._lock:
+            self._counters[name] += value
+
+    def get_counters(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def get_percentiles(self, by_host: bool = False) -> dict[str, tuple[int, float, float]]:
+        """
+        :return: {operation or host: (count, p50 seconds, p95 seconds)}
+        """
+        with self._lock:
+            histograms = self._hosts if by_host else self._operations
+            return {name: (histogram.count, histogram.percentile(50), histogram.percentile(95))
+                    for name, histogram in histograms.items()}
+
+    def get_distributions(self, percents: tuple[float, ...] = (50, 90, 99),
+                          by_host: bool = False) -> dict[str, tuple[int, float, tuple[float, ...]]]:
+        """
+        :return: {operation or host: (count, mean seconds, (seconds at each percent...))}
+        """
+        with self._lock:
+            histograms = self._hosts if by_host else self._operations
+            return {name: (histogram.count, histogram.total / histogram.count if histogram.count else 0.0,
+                           tuple(histogram.percentile(percent) for percent in percents))
+                    for name, histogram in histograms.items()}
+
+    def reset(self) -> None:
+        """ Forgets everything - the benchmarks measure each scenario on its own """
+        with self._lock:
+            self._samples.clear()
+            self._operations.clear()
+            self._hosts.clear()
+            self._counters.clear()
+
+    def get_summary(self) -> str:
+        lines = []
+        for title, by_host in (("Hosts", True), ("Operations", False)):
+            percentiles = self.get_percentiles(by_host)
+            if percentiles:
+                lines.append(f"{title}:")
+            for name, (count, p50, p95) in sorted(percentiles.items()):
+                lines.append(f"  {name}: n={count} p50={p50 * 1000:.0f}ms p95={p95 * 1000:.0f}ms")
+        counters = self.get_counters()
+        if counters:
+            lines.append(', '.join(f"{name}: {value}" for name, value in sorted(counters.items())))
+        return '\n'.join(lines) if lines else "No stats yet."
+
+    def dump(self, file_name: str | None = None) -> int:
+        """
+        Appends the samples in the ring to a JSON-lines file and empties the ring.
+        :return: number of samples written
+        """
+        file_name = file_name or self.metrics_file
+        if not file_name:
+            return 0
+        with self._lock:
+            samples = list(self._samples)
+            self._samples.clear()
+        with open(file_name, 'a') as file:
+            for timestamp, operation, host, seconds, is_ok in samples:
+                file.write(json.dumps({'time': round(timestamp, 3), 'operation': operation, 'host': host,
+                                       'ms': round(seconds * 1000, 3), 'ok': is_ok}) + '\n')
+        self.logger.info("%s samples written to %s", len(samples), file_name)
+        return len(samples)
+
+
+# The stats of the app - like the logging, one for everything
+STATS = Stats()
+
+
+def timed(operation: str) -> Callable:
+    """ Decorator - records how long every call of the function takes """
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with STATS.span(operation):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,75 @@
+import threading
+from typing import Callable
+
+from Logger import MyLogger
+from SMB import SMB
+
+
+class StatusCache:
+    """
+    Where every share is mounted - for the menu. Reading it never runs 'net use'.
+    A background thread refreshes it every `interval` seconds and when request_refresh() is called (after an action).
+    After an action the SMB snapshot is already up to date, so that refresh costs no 'net use' either.
+    on_change() is called when something changed - the tray rebuilds its menu then.
+    """
+
+    def __init__(self, smb: SMB, interval: float = 15.0, on_change: Callable[[], None] | None = None):
+        self.logger = MyLogger("StatusCache")
+        self.smb = smb
+        self.interval = interval
+        self.on_change = on_change
+
+        # {(lower case host, lower case share): letter} - ' ' when connected without a letter. Replaced, never changed.
+        self._letters: dict[tuple[str, str], str] = {}
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="StatusCache", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def request_refresh(self) -> None:
+        self._wake_event.set()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error("Refresh failed: %s", e)
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+
+    def refresh(self) -> bool:
+        """
+        Reads the SMB snapshot - it runs 'net use' only if the snapshot is stale.
+        :return: True if something changed
+        """
+        letters = {(c.host.lower(), c.share.lower()): c.letter or ' '
+                   for c in self.smb.mount_state.get_connections() if not c.is_dead}
+        if letters == self._letters:
+            return False
+        self._letters = letters
+        if self.on_change is not None:
+            self.on_change()
+        return True
+
+    def get_letter(self, host: str, share: str) -> str | None:
+        """
+        :return: the letter the share is mounted at, ' ' if connected without a letter, None if not connected
+        """
+        return self._letters.get((host.lower(), share.lower()))
+
+    def is_mounted(self, host: str, share: str) -> bool:
+        return self.get_letter(host, share) is not None
@@ -0,0 +1,58 @@
+import socket
+
+import pytest
+
+from FakeNetUse import FakeNetUseRunner
+from MountState import MountState
+from NetUseParser import parse_net_use
+
+
+@pytest.fixture
+def runner():
+    return FakeNetUseRunner()
+
+
+@pytest.fixture
+def mount_state(runner):
+    """ A snapshot of the fake 'net use' - it's only reloaded by refresh() and invalidate() """
+    def list_connections():
+        stdout, _ = runner.run('net use')
+        return list(parse_net_use(stdout.splitlines(keepends=True)))
+
+    return MountState(list_connections, runner.get_used_drive_letters_bitmask, ttl=3600)
+
+
+@pytest.fixture
+def write_config(tmp_path):
+    """ write_config(text) -> the path of an App.conf with that text """
+    def write(text: str) -> str:
+        path = tmp_path / 'App.conf'
+        path.write_text(text)
+        return str(path)
+
+    return write
+
+
+class FakeClock:
+    """ time.monotonic() that only moves when a test moves it - clock.now += 5 """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def listening_port():
+    """ A local port that accepts connections - the SMB port of a host that is up """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    yield server.getsockname()[1]
+    server.close()
@@ -1,8 +1,14 @@
-from App import Tray
+import sys
 
 if __name__ == '__main__':
-    app = Tray()
-    app.run_app()
+    if '--daemon' in sys.argv[1:]:
+        # No tray - mount/unmount/status/reload requests come from Client.py
+        from Daemon import run_daemon
+        run_daemon()
+    else:
+        from App import Tray
+        app = Tray()
+        app.run_app()
     # pyinstaller --clean -y --add-data="App.conf;." --add-data="logo.png;." --noconsole main.py
     # pyinstaller --clean -y --add-data="app.conf;." --add-data="logo.png;." --hidden-import main.py --noconsole main.py
     # pyinstaller --clean -y --add-data="app.conf;." --add-data="logo.png;." --hidden-import main.py --noconsole --name AttachMyNAS main.py
\ No newline at end of file
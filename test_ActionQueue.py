@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from ActionQueue import ActionQueue
+
+
+@pytest.fixture
+def queue():
+    action_queue = ActionQueue(max_workers=1)
+    yield action_queue
+    action_queue.shutdown()
+
+
+class Results:
+    """ on_done of the actions - wait() returns when count results came """
+
+    def __init__(self):
+        self.msgs = []
+        self._condition = threading.Condition()
+
+    def __call__(self, msg: str) -> None:
+        with self._condition:
+            self.msgs.append(msg)
+            self._condition.notify_all()
+
+    def wait(self, count: int) -> list[str]:
+        with self._condition:
+            assert self._condition.wait_for(lambda: len(self.msgs) >= count, timeout=5)
+            return self.msgs
+
+
+def blocking_action(release: threading.Event, msg: str = 'done'):
+    def action() -> str:
+        release.wait(5)
+        return msg
+
+    return action
+
+
+def test_action_runs_and_reports(queue):
+    results = Results()
+    assert queue.submit(('mount', 'NAS'), lambda: 'mounted', results)
+    assert results.wait(1) == ['mounted']
+    assert not queue.is_in_flight(('mount', 'NAS'))
+
+
+def test_repeated_click_is_dropped(queue):
+    release = threading.Event()
+    results = Results()
+    assert queue.submit(('mount', 'NAS'), blocking_action(release, 'first'), results)
+    assert not queue.submit(('mount', 'NAS'), lambda: 'second', results)
+    assert queue.submit(('mount', 'Other'), lambda: 'other', results)
+
+    release.set()
+    assert sorted(results.wait(2)) == ['first', 'other']
+    # Finished - it can be queued again
+    assert queue.submit(('mount', 'NAS'), lambda: 'third', results)
+    assert results.wait(3)[-1] == 'third'
+
+
+def test_queued_action_can_be_cancelled(queue):
+    release = threading.Event()
+    results = Results()
+    queue.submit('running', blocking_action(release), results)
+    queue.submit('queued', lambda: 'never', results)
+
+    assert queue.cancel('queued')
+    # A running action is left to finish
+    assert not queue.cancel('running')
+    assert not queue.cancel('unknown')
+    assert not queue.is_in_flight('queued')
+
+    release.set()
+    assert results.wait(1) == ['done']
+
+
+def test_cancel_all(queue):
+    release = threading.Event()
+    results = Results()
+    queue.submit('running', blocking_action(release), results)
+    for i in range(3):
+        queue.submit(('queued', i), lambda: 'never', results)
+
+    assert queue.cancel_all() == 3
+    release.set()
+    assert results.wait(1) == ['done']
+
+
+def test_error_is_reported_as_msg(queue):
+    def fail() -> str:
+        raise OSError("net.exe not found")
+
+    results = Results()
+    queue.submit(('mount', 'NAS'), fail, results)
+    assert results.wait(1) == ["Error while running ('mount', 'NAS'): net.exe not found"]
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from BulkExecutor import BulkExecutor
+
+
+class ConcurrencyCounter:
+    """ A job that counts how many jobs of its host run at the same time """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running: dict[str, int] = {}
+        self.highest: dict[str, int] = {}
+
+    def job(self, host: str, result: str):
+        def run() -> str:
+            with self._lock:
+                self.running[host] = self.running.get(host, 0) + 1
+                self.highest[host] = max(self.highest.get(host, 0), self.running[host])
+            time.sleep(0.02)
+            with self._lock:
+                self.running[host] -= 1
+            return result
+
+        return host, run
+
+
+def test_results_are_in_the_order_of_the_jobs():
+    executor = BulkExecutor(max_workers=4)
+    jobs = [(f"host{i % 3}", lambda i=i: i) for i in range(10)]
+    assert executor.run(jobs) == list(range(10))
+
+
+def test_no_jobs():
+    assert BulkExecutor().run([]) == []
+
+
+def test_per_host_limit():
+    counter = ConcurrencyCounter()
+    executor = BulkExecutor(max_workers=8, max_workers_per_host=2)
+    jobs = [counter.job('nas', f"nas {i}") for i in range(6)] + [counter.job('other', f"other {i}") for i in range(6)]
+
+    results = executor.run(jobs)
+    assert results == [f"nas {i}" for i in range(6)] + [f"other {i}" for i in range(6)]
+    assert counter.highest == {'nas': 2, 'other': 2}
+
+
+def test_a_failing_job_does_not_drop_the_others():
+    def fail() -> str:
+        raise OSError("cannot start net.exe")
+
+    executor = BulkExecutor()
+    results = executor.run([('nas', lambda: 'first'), ('nas', fail), ('other', lambda: 'third')])
+    assert results == ['first', "Error on nas: cannot start net.exe", 'third']
+
+
+def test_single_failing_job_uses_on_error():
+    def fail() -> str:
+        raise ValueError("bad")
+
+    results = BulkExecutor().run([('nas', fail)], on_error=lambda host, e: (host, str(e)))
+    assert results == [('nas', 'bad')]
@@ -0,0 +1,86 @@
+import pytest
+
+from CircuitBreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, is_host_error
+
+HOST = 'NAS'
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, cooldown=30, clock=clock)
+
+
+def fail(breaker: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        breaker.record_failure(HOST)
+
+
+def test_opens_after_threshold_failures_in_a_row(breaker):
+    fail(breaker, 2)
+    assert breaker.get_state(HOST) == CLOSED
+    assert breaker.allow(HOST)
+    fail(breaker, 1)
+    assert breaker.get_state(HOST) == OPEN
+    assert not breaker.allow(HOST)
+    assert breaker.is_open(HOST)
+
+
+def test_success_resets_the_failures(breaker):
+    fail(breaker, 2)
+    breaker.record_success(HOST)
+    fail(breaker, 2)
+    assert breaker.get_state(HOST) == CLOSED
+
+
+def test_one_trial_after_the_cooldown(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 29
+    assert not breaker.allow(HOST)
+    clock.now += 1
+    assert not breaker.is_open(HOST)
+    assert breaker.allow(HOST)
+    assert breaker.get_state(HOST) == HALF_OPEN
+    # Only one command goes through while the trial runs
+    assert not breaker.allow(HOST)
+
+
+def test_successful_trial_closes_the_circuit(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 30
+    assert breaker.allow(HOST)
+    breaker.record_success(HOST)
+    assert breaker.get_state(HOST) == CLOSED
+    assert breaker.allow(HOST)
+
+
+def test_failed_trial_opens_the_circuit_again(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 30
+    assert breaker.allow(HOST)
+    fail(breaker, 1)
+    assert breaker.get_state(HOST) == OPEN
+    clock.now += 29
+    assert not breaker.allow(HOST)
+    assert breaker.get_description(HOST) == "open (1 s left)"
+
+
+def test_hosts_are_independent_and_case_insensitive(breaker):
+    fail(breaker, 3)
+    assert not breaker.allow(HOST.lower())
+    assert breaker.allow('Other-NAS')
+
+
+def test_description(breaker):
+    assert breaker.get_description(HOST) == CLOSED
+    fail(breaker, 1)
+    assert breaker.get_description(HOST) == "closed (1 failures)"
+
+
+@pytest.mark.parametrize('stderr, expected', [
+    (b"System error 53 has occurred.\r\n\r\nThe network path was not found.", True),
+    (b"Systemfehler 1231 aufgetreten.", True),
+    (b"System error 86 has occurred.\r\n\r\nThe specified network password is not correct.", False),
+    (b"", False),
+])
+def test_is_host_error(stderr, expected):
+    assert is_host_error(stderr) == expected
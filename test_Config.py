@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from Config import Config
+
+CONFIG = """
+[DEFAULT]
+password = shared-secret
+include = conf.d/*.conf
+
+[NAS]
+ip = 10.0.0.1
+username = user
+password = nas-secret  # the comment is stripped by SectionRecord
+shares = Movies
+
+[Work]
+ip = 10.0.0.2
+username = work
+Password: a=b:c
+shares = Documents
+
+[Backup]
+ip = 10.0.0.3
+username = backup
+shares = Backup
+"""
+
+
+@pytest.fixture
+def config_file(tmp_path, write_config):
+    (tmp_path / 'conf.d').mkdir()
+    (tmp_path / 'conf.d' / 'site.conf').write_text("[Site]\nip = 10.0.1.1\nusername = site\npassword = site-secret\n"
+                                                  "shares = Files\n")
+    return write_config(CONFIG)
+
+
+def get_passwords(config: Config) -> dict[str, str]:
+    return {name: config.get_password_for_section(name) for name in config.get_all_section_names()}
+
+
+PASSWORDS = {'NAS': 'nas-secret', 'Work': 'a=b:c', 'Backup': 'shared-secret', 'Site': 'site-secret'}
+
+
+def test_cache_has_no_passwords(config_file):
+    config = Config(config_file)
+    assert get_passwords(config) == PASSWORDS
+
+    with open(f"{config_file}.cache") as file:
+        cache_text = file.read()
+    assert not [password for password in PASSWORDS.values() if password in cache_text]
+    assert all(file['is_without_secrets'] for file in json.loads(cache_text)['files'].values())
+
+
+def test_passwords_are_read_again_when_the_cache_is_used(config_file, monkeypatch):
+    parsed = Config(config_file, use_cache=False).get_section('NAS').values
+    Config(config_file)
+    # A parse would fail - everything must come from the cache and the line scan
+    monkeypatch.setattr('configparser.ConfigParser.read', lambda *args, **kwargs: pytest.fail("parsed again"))
+    config = Config(config_file)
+    assert get_passwords(config) == PASSWORDS
+    assert config.get_section('NAS').values == parsed
+
+
+def test_changed_password_is_parsed(config_file):
+    Config(config_file)
+    with open(config_file, 'a') as file:
+        file.write("\n[New]\nip = 10.0.0.4\nusername = new\npassword = new-secret\nshares = New\n")
+    assert Config(config_file).get_password_for_section('New') == 'new-secret'
+
+
+def test_reload_keeps_the_passwords(config_file):
+    config = Config(config_file)
+    assert config.reload() == ([], [], [])
+    assert get_passwords(config) == PASSWORDS
+
+
+def test_letter_index_lists_the_sections_preferring_a_letter(write_config):
+    config = Config(write_config("[A]\nip = a\nshares = Movies, Music\nletters = M, n\n\n"
+                                 "[B]\nip = b\nshares = Media\nletters = M\n"), use_cache=False)
+    assert config.get_shares_for_letter('m') == (('A', 'Movies'), ('B', 'Media'))
+    assert config.get_sections_for_letter('M') == ('A', 'B')
+    assert config.get_sections_for_letter('N') == ('A',)
+    assert config.get_sections_for_letter('X') == ()
+
+
+def test_included_paths_while_the_config_file_is_gone(config_file, tmp_path):
+    config = Config(config_file)
+    # An editor replacing App.conf - the watcher asks for the paths in between
+    (tmp_path / 'App.conf').unlink()
+    assert config.get_watched_paths() == (config_file, str(tmp_path / 'conf.d' / 'site.conf'))
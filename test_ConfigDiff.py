@@ -0,0 +1,82 @@
+from Config import SectionRecord
+from ConfigDiff import ADDED, CREDENTIALS, HOST, LETTERS, OTHER, REMOVED, SHARES, diff_sections, plan_remounts
+from NetUseParser import NetUseConnection
+
+NAS = {'ip': 'nas', 'username': 'user', 'password': 'secret', 'shares': 'Movies, Music', 'letters': 'M, N'}
+
+
+def sections(**raw_sections: dict[str, str]) -> dict[str, SectionRecord]:
+    return {name: SectionRecord(name, values) for name, values in raw_sections.items()}
+
+
+def connected(host: str, *letters_and_shares: tuple[str, str]) -> list[NetUseConnection]:
+    return [NetUseConnection('OK', letter, host, share, 'Microsoft Windows Network')
+            for letter, share in letters_and_shares]
+
+
+def diff(old: dict[str, str], new: dict[str, str]) -> tuple:
+    changes = diff_sections(sections(NAS=old), sections(NAS=new))
+    return tuple(kind for change in changes for kind in change.kinds)
+
+
+def test_kind_of_each_change():
+    assert diff(NAS, NAS) == ()
+    assert diff(NAS, {**NAS, 'ip': 'nas2'}) == (HOST,)
+    assert diff(NAS, {**NAS, 'password': 'other'}) == (CREDENTIALS,)
+    assert diff(NAS, {**NAS, 'username': 'admin'}) == (CREDENTIALS,)
+    assert diff(NAS, {**NAS, 'letters': 'M, O'}) == (LETTERS,)
+    assert diff(NAS, {**NAS, 'shares': 'Movies', 'letters': 'M'}) == (SHARES,)
+    assert diff(NAS, {**NAS, 'autoconnect': 'yes'}) == (OTHER,)
+    # Only the comment changed
+    assert diff(NAS, {**NAS, 'ip': 'nas  # the NAS'}) == ()
+
+
+def test_added_and_removed_sections():
+    changes = diff_sections(sections(NAS=NAS), sections(Work={**NAS, 'ip': 'work'}))
+    assert [(change.section, change.kinds) for change in changes] == [('Work', (ADDED,)), ('NAS', (REMOVED,))]
+    assert not any(change.may_need_remount for change in changes)
+
+
+def plan(old: dict[str, str], new: dict[str, str], connections: list[NetUseConnection],
+         owners: dict[str, str] | None = None, others: dict[str, SectionRecord] | None = None) -> tuple:
+    new_sections = {**sections(NAS=new), **(others or {})}
+    changes = diff_sections({**sections(NAS=old), **(others or {})}, new_sections)
+    remounts, unclaimed = plan_remounts(changes, connections, owners or {}, new_sections)
+    return ([(r.share, r.letter, r.new_letter, r.reason) for r in remounts],
+            [(r.share, r.letter, r.reason) for r in unclaimed])
+
+
+def test_host_change_remounts_the_connected_shares():
+    assert plan(NAS, {**NAS, 'ip': 'nas2'}, connected('nas', ('M', 'Movies'))) == (
+        [('Movies', 'M', None, 'host nas -> nas2')], [])
+
+
+def test_credentials_change_remounts_the_connected_shares():
+    assert plan(NAS, {**NAS, 'password': 'other'}, connected('nas', ('M', 'Movies'), ('N', 'Music'))) == (
+        [('Movies', 'M', None, 'credentials changed'), ('Music', 'N', None, 'credentials changed')], [])
+
+
+def test_letter_change_moves_only_that_share():
+    assert plan(NAS, {**NAS, 'letters': 'M, O'}, connected('nas', ('M', 'Movies'), ('N', 'Music'))) == (
+        [('Music', 'N', 'O', 'letter N -> O')], [])
+
+
+def test_removed_share_and_section_stay_connected():
+    connections = connected('nas', ('M', 'Movies'), ('N', 'Music'))
+    assert plan(NAS, {**NAS, 'shares': 'Movies', 'letters': 'M'}, connections) == ([], [])
+
+    changes = diff_sections(sections(NAS=NAS), {})
+    assert plan_remounts(changes, connections, {}, {}) == ([], [])
+
+
+def test_connection_of_another_section_is_left_alone():
+    others = sections(Media={**NAS, 'shares': 'Movies', 'letters': 'V'})
+    assert plan(NAS, {**NAS, 'password': 'other'}, connected('nas', ('V', 'Movies')), owners={'V': 'Media'},
+                others=others) == ([], [])
+
+
+def test_connection_from_before_the_app_listed_by_several_sections_is_left_alone():
+    others = sections(Media={**NAS, 'shares': 'Movies', 'letters': 'V'})
+    # No owner - mounted before the app started
+    assert plan(NAS, {**NAS, 'password': 'other'}, connected('nas', ('V', 'Movies')), others=others) == (
+        [], [('Movies', 'V', 'owner unknown - listed by NAS, Media')])
@@ -0,0 +1,87 @@
+import os
+import time
+
+import pytest
+
+from ConfigWatcher import ConfigWatcher
+
+
+def wait_for(condition, timeout: float = 3.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / 'conf.d').mkdir()
+    main = tmp_path / 'App.conf'
+    main.write_text("[DEFAULT]\ninclude = conf.d/*.conf\n")
+    (tmp_path / 'conf.d' / 'a.conf').write_text("[A]\nip = 10.0.0.1\n")
+    return tmp_path
+
+
+@pytest.fixture(params=['events', 'polling'])
+def start_watcher(request, files, monkeypatch):
+    if request.param == 'polling':
+        monkeypatch.setattr(ConfigWatcher, '_get_inotify_waiter', lambda self: None)
+        monkeypatch.setattr(ConfigWatcher, '_get_windows_waiter', lambda self: None)
+    watchers = []
+
+    def start(on_change) -> ConfigWatcher:
+        watcher = ConfigWatcher(str(files / 'App.conf'), on_change, poll_interval=0.1, debounce=0.05,
+                                get_file_paths=lambda: sorted(str(path) for path in files.glob('conf.d/*.conf')))
+        watcher.start()
+        watchers.append(watcher)
+        return watcher
+
+    yield start
+    for watcher in watchers:
+        watcher.stop()
+
+
+def test_changed_included_file(files, start_watcher):
+    changes = []
+    start_watcher(changes.append)
+    # Another size - two writes in the same clock tick can have the same modification time
+    (files / 'conf.d' / 'a.conf').write_text("[A]\nip = 10.0.0.20\n")
+    assert wait_for(lambda: changes)
+    assert changes == [[str(files / 'conf.d' / 'a.conf')]]
+
+
+def test_added_and_removed_included_files(files, start_watcher):
+    changes = []
+    start_watcher(changes.append)
+    (files / 'conf.d' / 'b.conf').write_text("[B]\nip = 10.0.0.3\n")
+    assert wait_for(lambda: changes)
+    os.remove(files / 'conf.d' / 'a.conf')
+    assert wait_for(lambda: len(changes) == 2)
+    assert changes == [[str(files / 'conf.d' / 'b.conf')], [str(files / 'conf.d' / 'a.conf')]]
+
+
+def test_same_content_is_not_a_change(files, start_watcher):
+    changes = []
+    start_watcher(changes.append)
+    main = files / 'App.conf'
+    main.write_text(main.read_text())
+    os.utime(main, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    time.sleep(0.5)
+    assert changes == []
+
+
+def test_events_check_only_after_a_change(files, monkeypatch):
+    watcher = ConfigWatcher(str(files / 'App.conf'), lambda paths: None, poll_interval=0.05)
+    if watcher._get_inotify_waiter() is None:
+        pytest.skip("no inotify")
+    checks = []
+    monkeypatch.setattr(watcher, '_check', lambda: checks.append(1))
+    watcher.start()
+    try:
+        time.sleep(0.3)
+        # Only the check when the watch starts - the poll interval doesn't wake it
+        assert checks == [1]
+        (files / 'App.conf').write_text("[DEFAULT]\n")
+        assert wait_for(lambda: len(checks) == 2)
+    finally:
+        watcher.stop()
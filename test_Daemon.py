@@ -0,0 +1,105 @@
+import functools
+
+import pytest
+
+import Client
+import Daemon
+from Config import Config
+from HostProber import HostProber
+
+CONFIG = """
+[NAS]
+ip = 127.0.0.1
+username = user
+password = secret
+shares = Movies, Music
+letters = M, N
+"""
+
+
+@pytest.fixture
+def token_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'daemon.token')
+    monkeypatch.setattr(Client, 'get_token_file_path', lambda: path)
+    monkeypatch.setattr(Daemon, 'get_token_file_path', lambda: path)
+    return path
+
+
+@pytest.fixture
+def daemon(write_config, runner, listening_port, token_file, monkeypatch):
+    daemon = Daemon.Daemon(write_config(CONFIG), port=0, runner=runner,
+                           host_prober=HostProber(port=listening_port), autoconnect_interval=3600)
+    daemon.start()
+    # main() talks to the port of this daemon
+    monkeypatch.setattr(Client, 'send', functools.partial(Client.send, port=daemon._server.server_address[1]))
+    yield daemon
+    daemon.stop()
+
+
+def test_token_file_is_written_and_removed(daemon, token_file):
+    with open(token_file) as file:
+        assert file.read() == daemon.token
+    daemon.stop()
+    with pytest.raises(FileNotFoundError):
+        open(token_file)
+
+
+def test_wrong_token_is_refused(daemon, token_file, runner):
+    with open(token_file, 'w') as file:
+        file.write('not the token')
+    with pytest.raises(ConnectionError, match="Wrong token"):
+        Client.send([{'op': 'status'}])
+    assert Client.main(['status']) == 3
+    assert runner.commands == []
+
+
+def test_mount_requests_of_a_batch_share_one_listing(daemon, runner):
+    results = Client.send([{'op': 'mount', 'section': 'NAS', 'share': 'movies'},
+                           {'op': 'mount', 'section': 'NAS', 'share': 'Music'},
+                           {'op': 'status'}])
+    assert [result['ok'] for result in results] == [True, True, True]
+    assert [connection['letter'] for connection in results[2]['connections']] == ['M', 'N']
+
+    first_mount = next(i for i, command in enumerate(runner.commands) if '/user:' in command)
+    assert runner.commands[:first_mount] == ['net use']
+    assert sum('/user:' in command for command in runner.commands) == 2
+
+
+def test_unknown_section(daemon):
+    assert Client.send([{'op': 'mount', 'section': 'Nope'}]) == [
+        {'ok': False, 'msg': "No such section or share: Nope"}]
+
+
+def test_exit_codes(daemon, capsys):
+    assert Client.main(['mount', 'NAS']) == 0
+    assert Client.main(['unmount-letter', 'M:']) == 0
+    assert Client.main(['mount', 'Nope']) == 1
+    assert Client.main([]) == 2
+    assert Client.main(['dance']) == 2
+    daemon.stop()
+    assert Client.main(['status']) == 3
+
+
+def test_reply_without_results_is_a_failure(daemon, monkeypatch):
+    monkeypatch.setattr(daemon, 'handle_batch', lambda requests: [])
+    with pytest.raises(ValueError, match="Invalid reply"):
+        Client.send([{'op': 'status'}])
+    assert Client.main(['status']) == 1
+
+
+def test_failing_request_still_gets_a_reply(daemon, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError("cannot start net.exe")
+
+    monkeypatch.setattr(daemon.my_smb, 'plan_mounts', fail)
+    assert Client.send([{'op': 'mount', 'section': 'NAS'}]) == [
+        {'ok': False, 'msg': "Failed: cannot start net.exe"}]
+
+
+def test_parse_args():
+    assert Client.parse_args(['mount', 'NAS/Movies', 'Work']) == [
+        {'op': 'mount', 'section': 'NAS', 'share': 'Movies'}, {'op': 'mount', 'section': 'Work'}]
+    assert Client.parse_args(['unmount']) == [{'op': 'unmount'}]
+    assert Client.parse_args(['unmount-letter', 'M:']) == [{'op': 'unmount', 'letter': 'M'}]
+    with pytest.raises(ValueError):
+        Client.parse_args(['status', 'extra'])
@@ -0,0 +1,92 @@
+import socket
+
+import pytest
+
+from HostProber import HostProber
+
+HOST = '127.0.0.1'
+
+
+@pytest.fixture
+def closed_port():
+    """ A port nobody listens on - the connection is refused at once """
+    server = socket.socket()
+    server.bind((HOST, 0))
+    port = server.getsockname()[1]
+    server.close()
+    return port
+
+
+def test_listening_host_is_reachable(listening_port, clock):
+    prober = HostProber(port=listening_port, clock=clock)
+    assert prober.is_reachable(HOST)
+
+
+def test_closed_port_is_not_reachable(closed_port, clock):
+    prober = HostProber(port=closed_port, timeout=0.5, clock=clock)
+    assert not prober.is_reachable(HOST)
+
+
+def test_status_is_cached_for_ttl(listening_port, clock, monkeypatch):
+    prober = HostProber(port=listening_port, ttl=30, clock=clock)
+    probes = []
+    probe = prober.probe
+    monkeypatch.setattr(prober, 'probe', lambda host: probes.append(host) or probe(host))
+
+    assert prober.is_reachable(HOST)
+    clock.now += 30
+    assert prober.is_reachable(HOST)
+    assert probes == [HOST]
+
+    clock.now += 1
+    assert prober.is_reachable(HOST)
+    assert probes == [HOST, HOST]
+
+
+def test_down_ttl_doubles_with_every_failure(closed_port, clock):
+    prober = HostProber(port=closed_port, timeout=0.5, down_ttl=5, max_down_ttl=15, clock=clock)
+    ttls = []
+    for _ in range(4):
+        prober.probe(HOST)
+        ttls.append(prober._get_ttl(prober._statuses[HOST]))
+    assert ttls == [5, 10, 15, 15]
+
+
+def test_down_host_is_probed_again_after_backoff(closed_port, clock):
+    prober = HostProber(port=closed_port, timeout=0.5, down_ttl=5, clock=clock)
+    assert not prober.probe(HOST)
+    assert not prober.probe(HOST)
+    # Second failure in a row - 10 seconds
+    clock.now += 10
+    assert prober._get_cached(HOST) is not None
+    clock.now += 1
+    assert prober._get_cached(HOST) is None
+
+
+def test_success_resets_the_backoff(closed_port, clock):
+    prober = HostProber(port=closed_port, timeout=0.5, down_ttl=5, clock=clock)
+    prober.probe(HOST)
+    prober.probe(HOST)
+    assert prober._statuses[HOST].failures == 2
+
+    server = socket.socket()
+    server.bind((HOST, 0))
+    server.listen()
+    prober.port = server.getsockname()[1]
+    try:
+        assert prober.probe(HOST)
+    finally:
+        server.close()
+    assert prober._statuses[HOST].failures == 0
+
+
+def test_probe_all_probes_each_host_once(listening_port, clock):
+    prober = HostProber(port=listening_port, clock=clock)
+    assert prober.probe_all([HOST, HOST, 'localhost']) == {HOST: True, 'localhost': True}
+
+
+def test_invalidate_forgets_the_status(listening_port, clock):
+    prober = HostProber(port=listening_port, clock=clock)
+    prober.is_reachable(HOST)
+    prober.invalidate(HOST)
+    assert prober._get_cached(HOST) is None
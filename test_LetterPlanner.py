@@ -0,0 +1,50 @@
+from LetterPlanner import PlannedMount, get_highest_free_letter, plan_letters
+from MountState import RESERVED_LETTERS_BITMASK, letter_to_bit
+from NetUseParser import NetUseConnection
+
+TAKEN = RESERVED_LETTERS_BITMASK | letter_to_bit('C')
+
+
+def mount(share: str, letter: str | None = None, host: str = 'nas', username: str = 'user',
+          section: str = 'NAS') -> PlannedMount:
+    return PlannedMount(section, 0, host, share, username, letter)
+
+
+def test_highest_free_letter():
+    assert get_highest_free_letter(TAKEN) == 'Z'
+    assert get_highest_free_letter(TAKEN | letter_to_bit('Z') | letter_to_bit('Y')) == 'X'
+    assert get_highest_free_letter((1 << 26) - 1) is None
+    # A: and B: are never offered
+    assert get_highest_free_letter(((1 << 26) - 1) & ~0b11) is None
+
+
+def test_preferred_letters_first_then_the_last_free_ones():
+    plan = plan_letters([mount('Movies'), mount('Music', 'z'), mount('Photos')], TAKEN, [])
+    assert [m.letter for m in plan.mounts] == ['Y', 'Z', 'X']
+    assert plan.letters_bitmask == letter_to_bit('X') | letter_to_bit('Y') | letter_to_bit('Z')
+    assert plan.skipped == []
+
+
+def test_taken_preferred_letter_is_a_conflict():
+    plan = plan_letters([mount('Movies', 'C')], TAKEN, [])
+    assert plan.to_mount == []
+    assert plan.mounts[0].skip_reason == "preferred letter C is taken"
+
+
+def test_skip_reasons():
+    connections = [NetUseConnection('OK', 'M', 'NAS', 'Movies', '')]
+    mounts = [mount('movies'),
+              mount('Music'),
+              mount('music'),
+              mount('Backup', username='admin')]
+    plan = plan_letters(mounts, TAKEN, connections)
+    assert [m.skip_reason for m in plan.mounts] == [
+        "already mounted at M", None, "repeated in the batch", "nas is already used with user user"]
+    assert [m.share for m in plan.to_mount] == ['Music']
+
+
+def test_no_free_letter():
+    taken = ((1 << 26) - 1) & ~letter_to_bit('Z')
+    plan = plan_letters([mount('Movies'), mount('Music')], taken, [])
+    assert [m.letter for m in plan.mounts] == ['Z', None]
+    assert plan.mounts[1].skip_reason == "no free drive letter"
@@ -0,0 +1,81 @@
+import logging
+
+import pytest
+
+import Logger
+from Logger import ROOT_LOGGER_NAME, MyLogger, set_level, setup_logging, stop_logging
+
+
+def get_queue_handlers() -> list[logging.Handler]:
+    """ Without the handlers pytest adds to capture the logs """
+    return [handler for handler in logging.getLogger(ROOT_LOGGER_NAME).handlers
+            if isinstance(handler, Logger._LazyQueueHandler)]
+
+
+def reset_logging() -> None:
+    """ Stops the writer thread and removes the queue handler - the next setup_logging() starts from scratch """
+    listener = Logger._listener
+    stop_logging()
+    if listener is not None:
+        for handler in listener.handlers:
+            handler.close()
+    for handler in get_queue_handlers():
+        logging.getLogger(ROOT_LOGGER_NAME).removeHandler(handler)
+
+
+@pytest.fixture
+def log_folder(tmp_path):
+    reset_logging()
+    yield tmp_path
+    reset_logging()
+    # Back to what the other tests log to
+    setup_logging()
+
+
+def read_log(path) -> list[str]:
+    stop_logging()
+    return path.read_text().splitlines()
+
+
+def test_only_the_first_setup_counts(log_folder):
+    setup_logging(str(log_folder / 'first.log'))
+    setup_logging(str(log_folder / 'second.log'))
+    MyLogger("Test").info("Mounted %s at %s:", 'Movies', 'M')
+
+    assert len(get_queue_handlers()) == 1
+    assert not (log_folder / 'second.log').exists()
+    lines = read_log(log_folder / 'first.log')
+    assert len(lines) == 1
+    assert lines[0].endswith("[INFO]: [Test]: Mounted Movies at M:")
+
+
+def test_every_logger_writes_to_the_same_file(log_folder):
+    setup_logging(str(log_folder / 'app.log'))
+    MyLogger("SMB").warning("first")
+    MyLogger("Config").error("second")
+    assert [line.split(': ', 1)[1] for line in read_log(log_folder / 'app.log')] == [
+        "[SMB]: first", "[Config]: second"]
+
+
+def test_level_per_prefix(log_folder):
+    setup_logging(str(log_folder / 'app.log'))
+    quiet = MyLogger("Quiet")
+    loud = MyLogger("Loud")
+    set_level("Loud", logging.DEBUG)
+    quiet.debug("hidden")
+    loud.debug("shown")
+    set_level("Loud", logging.INFO)
+    assert [line.rsplit(': ', 1)[1] for line in read_log(log_folder / 'app.log')] == ["shown"]
+
+
+def test_rotation_by_size(log_folder):
+    setup_logging(str(log_folder / 'app.log'), max_bytes=500, backup_count=2)
+    logger = MyLogger("Rotation")
+    for i in range(100):
+        logger.info("line %s", i)
+    stop_logging()
+
+    assert sorted(path.name for path in log_folder.iterdir()) == ['app.log', 'app.log.1', 'app.log.2']
+    assert all(path.stat().st_size <= 500 for path in log_folder.iterdir())
+    # The newest lines are in app.log
+    assert (log_folder / 'app.log').read_text().splitlines()[-1].endswith("line 99")
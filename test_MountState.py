@@ -0,0 +1,60 @@
+from MountState import letter_to_bit
+
+
+def bitmask(letters: str) -> int:
+    result = 0
+    for letter in letters:
+        result |= letter_to_bit(letter)
+    return result
+
+
+def test_taken_letters_include_floppies_local_and_network_drives(runner, mount_state):
+    runner.run('net use Z: \\\\nas\\Movies')
+    assert mount_state.get_taken_letters_bitmask() == bitmask('ABCZ')
+    assert mount_state.find_mount('NAS', 'movies') == 'Z'
+
+
+def test_reserve_letters_claims_all_of_them(mount_state):
+    taken = mount_state.get_taken_letters_bitmask()
+    assert mount_state.reserve_letters(bitmask('XYZ'), taken)
+    assert mount_state.get_free_letters()[-1] == 'W'
+    assert not mount_state.reserve_letter('Y')
+
+
+def test_reserve_letters_fails_if_the_letters_changed(mount_state):
+    taken = mount_state.get_taken_letters_bitmask()
+    assert mount_state.reserve_letter('Z')
+    assert not mount_state.reserve_letters(bitmask('XY'), taken)
+    # None of them was claimed
+    assert mount_state.reserve_letter('X')
+    assert mount_state.reserve_letter('Y')
+
+
+def test_reservations_survive_a_refresh(mount_state):
+    assert mount_state.reserve_letters(bitmask('Z'), mount_state.get_taken_letters_bitmask())
+    mount_state.refresh()
+    assert mount_state.is_letter_used('Z')
+    mount_state.release_letter('Z')
+    assert not mount_state.is_letter_used('Z')
+
+
+def test_add_mount_releases_the_letter_and_records_the_section(runner, mount_state):
+    mount_state.refresh()
+    assert mount_state.reserve_letter('M')
+    runner.run('net use M: \\\\nas\\Movies')
+    mount_state.add_mount('M', 'nas', 'Movies', 'NAS')
+    assert mount_state.get_section_for_letter('m') == 'NAS'
+
+    # The letter now points to another share - the section doesn't own it anymore
+    runner.run('net use M: /del')
+    runner.run('net use M: \\\\nas\\Music')
+    mount_state.invalidate()
+    assert mount_state.get_section_for_letter('M') is None
+
+
+def test_connection_without_letter(mount_state):
+    mount_state.refresh()
+    mount_state.add_connection('nas', 'IPC$')
+    assert mount_state.find_mount('NAS', 'ipc$') == ' '
+    mount_state.remove_connection('NAS', 'IPC$')
+    assert mount_state.find_mount('nas', 'IPC$') is None
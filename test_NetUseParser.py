@@ -0,0 +1,97 @@
+import json
+import os
+import random
+
+import pytest
+
+from Benchmark import SAMPLES_FOLDER, get_sample_encoding
+from NetUseParser import NetUseConnection, parse_net_use
+
+with open(os.path.join(SAMPLES_FOLDER, "expected.json"), encoding='utf-8') as expected_file:
+    EXPECTED = json.load(expected_file)
+
+
+def read_sample(file_name: str) -> bytes:
+    with open(os.path.join(SAMPLES_FOLDER, file_name), 'rb') as file:
+        return file.read()
+
+
+def parse(data: bytes, encoding: str = 'utf-8') -> list[list[str]]:
+    return [list(connection.as_tuple()) for connection in parse_net_use(data.splitlines(keepends=True), encoding)]
+
+
+def test_every_sample_has_an_expected_result():
+    samples = {file_name for file_name in os.listdir(SAMPLES_FOLDER) if file_name.endswith('.txt')}
+    assert samples == set(EXPECTED)
+
+
+@pytest.mark.parametrize('file_name', sorted(EXPECTED))
+def test_sample(file_name):
+    assert parse(read_sample(file_name), get_sample_encoding(file_name)) == EXPECTED[file_name]
+
+
+@pytest.mark.parametrize('file_name', sorted(EXPECTED))
+def test_sample_with_unix_new_lines(file_name):
+    data = read_sample(file_name).replace(b'\r\n', b'\n')
+    assert parse(data, get_sample_encoding(file_name)) == EXPECTED[file_name]
+
+
+def test_parses_str_lines_too():
+    lines = read_sample('en_basic.txt').decode().splitlines(keepends=True)
+    assert [list(connection.as_tuple()) for connection in parse_net_use(lines)] == EXPECTED['en_basic.txt']
+
+
+def test_dead_statuses_of_other_locales():
+    connections = list(parse_net_use(read_sample('de_basic.cp850.txt').splitlines(keepends=True), 'cp850'))
+    assert {connection.letter: connection.is_dead for connection in connections if connection.letter} == \
+           {row[1]: row[0].lower() != 'ok' for row in EXPECTED['de_basic.cp850.txt'] if row[1]}
+
+
+def test_output_cut_before_the_rows():
+    lines = read_sample('en_basic.txt').splitlines(keepends=True)
+    header_end = next(i for i, line in enumerate(lines) if line.startswith(b'---')) + 1
+    for count in range(header_end + 1):
+        assert parse(b''.join(lines[:count])) == []
+
+
+def test_output_cut_after_a_row():
+    lines = read_sample('en_basic.txt').splitlines(keepends=True)
+    first_row = next(i for i, line in enumerate(lines) if line.startswith(b'---')) + 1
+    assert parse(b''.join(lines[:first_row + 1])) == EXPECTED['en_basic.txt'][:1]
+
+
+def test_output_cut_in_the_middle_of_a_row():
+    data = read_sample('en_basic.txt')
+    cut = data[:data.index(b'downloads') + len(b'down')]
+    assert parse(cut) == [['OK', 'Z', '192.168.1.6', 'down', '']]
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'\r\n\r\n',
+    b'\xff\xfe garbage\r\n---\r\n\x00\x01\x02\r\n',
+    b'System error 53 has occurred.\r\n\r\nThe network path was not found.\r\n',
+    b'-' * 79 + b'\r\nnot a row\r\n',
+])
+def test_garbage_has_no_connections(data):
+    assert parse(data) == []
+
+
+def test_mangled_samples_never_break_the_parser():
+    """ Cut, repeated and shuffled lines and random bytes - the output is wrong, but the parser must not raise """
+    randomizer = random.Random(0)
+    samples = [read_sample(file_name) for file_name in sorted(EXPECTED)]
+    for _ in range(500):
+        lines = randomizer.choice(samples).splitlines(keepends=True) or [b'']
+        for _ in range(randomizer.randint(1, 5)):
+            position = randomizer.randrange(len(lines))
+            mutation = randomizer.randrange(4)
+            if mutation == 0:
+                lines[position] = lines[position][:randomizer.randrange(len(lines[position]) + 1)]
+            elif mutation == 1:
+                lines.insert(position, lines[position])
+            elif mutation == 2:
+                lines.insert(position, bytes(randomizer.randrange(256) for _ in range(randomizer.randrange(40))))
+            else:
+                randomizer.shuffle(lines)
+        assert all(isinstance(connection, NetUseConnection) for connection in parse_net_use(lines))
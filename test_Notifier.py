@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from Notifier import NotificationAggregator
+
+
+@pytest.fixture
+def toasts():
+    return []
+
+
+@pytest.fixture
+def notifier(toasts, clock):
+    # The window timer never fires during a test - flush() is called by hand
+    aggregator = NotificationAggregator(toasts.append, window=60, min_interval=5, clock=clock)
+    yield aggregator
+    aggregator.close()
+
+
+def test_single_result_is_shown_as_it_is(notifier, toasts):
+    notifier.add('NAS', "Success: Drive letter M - mounted: \nThe command completed successfully.")
+    assert notifier.flush()
+    assert toasts == ["Success: Drive letter M - mounted: \nThe command completed successfully."]
+
+
+def test_results_are_coalesced_per_group(notifier, toasts):
+    for letter in 'MNO':
+        notifier.add('NAS', f"Success: Drive letter {letter} - mounted: \nThe command completed successfully.")
+    notifier.add('10.0.0.2', "Error while mounting letter Z: \nSystem error 53 has occurred.")
+    notifier.add('NAS', "\\\\10.0.0.1\\Movies - already mounted at P")
+
+    assert notifier.flush()
+    assert toasts == ["[NAS] 4/4 OK.\n[10.0.0.2] 0/1 OK. Error while mounting letter Z: System error 53 has occurred."]
+
+
+def test_remount_result_is_a_success(notifier, toasts):
+    notifier.add('remount', "Success. Config reloaded - [2] changed shares mounted again.")
+    notifier.add('Work-NAS', "All [2] drives mounted successfully.")
+
+    notifier.flush()
+    assert toasts == ["[remount] 1/1 OK.\n[Work-NAS] 1/1 OK."]
+
+
+def test_toasts_are_min_interval_apart(notifier, toasts, clock):
+    notifier.add('NAS', "first")
+    assert notifier.flush()
+
+    clock.now += 4
+    notifier.add('NAS', "second")
+    assert not notifier.flush()
+    assert toasts == ["first"]
+
+    clock.now += 1
+    assert notifier.flush()
+    assert toasts == ["first", "second"]
+
+
+def test_force_ignores_the_min_interval(notifier, toasts):
+    notifier.add('NAS', "first")
+    notifier.flush()
+    notifier.add('NAS', "second")
+    assert notifier.flush(force=True)
+    assert toasts == ["first", "second"]
+
+
+def test_nothing_pending_shows_nothing(notifier, toasts):
+    assert not notifier.flush()
+    assert toasts == []
+
+
+def test_long_summary_is_cut(toasts, clock):
+    notifier = NotificationAggregator(toasts.append, window=60, max_characters=50, clock=clock)
+    for i in range(10):
+        notifier.add(f"NAS-{i}", f"Error while mounting letter {i}:")
+    notifier.flush()
+    notifier.close()
+    assert len(toasts[0]) == 50
+    assert toasts[0].endswith("... (see the log)")
+
+
+def test_close_drops_pending_results(notifier, toasts):
+    notifier.add('NAS', "pending")
+    notifier.close()
+    assert not notifier.flush()
+    notifier.add('NAS', "after close")
+    assert toasts == []
+
+
+def test_window_timer_shows_one_toast():
+    toasts = []
+    notifier = NotificationAggregator(toasts.append, window=0.05, min_interval=0)
+    for i in range(5):
+        notifier.add('NAS', f"Success: Drive letter {chr(ord('M') + i)} - mounted:")
+    deadline = time.monotonic() + 2
+    while not toasts and time.monotonic() < deadline:
+        time.sleep(0.01)
+    notifier.close()
+    assert toasts == ["[NAS] 5/5 OK."]
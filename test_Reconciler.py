@@ -0,0 +1,108 @@
+import pytest
+
+from CircuitBreaker import CircuitBreaker
+from Config import Config
+from Reconciler import Reconciler
+from SMB import SMB
+
+CONFIG = """
+[NAS]
+ip = nas
+username = user
+password = secret
+shares = Movies, Music
+letters = M, N
+autoconnect = yes
+
+[Manual]
+ip = other
+username = user
+password = secret
+shares = Backup
+letters = B
+"""
+
+
+@pytest.fixture
+def smb(write_config, runner):
+    # The circuit would stop the retries of an offline host - the backoff is what's tested here
+    return SMB(Config(write_config(CONFIG), use_cache=False), runner=runner,
+               circuit_breaker=CircuitBreaker(failure_threshold=1000))
+
+
+@pytest.fixture
+def reconciler(smb, clock):
+    return Reconciler(smb, backoff=30, max_backoff=900, jitter=0, clock=clock)
+
+
+def get_mount_commands(runner) -> list[str]:
+    return [command.split(' /user:')[0] for command in runner.commands if '/user:' in command]
+
+
+def test_first_pass_mounts_the_autoconnect_sections_only(reconciler, runner):
+    assert reconciler.reconcile() == (0, 2)
+    assert sorted(get_mount_commands(runner)) == ['net use M: \\\\nas\\Movies', 'net use N: \\\\nas\\Music']
+    assert reconciler.reconcile() == (0, 0)
+
+
+def test_only_the_missing_share_is_mounted(reconciler, runner):
+    reconciler.reconcile()
+    runner.run('net use N: /del')
+    runner.commands.clear()
+
+    assert reconciler.reconcile() == (0, 1)
+    assert get_mount_commands(runner) == ['net use N: \\\\nas\\Music']
+
+
+def test_dead_connection_is_removed_and_mounted_again(reconciler, runner):
+    reconciler.reconcile()
+    runner.set_connection_status('M', 'Disconnected')
+    runner.commands.clear()
+
+    assert reconciler.reconcile() == (1, 1)
+    assert 'net use M: /del' in runner.commands
+    assert get_mount_commands(runner) == ['net use M: \\\\nas\\Movies']
+    assert {connection['letter']: connection['status'] for connection in runner.connections} == \
+           {'M': 'OK', 'N': 'OK'}
+
+
+def test_dead_connection_of_an_unreachable_host_is_kept(smb, reconciler, runner, monkeypatch):
+    reconciler.reconcile()
+    runner.set_connection_status('M', 'Unavailable')
+    monkeypatch.setattr(smb, 'is_host_reachable', lambda host: False)
+    runner.commands.clear()
+
+    reconciler.reconcile()
+    assert 'net use M: /del' not in runner.commands
+    assert [connection['letter'] for connection in runner.connections] == ['M', 'N']
+
+
+def test_backoff_doubles_up_to_the_maximum(reconciler, runner, clock):
+    runner.set_host_online('nas', False)
+    delays = []
+    for _ in range(8):
+        runner.commands.clear()
+        assert reconciler.reconcile() == (0, 0)
+        assert get_mount_commands(runner)
+        delays.append(reconciler._backoffs['nas'].retry_at - clock.now)
+
+        # Nothing is tried before the delay is over
+        runner.commands.clear()
+        clock.now += delays[-1] - 1
+        reconciler.reconcile()
+        assert get_mount_commands(runner) == []
+        clock.now += 1
+
+    assert delays == [30, 60, 120, 240, 480, 900, 900, 900]
+
+
+def test_host_that_is_back_is_not_backing_off(reconciler, runner, clock):
+    runner.set_host_online('nas', False)
+    reconciler.reconcile()
+    assert reconciler.is_backing_off('NAS')
+
+    runner.set_host_online('nas', True)
+    clock.now += 30
+    assert reconciler.reconcile() == (0, 2)
+    assert not reconciler.is_backing_off('nas')
+    assert 'nas' not in reconciler._backoffs
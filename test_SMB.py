@@ -0,0 +1,58 @@
+import pytest
+
+from Config import Config
+from MountState import letter_to_bit
+from SMB import SMB
+
+CONFIG = """
+[NAS]
+ip = nas
+username = user
+password = secret
+shares = Movies, Music
+letters = M, N
+"""
+
+
+@pytest.fixture
+def smb(write_config, runner):
+    return SMB(Config(write_config(CONFIG), use_cache=False), runner=runner)
+
+
+def test_mount_sections(smb, runner):
+    assert smb.mount_sections(['NAS']) == 'All [2] drives mounted successfully.'
+    assert {c['letter'] for c in runner.connections} == {'M', 'N'}
+
+
+def test_letter_is_released_when_the_command_raises(smb, monkeypatch):
+    def run(command: str):
+        raise OSError("cannot start net.exe")
+
+    plan = smb.plan_mounts(['NAS'])
+    monkeypatch.setattr(smb.runner, 'run', run)
+    results = smb.run_plan(plan)
+
+    assert [result.splitlines()[-1] for result in results] == ["cannot start net.exe"] * 2
+    assert not smb.mount_state._reserved_letters_bitmask & (letter_to_bit('M') | letter_to_bit('N'))
+
+
+def test_letters_are_released_when_the_section_was_removed(smb, write_config, runner):
+    plan = smb.plan_mounts(['NAS'])
+    write_config("[Other]\nip = other\n")
+    smb.my_conf.reload()
+
+    results = smb.run_plan(plan)
+    assert results == ["[NAS] is not in the config anymore - Movies not mounted.",
+                       "[NAS] is not in the config anymore - Music not mounted."]
+    assert smb.is_drive_letter_free('M') and smb.is_drive_letter_free('N')
+    assert runner.connections == []
+
+
+def test_skip_reason_names_the_other_section_preferring_the_letter(write_config, runner):
+    runner.add_host('other', shares=['Media'], credentials={'user': 'secret'})
+    smb = SMB(Config(write_config(CONFIG + "\n[Other]\nip = other\nusername = user\npassword = secret\n"
+                                           "shares = Media\nletters = M\n"), use_cache=False), runner=runner)
+    smb.mount_sections(['NAS'])
+
+    plan = smb.plan_mounts(['Other'])
+    assert [mount.skip_reason for mount in plan.skipped] == ["preferred letter M is taken - also preferred by [NAS]"]
@@ -0,0 +1,119 @@
+import pytest
+
+from FakeNetUse import FakeNetUseRunner
+from Sessions import SESSION_SHARE, SessionManager
+
+HOST = 'nas'
+SESSION = f'\\\\{HOST}\\{SESSION_SHARE}'
+
+
+@pytest.fixture(autouse=True)
+def nas(runner):
+    runner.add_host(HOST, shares=['Movies', 'Music'], credentials={'user': 'secret', 'admin': 'root'})
+
+
+@pytest.fixture
+def sessions(runner, mount_state):
+    return SessionManager(lambda command, operation, host: runner.run(command), mount_state)
+
+
+def get_session_commands(runner: FakeNetUseRunner) -> list[str]:
+    return [command for command in runner.commands if SESSION_SHARE in command]
+
+
+def mount(runner: FakeNetUseRunner, sessions: SessionManager, letter: str, share: str) -> None:
+    assert sessions.acquire(HOST, 'user', 'secret', letter) == b''
+    _, stderr = runner.run(f'net use {letter}: \\\\{HOST}\\{share}')
+    assert stderr == b''
+
+
+def test_without_a_session_the_share_needs_credentials(runner):
+    _, stderr = runner.run(f'net use M: \\\\{HOST}\\Movies')
+    assert b'1326' in stderr
+
+
+def test_one_session_for_all_the_shares_of_a_host(runner, sessions):
+    mount(runner, sessions, 'M', 'Movies')
+    mount(runner, sessions, 'N', 'Music')
+    assert get_session_commands(runner) == [f'net use {SESSION} /user:user secret']
+    assert sessions.get_references(HOST.upper()) == 2
+
+
+def test_session_is_disconnected_with_the_last_letter(runner, sessions, mount_state):
+    mount(runner, sessions, 'M', 'Movies')
+    mount(runner, sessions, 'N', 'Music')
+    mount_state.refresh()
+
+    sessions.release(HOST, 'M')
+    assert sessions.get_references(HOST) == 1
+    assert mount_state.find_mount(HOST, SESSION_SHARE) == ' '
+
+    sessions.release(HOST, 'n')
+    assert sessions.get_references(HOST) == 0
+    assert get_session_commands(runner)[-1] == f'net use {SESSION} /del'
+    # The snapshot is updated in place - no new listing
+    assert mount_state.find_mount(HOST, SESSION_SHARE) is None
+    assert not [c for c in runner.connections if c['share'] == SESSION_SHARE]
+
+
+def test_releasing_an_unknown_letter_does_nothing(runner, sessions):
+    mount(runner, sessions, 'M', 'Movies')
+    sessions.release(HOST, 'X')
+    sessions.release('other-nas', 'M')
+    assert sessions.get_references(HOST) == 1
+
+
+def test_wrong_password_leaves_no_session(runner, sessions):
+    stderr = sessions.acquire(HOST, 'user', 'wrong', 'M')
+    assert b'86' in stderr
+    assert sessions.get_references(HOST) == 0
+    assert sessions.acquire(HOST, 'user', 'secret', 'M') == b''
+
+
+def test_one_user_per_host(runner, sessions):
+    mount(runner, sessions, 'M', 'Movies')
+    stderr = sessions.acquire(HOST, 'admin', 'root', 'N')
+    assert b'already connected as user' in stderr
+    assert sessions.get_references(HOST) == 1
+
+
+def test_connected_session_is_adopted_and_left_connected(runner, sessions, mount_state):
+    runner.run(f'net use {SESSION} /user:user secret')
+    mount_state.refresh()
+
+    mount(runner, sessions, 'M', 'Movies')
+    sessions.release(HOST, 'M')
+    assert get_session_commands(runner) == [f'net use {SESSION} /user:user secret']
+    assert [c for c in runner.connections if c['share'] == SESSION_SHARE]
+
+
+def test_session_is_connected_again_after_teardown(runner, sessions, mount_state):
+    mount_state.refresh()
+    mount(runner, sessions, 'M', 'Movies')
+    sessions.release(HOST, 'M')
+    runner.run('net use M: /del')
+
+    # The snapshot knows the session is gone - it isn't adopted
+    mount(runner, sessions, 'M', 'Movies')
+    assert get_session_commands(runner).count(f'net use {SESSION} /user:user secret') == 2
+
+
+def test_failed_disconnect_invalidates_the_snapshot(runner, sessions, mount_state):
+    mount(runner, sessions, 'M', 'Movies')
+    mount_state.refresh()
+    # Someone else disconnected it meanwhile
+    runner.connections = [c for c in runner.connections if c['share'] != SESSION_SHARE]
+
+    sessions.release(HOST, 'M')
+    assert mount_state.is_stale()
+    assert mount_state.find_mount(HOST, SESSION_SHARE) is None
+
+
+def test_forget_all(runner, sessions, mount_state):
+    mount(runner, sessions, 'M', 'Movies')
+    # What SMB.unmount_every_connection_not_only_the_ones_in_conf() does
+    runner.run('net use * /del /y')
+    mount_state.invalidate()
+    sessions.forget_all()
+    assert sessions.get_references(HOST) == 0
+    mount(runner, sessions, 'M', 'Movies')
@@ -0,0 +1,82 @@
+import pytest
+
+from CommandRunner import IS_WINDOWS, is_timeout_message
+from ShellRunner import PersistentShellRunner, ShellWorker
+
+pytestmark = pytest.mark.skipif(IS_WINDOWS, reason="the commands are for /bin/sh")
+
+
+@pytest.fixture
+def worker():
+    worker = ShellWorker()
+    worker.start(5)
+    yield worker
+    worker.kill()
+
+
+@pytest.fixture
+def shell_runner():
+    runner = PersistentShellRunner(pool_size=1, timeout=1)
+    yield runner
+    runner.close()
+
+
+def test_output_is_framed_per_command(worker):
+    assert worker.execute('echo hello; echo oops >&2', 5) == (b'hello\n', b'oops\n', 0)
+    # Output without a new line at the end is not glued to the next command
+    assert worker.execute('printf partial', 5) == (b'partial', b'', 0)
+    assert worker.execute('echo next', 5) == (b'next\n', b'', 0)
+
+
+def test_exit_code(worker):
+    assert worker.execute('sh -c "exit 3"', 5)[2] == 3
+    assert worker.execute('true', 5)[2] == 0
+
+
+def test_commands_get_no_stdin(worker):
+    # A command that asks for input fails at once instead of waiting for the deadline
+    assert worker.execute('read answer', 5) == (b'', b'', 1)
+
+
+def test_one_shell_for_many_commands(shell_runner):
+    for i in range(5):
+        assert shell_runner.run(f'echo {i}') == (f'{i}\n'.encode(), b'')
+    assert shell_runner.spawn_count == 1
+    assert shell_runner.commands_count == 5
+
+
+def test_hung_command_is_killed_and_the_shell_replaced(shell_runner):
+    shell_runner.run('true')
+    first = shell_runner._workers.queue[0]
+
+    stdout, stderr = shell_runner.run('sleep 30')
+    assert stdout == b''
+    assert is_timeout_message(stderr)
+    assert first.process.poll() is not None
+
+    assert shell_runner.run('echo again') == (b'again\n', b'')
+    assert shell_runner.spawn_count == 2
+
+
+def test_dead_shell_is_replaced(shell_runner):
+    shell_runner.run('true')
+    shell_runner._workers.queue[0].kill()
+    assert shell_runner.run('echo again') == (b'again\n', b'')
+    assert shell_runner.spawn_count == 2
+
+
+def test_shell_that_starts_too_slowly_is_killed(shell_runner, monkeypatch):
+    started = []
+    start = ShellWorker.start
+
+    def slow_start(self: ShellWorker, timeout: float) -> None:
+        started.append(self)
+        raise TimeoutError("The command didn't finish in 1 seconds")
+
+    monkeypatch.setattr(ShellWorker, 'start', slow_start)
+    stdout, stderr = shell_runner.run('echo hello')
+    assert is_timeout_message(stderr)
+    assert started[0].process.poll() is not None
+
+    monkeypatch.setattr(ShellWorker, 'start', start)
+    assert shell_runner.run('echo hello') == (b'hello\n', b'')
@@ -0,0 +1,64 @@
+import pytest
+
+from Config import Config
+from SMB import SMB
+from StatusCache import StatusCache
+
+CONFIG = """
+[NAS]
+ip = nas
+username = user
+password = secret
+shares = Movies, Music
+letters = M, N
+"""
+
+
+@pytest.fixture
+def smb(write_config, runner):
+    return SMB(Config(write_config(CONFIG), use_cache=False), runner=runner)
+
+
+@pytest.fixture
+def changes():
+    return []
+
+
+@pytest.fixture
+def cache(smb, changes):
+    return StatusCache(smb, on_change=lambda: changes.append(True))
+
+
+def test_on_change_only_when_the_mounts_change(smb, cache, changes):
+    smb.mount_sections(['NAS'])
+    assert cache.refresh()
+    assert cache.get_letter('NAS', 'movies') == 'M'
+    assert len(changes) == 1
+
+    assert not cache.refresh()
+    assert not cache.refresh()
+    assert len(changes) == 1
+
+    smb.unmount_all_smb()
+    assert cache.refresh()
+    assert not cache.is_mounted('nas', 'Movies')
+    assert len(changes) == 2
+
+
+def test_dead_connections_count_as_unmounted(smb, runner, cache, changes):
+    smb.mount_sections(['NAS'])
+    cache.refresh()
+    runner.set_connection_status('M', 'Disconnected')
+    smb.mount_state.invalidate()
+
+    assert cache.refresh()
+    assert not cache.is_mounted('nas', 'Movies')
+    assert cache.get_letter('nas', 'Music') == 'N'
+    assert len(changes) == 2
+
+
+def test_refresh_reads_the_snapshot_without_net_use(smb, runner, cache):
+    smb.mount_sections(['NAS'])
+    commands = len(runner.commands)
+    cache.refresh()
+    assert len(runner.commands) == commands